@@ -0,0 +1,197 @@
+"""asyncio transport: every peer connection served by one event loop thread.
+
+Drop-in alternative to transport.ThreadTransport.  However many peers are
+connected, networking uses a single background thread; on_message is called
+on that thread, so GUI callers hand messages to Tk through their own pump.
+"""
+import asyncio
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+
+from protocol import MessageDecoder, ProtocolError
+from transport import (LOCAL_ADDRESS, LOCAL_SOCKETS, BaseConnection, ConnectionRegistry, claim_local_path, local_path,
+                       local_paths)
+
+READ_SIZE = 65536
+
+
+class AsyncPeerConnection(BaseConnection):
+    """One peer served by a reader and a writer coroutine."""
+
+    def __init__(self, transport, reader, writer, address, maxsize=1024):
+        super().__init__(address, maxsize)
+        self.transport = transport
+        self.loop = transport.loop
+        self.reader = reader
+        self.writer = writer
+        self.wakeup = asyncio.Event()
+        self.wakeup_scheduled = False
+
+    def start(self):
+        self.loop.create_task(self._read())
+        self.loop.create_task(self._write())
+
+    def _on_loop(self):
+        return threading.current_thread() is self.transport.thread
+
+    def send(self, message, block=True):
+        """Queue a message for this peer; safe to call from any thread."""
+        # Never wait for room on the loop thread: the writer that would make
+        # room runs there too.
+        if not self.queue.put(message, block=block and not self._on_loop()):
+            self.close()
+            return
+        if not self.wakeup_scheduled:
+            self.wakeup_scheduled = True
+            if self._on_loop():
+                self._wake()
+            else:
+                self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.wakeup_scheduled = False
+        self.wakeup.set()
+
+    async def _write(self):
+        with self.closing():
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                messages = self.queue.take()
+                if not messages:
+                    continue
+                data = b"".join(map(self.encoder.encode, messages))
+                self.writer.write(data)
+                await self.writer.drain()
+                self.messages_sent += len(messages)
+                self.bytes_sent += len(data)
+
+    async def _read(self):
+        decoder = MessageDecoder()
+        on_message = self.transport.on_message
+        with self.closing((OSError, ProtocolError)):
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                start = time.perf_counter()
+                messages = decoder.feed(data)
+                self.decode_time += time.perf_counter() - start
+                self.bytes_received += len(data)
+                self.messages_received += len(messages)
+                for message in messages:
+                    on_message(message, self)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.close()
+        if self._on_loop():
+            self._shutdown()
+        else:
+            self.loop.call_soon_threadsafe(self._shutdown)
+        self.transport._remove(self)
+
+    def _shutdown(self):
+        self.wakeup.set()
+        self.writer.close()
+
+
+class AsyncTransport:
+    """Accepts and opens peer connections on one background event loop.
+
+    on_message(message, connection) is called on the loop thread.
+    """
+
+    def __init__(self, on_message, on_accept=None, on_close=None, maxsize=1024, local=True):
+        self.on_message = on_message
+        self.on_accept = on_accept
+        self.on_close = on_close
+        self.maxsize = maxsize
+        self.local = local and LOCAL_SOCKETS
+        self.connections = ConnectionRegistry()
+        self.server = None
+        self.local_server = None
+        self.local_path = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def _run(self, coroutine):
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        except concurrent.futures.CancelledError:
+            raise ConnectionAbortedError("transport closed") from None
+
+    def listen(self, host, port):
+        """Bind and start accepting peers in the background."""
+        self.server = self._run(asyncio.start_server(self._serve, host, port, backlog=128))
+        path = local_path(host, self.server.sockets[0].getsockname()[1]) if self.local else None
+        if path is not None and claim_local_path(path):
+            self.local_server = self._run(asyncio.start_unix_server(self._serve, path, backlog=128))
+            self.local_path = path
+
+    async def _serve(self, reader, writer):
+        local = writer.get_extra_info("socket").family == socket.AF_UNIX
+        address = LOCAL_ADDRESS if local else writer.get_extra_info("peername")
+        connection = self._add(reader, writer, address, local=local)
+        if self.on_accept:
+            self.on_accept(connection)
+
+    def connect(self, host, port):
+        """Open a connection to a peer; raises OSError if it is unreachable."""
+        return self._run(self._open(host, port))
+
+    async def _open(self, host, port):
+        for path in local_paths(host, port) if self.local else ():
+            if path is None or not os.path.exists(path):
+                continue
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                return self._add(reader, writer, (host, port), dialed=True, local=True)
+            except OSError:
+                pass  # Stale; try the next, then TCP
+        reader, writer = await asyncio.open_connection(host, port)
+        return self._add(reader, writer, (host, port), dialed=True)
+
+    def _add(self, reader, writer, address, dialed=False, local=False):
+        connection = AsyncPeerConnection(self, reader, writer, address, self.maxsize)
+        connection.dialed = dialed
+        connection.local = local
+        self.connections.add(connection)
+        connection.start()
+        return connection
+
+    def _remove(self, connection):
+        self.connections.discard(connection)
+        if self.on_close:
+            self.on_close(connection)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        if threading.current_thread() is self.thread:
+            future.add_done_callback(lambda _: self.loop.stop())
+        else:
+            future.result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _shutdown(self):
+        if self.server is not None:
+            self.server.close()
+        if self.local_server is not None:
+            self.local_server.close()
+            try:
+                os.unlink(self.local_path)
+            except OSError:
+                pass
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
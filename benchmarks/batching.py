@@ -0,0 +1,83 @@
+"""Compare per-segment draw_event messages with batched polylines.
+
+Feeds a synthetic 1000 Hz drag through StrokeBatcher and counts the frames
+and bytes each peer link would carry per second of drawing.
+
+    python -m benchmarks.batching [--rate 1000] [--seconds 10]
+"""
+import argparse
+import math
+
+from protocol import encode_message
+from strokes import StrokeBatcher
+
+
+def drag_trace(rate, seconds, stroke_seconds=1.5):
+    """Yield (t, x, y, new_stroke) for a scribble of strokes lasting stroke_seconds each."""
+    for i in range(int(rate * seconds)):
+        t = i / rate
+        phase = t % stroke_seconds
+        x = 365 + 300 * math.sin(2.1 * t) * math.cos(0.7 * t)
+        y = 150 + 120 * math.sin(3.3 * t + 0.5)
+        yield t, int(x), int(y), i == 0 or phase < 1 / rate
+
+
+def unbatched(trace, user_name):
+    messages = total = 0
+    prev = None
+    for t, x, y, new_stroke in trace:
+        if not new_stroke:
+            event = {"prev_x": prev[0], "prev_y": prev[1], "x": x, "y": y, "user_name": user_name}
+            total += len(encode_message({"type": "draw_event", "data": event}))
+            messages += 1
+        prev = (x, y)
+    return messages, total
+
+
+def batched(trace, user_name, window, max_points):
+    now = [0.0]
+    sizes = []
+
+    def send(stroke, index, points):
+        batch = {"stroke": stroke, "index": index, "points": points, "user_name": user_name}
+        sizes.append(len(encode_message({"type": "draw_batch", "data": batch})))
+
+    batcher = StrokeBatcher(send, window, max_points, clock=lambda: now[0])
+    deadline = None
+    for t, x, y, new_stroke in trace:
+        now[0] = t
+        # Stand-in for the root.after timer the GUI schedules
+        if deadline is not None and t >= deadline:
+            batcher.flush()
+            deadline = None
+        if new_stroke:
+            batcher.begin(x, y)
+            deadline = None
+            continue
+        batcher.add(x, y)
+        if batcher.pending and deadline is None:
+            deadline = t + window
+    batcher.end()
+    return len(sizes), sum(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=1000, help="pointer events per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--max-points", type=int, default=64)
+    parser.add_argument("--user-name", default="alice")
+    args = parser.parse_args()
+
+    trace = list(drag_trace(args.rate, args.seconds))
+    base_messages, base_bytes = unbatched(trace, args.user_name)
+    print(f"{'mode':<18}{'msgs/s':>10}{'bytes/s':>12}{'msgs saved':>12}{'bytes saved':>13}")
+    print(f"{'per-segment':<18}{base_messages / args.seconds:>10.0f}{base_bytes / args.seconds:>12.0f}")
+    for window_ms in (8, 12, 16):
+        messages, total = batched(trace, args.user_name, window_ms / 1000, args.max_points)
+        print(f"{f'batched {window_ms} ms':<18}{messages / args.seconds:>10.0f}{total / args.seconds:>12.0f}"
+              f"{1 - messages / base_messages:>12.1%}{1 - total / base_bytes:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
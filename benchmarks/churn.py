@@ -0,0 +1,176 @@
+"""Soak test: thousands of peers connecting and disconnecting from one relay.
+
+A PeerEngine relay runs in its own process with the chosen transport,
+links managed as usual.  A few steady peers keep sending it cursor
+updates to fan out while this process connects and drops --cycles
+peers in turn: some say something and close, some close halfway through
+a frame, some reset the connection and some close without a word.  The
+relay's resident memory, thread count and registered connections are
+sampled every tenth of the way.  Once the churn is over and the steady
+peers have gone quiet, its CPU use is measured while idle, to catch a
+reader spinning on a closed socket.
+
+Exits non-zero if connections or threads are left behind, memory once
+the churn settles is more than --max-growth MB above what it was halfway
+through, or the idle relay uses more than 5% of a core.  Memory is not
+compared with the start: the allocator keeps what the most connections
+open at once needed, and the asyncio relay falls behind the churn now and
+then, so that high-water mark takes a while to reach.
+
+    python -m benchmarks.churn [--cycles 10000] [--transport threads|asyncio]
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.harness import free_port
+from engine import PeerEngine
+from protocol import encode_message
+
+STEADY_PEERS = 3
+CURSOR_RATE = 200  # Cursor updates a second from all the steady peers together
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, where /proc is missing
+
+
+def run_relay(kind, port):
+    """Child process: relay until stdin closes, printing a sample for each line read."""
+    peer = PeerEngine("127.0.0.1", port, transport=kind)
+    peer.start_server()
+    print("ready", flush=True)
+    for _ in sys.stdin:
+        print(json.dumps({"rss": rss_bytes(), "threads": threading.active_count(),
+                          "connections": len(peer.connections), "links": len(peer.links.links),
+                          "cpu": time.process_time()}), flush=True)
+    peer.close()
+
+
+def steady_peer(port, stop, rate):
+    """Send cursor updates at `rate` a second and read whatever comes back."""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.settimeout(0)
+    frame = encode_message({"type": "cursor", "data": {"x": 100, "y": 100}})
+    while not stop.wait(1 / rate):
+        sock.sendall(frame)
+        try:
+            while sock.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+    sock.close()
+
+
+def churn_once(port, cycle):
+    sock = socket.create_connection(("127.0.0.1", port))
+    kind = cycle % 4
+    if kind == 0:
+        sock.sendall(encode_message({"type": "ping"}))
+    elif kind == 1:
+        sock.sendall(encode_message({"type": "ping"})[:2])  # EOF in the middle of a frame
+    elif kind == 2:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))  # Reset, not FIN
+    sock.close()
+
+
+def run_case(args):
+    port = free_port()
+    relay = subprocess.Popen([sys.executable, "-m", "benchmarks.churn", "--relay", args.transport, str(port)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    relay.stdout.readline()
+
+    def sample():
+        relay.stdin.write("\n")
+        relay.stdin.flush()
+        return json.loads(relay.stdout.readline())
+
+    stop = threading.Event()
+    steady = [threading.Thread(target=steady_peer, args=(port, stop, CURSOR_RATE / STEADY_PEERS))
+              for _ in range(STEADY_PEERS)]
+    for thread in steady:
+        thread.start()
+    time.sleep(0.5)
+    samples = [dict(sample(), cycles=0)]
+    start = time.perf_counter()
+    step = max(1, args.cycles // 10)
+    for cycle in range(1, args.cycles + 1):
+        churn_once(port, cycle)
+        if cycle % step == 0:
+            samples.append(dict(sample(), cycles=cycle))
+    elapsed = time.perf_counter() - start
+
+    time.sleep(1)  # Let the last closes land
+    stop.set()
+    for thread in steady:
+        thread.join()
+    time.sleep(0.5)
+    settled = sample()
+    time.sleep(args.idle)
+    idle = sample()
+    relay.stdin.close()
+    relay.wait()
+    return {
+        "transport": args.transport,
+        "cycles": args.cycles,
+        "cycles_per_s": round(args.cycles / elapsed),
+        "samples": samples,
+        "rss_growth_mb": round((settled["rss"] - samples[len(samples) // 2]["rss"]) / 1e6, 2),
+        "most_connections": max(s["connections"] for s in samples),
+        "connections_left": settled["connections"],
+        "links_left": settled["links"],
+        "threads_before": samples[0]["threads"] - 2 * STEADY_PEERS * (args.transport == "threads"),
+        "threads_after": settled["threads"],
+        "idle_cpu": round((idle["cpu"] - settled["cpu"]) / args.idle, 4),
+    }
+
+
+def main():
+    if sys.argv[1:2] == ["--relay"]:
+        run_relay(sys.argv[2], int(sys.argv[3]))
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=10000, help="connect/disconnect cycles")
+    parser.add_argument("--transport", choices=("threads", "asyncio"), default="threads")
+    parser.add_argument("--idle", type=float, default=2.0, help="seconds to measure idle CPU over")
+    parser.add_argument("--max-growth", type=float, default=8.0, help="MB of RSS growth allowed")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    r = run_case(args)
+    failures = []
+    if r["connections_left"] or r["links_left"]:
+        failures.append(f"{r['connections_left']} connections and {r['links_left']} links left registered")
+    if r["threads_after"] > r["threads_before"]:
+        failures.append(f"{r['threads_after'] - r['threads_before']} threads left running")
+    if r["rss_growth_mb"] > args.max_growth:
+        failures.append(f"RSS grew {r['rss_growth_mb']} MB")
+    if r["idle_cpu"] > 0.05:
+        failures.append(f"idle relay uses {100 * r['idle_cpu']:.1f}% CPU")
+    if args.json:
+        print(json.dumps(r, indent=2))
+    else:
+        print(f"{r['transport']}: {r['cycles']} connect/disconnect cycles at {r['cycles_per_s']}/s")
+        for s in r["samples"]:
+            print(f"  after {s['cycles']:>6}  RSS {s['rss'] / 1e6:7.2f} MB  {s['threads']:>4} threads"
+                  f"  {s['connections']:>4} connections")
+        print(f"  settled: {r['connections_left']} churned connections left, {r['threads_after']} threads"
+              f" (before: {r['threads_before']}), RSS growth over the second half {r['rss_growth_mb']} MB,"
+              f" idle CPU {100 * r['idle_cpu']:.1f}%")
+        print("\n".join(failures) or "memory, threads and connections flat, no spinning")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Do boards converge when peers see the same ops in different orders?
+
+Three simulated authors draw, erase and clear from their own partial view
+of the board, as live peers do while ops are still in flight.  Each
+session's ops are then applied to fresh boards in shuffled orders, some
+with a third of the ops delivered twice, and the resulting strokes
+(points, start and stacking order) are compared.  A long erase-heavy
+session then shows how many tombstones a board keeps once the old ones
+are garbage collected.
+
+    python -m benchmarks.convergence [--sessions 300] [--orders 4]
+"""
+import argparse
+import json
+import random
+import time
+
+from board import Board
+
+AUTHORS = (1, 2, 3)
+
+
+def session_ops(seed, steps=60, size=200):
+    """Ops of one session, each made against its author's partial view."""
+    rng = random.Random(seed)
+    boards = {author: Board() for author in AUTHORS}
+    strokes = dict.fromkeys(AUTHORS, 0)
+    ops = []
+    for _ in range(steps):
+        author = rng.choice(AUTHORS)
+        board = boards[author]
+        kind = rng.random()
+        if kind < 0.6:
+            strokes[author] += 1
+            key, clock = (author, strokes[author]), board.tick()
+            index, last = 0, [rng.randrange(size), rng.randrange(size)]
+            for _ in range(rng.randint(1, 4)):
+                points = last + [rng.randrange(size) for _ in range(2 * rng.randint(1, 5))]
+                ops.append(("draw", key, index, points, clock))
+                board.add_points(key, index, points, clock)
+                index += len(points) // 2 - 1
+                last = points[-2:]
+        elif kind < 0.8:
+            entries, _ = board.erase_at(rng.randrange(size), rng.randrange(size), 30)
+            if entries:
+                ops.append(("erase", entries))
+        else:
+            cut = board.cut()
+            board.clear(cut)
+            ops.append(("clear", cut))
+        # Some ops reach some of the other authors before they act again
+        for _ in range(3 if ops else 0):
+            apply(rng.choice(list(boards.values())), rng.choice(ops))
+    return ops
+
+
+def apply(board, op):
+    if op[0] == "draw":
+        board.add_points(*op[1:])
+    elif op[0] == "erase":
+        board.erase(op[1])
+    else:
+        board.clear(op[1])
+
+
+def state(board):
+    return sorted((key, s.start, list(s.points), s.order) for key, s in board.scene.strokes.items())
+
+
+def convergence(sessions, orders):
+    divergent, applied, elapsed = 0, 0, 0.0
+    for seed in range(sessions):
+        ops = session_ops(seed)
+        states = []
+        for order in range(orders):
+            shuffled = ops[:]
+            random.Random(seed * orders + order).shuffle(shuffled)
+            if order % 2:
+                shuffled += shuffled[:len(shuffled) // 3]
+            board = Board()
+            start = time.perf_counter()
+            for op in shuffled:
+                apply(board, op)
+            elapsed += time.perf_counter() - start
+            applied += len(shuffled)
+            states.append(state(board))
+        divergent += any(s != states[0] for s in states)
+    return divergent, applied / elapsed
+
+
+def tombstone_growth(strokes, size=1000):
+    """Tombstones kept while one author draws and erases `strokes` strokes."""
+    rng = random.Random(0)
+    board = Board()
+    kept = []
+    for number in range(strokes):
+        x, y = rng.randrange(size), rng.randrange(size)
+        board.add_points((1, number), 0, [x, y, x + 5, y + 5], board.tick())
+        board.erase_at(x, y, 4)
+        if (number + 1) % (strokes // 4) == 0:
+            kept.append(len(board.dead))
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--orders", type=int, default=4, help="delivery orders tried per session")
+    parser.add_argument("--erased", type=int, default=20000, help="strokes drawn and erased in the long session")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    divergent, rate = convergence(args.sessions, args.orders)
+    kept = tombstone_growth(args.erased)
+    results = {
+        "sessions": args.sessions,
+        "orders": args.orders,
+        "divergent_sessions": divergent,
+        "ops_per_s": round(rate),
+        "erased_strokes": args.erased,
+        "tombstones_kept": kept,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{divergent} of {args.sessions} sessions diverged over {args.orders} delivery orders"
+          f" ({results['ops_per_s']} ops/s applied)")
+    print(f"tombstones kept after each quarter of {args.erased} erased strokes: {kept}")
+
+
+if __name__ == "__main__":
+    main()
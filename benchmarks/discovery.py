@@ -0,0 +1,118 @@
+"""LAN discovery, link dedupe, dead-peer detection and reconnects on loopback.
+
+Starts --peers headless peers with discover() and managed links, all at
+once, and times how long until every peer has said hello to every other
+one, counting the dials made and the duplicate links closed.  Then one
+peer crashes and comes back on its port after --down seconds, and the
+mesh has to redial it; and one peer hangs (stays connected but goes
+silent) and the others' heartbeats have to notice.  Announces go to a free
+port, not the default one, so live peers on the LAN are left alone.
+
+    python -m benchmarks.discovery [--peers 5 10 20] [--heartbeat 0.25] [--dead-after 1.0]
+"""
+import argparse
+import json
+import socket
+import time
+
+from benchmarks.harness import HeadlessPeer
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def start_peer(args, group_port, port=None):
+    peer = HeadlessPeer(port, keep_board=False, manage_links=True)
+    peer.links.interval, peer.links.dead_after = args.heartbeat, args.dead_after
+    peer.discover(port=group_port, interval=args.announce)
+    return peer
+
+
+def meshed(peers):
+    """True once every peer keeps one link to each of the others."""
+    origins = {peer.ids.origin for peer in peers}
+    return all(set(peer.links.peers) == origins - {peer.ids.origin} for peer in peers)
+
+
+def wait_for(check, timeout):
+    start = time.perf_counter()
+    while not check():
+        if time.perf_counter() - start > timeout:
+            return None
+        time.sleep(0.01)
+    return round(time.perf_counter() - start, 3)
+
+
+def counter(peers, name):
+    return sum(peer.metrics.counters[name] for peer in peers)
+
+
+def hang(peer):
+    """Keep the sockets open but stop talking: no pings, no relaying."""
+    peer.links.stop()
+    peer.discovery.stop()
+    peer.process_message = lambda message, sender_connection: None
+
+
+def run_case(count, args):
+    group_port = free_udp_port()
+    peers = [start_peer(args, group_port) for _ in range(count)]
+    result = {"peers": count, "mesh_s": wait_for(lambda: meshed(peers), args.timeout),
+              "dials": counter(peers, "links.dial"), "duplicates_closed": counter(peers, "links.duplicate"),
+              "links": sum(len(peer.connections) for peer in peers) // 2}
+
+    # A crashed peer coming back on the same port
+    crashed, others = peers[0], peers[1:]
+    port = crashed.port
+    crashed.close()
+    time.sleep(args.down)
+    restarted = start_peer(args, group_port, port)
+    peers = others + [restarted]
+    result["rejoin_s"] = wait_for(lambda: meshed(peers), args.timeout)
+    result["redials"] = counter(others, "links.redial")
+    result["failed_dials"] = counter(others, "links.failed")
+
+    # A hung peer: only heartbeats can tell
+    hung, others = peers[0], peers[1:]
+    hang(hung)
+    dropped = set()
+
+    def all_dropped():
+        dropped.update(i for i, peer in enumerate(others) if hung.ids.origin not in peer.links.peers)
+        return len(dropped) == len(others)
+    result["dead_detect_s"] = wait_for(all_dropped, args.timeout)
+    result["dead_closed"] = counter(others, "links.dead")
+    for peer in peers:
+        peer.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--announce", type=float, default=0.5, help="seconds between announces")
+    parser.add_argument("--heartbeat", type=float, default=0.25, help="seconds between heartbeats")
+    parser.add_argument("--dead-after", type=float, default=1.0, help="seconds of silence before a link is closed")
+    parser.add_argument("--down", type=float, default=2.0, help="seconds the crashed peer stays down")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.peers:
+        results.append(run_case(count, args))
+        if not args.json:
+            r = results[-1]
+            print(f"{r['peers']:>3} peers  full mesh in {r['mesh_s']} s ({r['links']} links, {r['dials']} dials,"
+                  f" {r['duplicates_closed']} duplicates closed)  crashed peer back in {r['rejoin_s']} s"
+                  f" after {args.down} s down ({r['redials']} redials, {r['failed_dials']} failed)"
+                  f"  hung peer dropped in {r['dead_detect_s']} s ({r['dead_closed']} links)", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Headless peers for the benchmarks, on the same PeerEngine as the GUI peers.
+
+HeadlessPeer is a PeerEngine (engine.py) with no window that listens on a
+free loopback port and records when each draw batch was first applied.
+With keep_board=False it only relays and records, like a relay that has
+no board: the overlay benchmarks run every peer in one process, where the
+board work of all of them would share one GIL and swamp what they measure.
+Links are not managed unless asked for (links.py): the benchmarks build
+their topologies by hand and count every frame.
+"""
+import collections
+import socket
+import threading
+import time
+
+from engine import PeerEngine
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class HeadlessPeer(PeerEngine):
+    def __init__(self, port=None, transport="asyncio", overlay="mesh", keep_board=True, manage_links=False,
+                 **overlay_options):
+        super().__init__("127.0.0.1", port or free_port(), transport=transport, overlay=overlay,
+                         manage_links=manage_links, **overlay_options)
+        self.keep_board = keep_board
+        self.drawn = collections.Counter()
+        self.received_at = {}
+        self.lock = threading.Lock()
+        self.start_server()
+
+    def join(self, peer):
+        """Connect to another HeadlessPeer, without fetching its board."""
+        return self.connect_to_peer(peer.host, peer.port, sync=False)
+
+    def apply_op(self, message):
+        if self.keep_board:
+            super().apply_op(message)
+        else:
+            self.applied(message)
+
+    def applied(self, message):
+        if message["type"] == "draw_batch":
+            with self.lock:
+                self.drawn[message["id"]] += 1
+                self.received_at.setdefault(message["id"], time.perf_counter())
+
+    def frames_sent(self):
+        return sum(connection.messages_sent for connection in list(self.connections))
+
+    def bytes_sent(self):
+        return sum(connection.bytes_sent for connection in list(self.connections))
@@ -0,0 +1,148 @@
+"""Join time and bytes transferred when a peer joins a board already drawn on.
+
+A sender peer holds a board of N segments, 90% of it compacted into the
+snapshot and the rest still in the op log tail.  A joiner connects, sends
+sync_request and loads everything into its own Board.  Meanwhile a third
+peer keeps drawing through the sender at 100 batches/s; how long those
+take to reach a fourth, already joined peer shows whether streaming the
+board holds up the sender's relay traffic.
+
+    python -m benchmarks.join_sync [--segments 10000 100000 1000000] [--transport asyncio]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from board import Board
+from sync import BoardLog, load_strokes, send_board
+from benchmarks.harness import free_port
+from transport import create_transport
+
+STROKE_SEGMENTS = 100
+BATCH_POINTS = 64
+
+
+def random_stroke(stroke_segments):
+    x, y = random.randrange(1920), random.randrange(1080)
+    points = [x, y]
+    for _ in range(stroke_segments):
+        x = min(1919, max(0, x + random.randint(-6, 6)))
+        y = min(1079, max(0, y + random.randint(-6, 6)))
+        points += (x, y)
+    return points
+
+
+def build_board(segments):
+    """A board and log: 90% of the strokes in the snapshot, the rest as logged batches."""
+    board = Board()
+    log = BoardLog(compact_every=1 << 30)
+    strokes = segments // STROKE_SEGMENTS
+    compacted = int(0.9 * strokes)
+    for number in range(strokes):
+        points = random_stroke(STROKE_SEGMENTS)
+        if number == compacted:
+            log.compact(board)
+        clock = board.tick()
+        if number < compacted:
+            board.add_points((1, number), 0, points, clock)
+            continue
+        for index in range(0, STROKE_SEGMENTS, BATCH_POINTS - 1):
+            batch = points[2 * index:2 * (index + BATCH_POINTS)]
+            message = {"type": "draw_batch", "id": (1, number * 1000 + index),
+                       "data": {"stroke": number, "index": index, "points": batch, "clock": clock}}
+            board.add_points((1, number), index, batch, clock)
+            log.append(message, board)
+    return board, log
+
+
+def run_case(segments, kind):
+    random.seed(segments)
+    board, log = build_board(segments)
+    joined = threading.Event()
+    sent_at, latencies, streams = {}, [], []
+    joined_board = Board()
+
+    def sender_message(message, connection):
+        if message["type"] == "sync_request":
+            streams.append(connection)
+            threading.Thread(target=send_board, args=(connection, log.messages()), daemon=True).start()
+            return
+        for other in list(sender.connections):
+            if other is not connection:
+                other.send(message)
+
+    def joiner_message(message, connection):
+        if message["type"] == "sync_strokes":
+            load_strokes(joined_board, message["strokes"])
+        elif message["type"] == "sync_done":
+            joined.set()
+        elif message.get("sync"):
+            batch = message["data"]
+            joined_board.add_points((message["id"][0], batch["stroke"]), batch["index"], batch["points"], batch["clock"])
+
+    def bystander_message(message, connection):
+        if message["type"] == "draw_batch" and not joined.is_set():
+            latencies.append(time.perf_counter() - sent_at[message["data"]["stroke"]])
+
+    port = free_port()
+    sender = create_transport(kind, sender_message)
+    sender.listen("127.0.0.1", port)
+    joiner = create_transport(kind, joiner_message)
+    prober = create_transport(kind, lambda message, connection: None)
+    probe = prober.connect("127.0.0.1", port)
+    bystander = create_transport(kind, bystander_message)
+    bystander.connect("127.0.0.1", port)
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    connection = joiner.connect("127.0.0.1", port)
+    connection.send({"type": "sync_request"})
+    stroke = 0
+    while not joined.wait(0.01):
+        stroke += 1
+        sent_at[stroke] = time.perf_counter()
+        probe.send({"type": "draw_batch", "data": {"stroke": stroke, "index": 0, "points": random_stroke(31)}})
+    join_time = time.perf_counter() - start
+    time.sleep(0.2)
+    sent = streams[0].bytes_sent
+    for transport in (bystander, prober, joiner, sender):
+        transport.close()
+
+    latencies.sort()
+    return {
+        "segments": board.scene.segment_count,
+        "transport": kind,
+        "join_s": round(join_time, 3),
+        "bytes": sent,
+        "bytes_per_segment": round(sent / board.scene.segment_count, 2),
+        "loaded_segments": joined_board.scene.segment_count,
+        "live_batches": len(latencies),
+        "live_p50_ms": round(1000 * latencies[len(latencies) // 2], 2) if latencies else None,
+        "live_max_ms": round(1000 * latencies[-1], 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--transport", default="asyncio", choices=["threads", "asyncio"])
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for segments in args.segments:
+        results.append(run_case(segments, args.transport))
+        if not args.json:
+            r = results[-1]
+            print(f"{r['segments']:>8} segments  join {r['join_s']:>7} s  {r['bytes'] / 1e6:8.2f} MB"
+                  f" ({r['bytes_per_segment']} B/segment)  loaded {r['loaded_segments']}"
+                  f"  relayed during join: {r['live_batches']} batches, p50 {r['live_p50_ms']} ms,"
+                  f" max {r['live_max_ms']} ms", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
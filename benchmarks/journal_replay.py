@@ -0,0 +1,122 @@
+"""Journal size and reopen time for boards of 100k and 1M segments.
+
+A headless peer journals a session of strokes from a few authors (draw
+batches of 64 points, some erases) and checkpoints every 4096 ops as it
+normally would.  Then the board is reopened from the file, and compared
+with reopening a journal of the same ops that was never checkpointed.
+Also times reading the journal as a late joiner's sync stream and
+exporting it as SVG.
+
+    python -m benchmarks.journal_replay [--segments 100000 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from engine import PeerEngine
+from journal import export_svg
+
+STROKE_SEGMENTS = 100
+BATCH_POINTS = 64
+
+
+def session(segments, seed=1):
+    """Yield the draw_batch and erase ops of a session of about `segments` segments."""
+    rng = random.Random(seed)
+    sequence = 0
+    for number in range(segments // STROKE_SEGMENTS):
+        origin = 1 + number % 3
+        x, y = rng.randrange(1920), rng.randrange(1080)
+        points = [x, y]
+        for _ in range(STROKE_SEGMENTS):
+            x = min(1919, max(0, x + rng.randint(-6, 6)))
+            y = min(1079, max(0, y + rng.randint(-6, 6)))
+            points += (x, y)
+        for index in range(0, STROKE_SEGMENTS, BATCH_POINTS - 1):
+            sequence += 1
+            batch = {"stroke": number, "index": index, "points": points[2 * index:2 * (index + BATCH_POINTS)],
+                     "clock": number, "width": 2, "color": "black", "user_name": f"user{origin}"}
+            yield {"type": "draw_batch", "id": (origin, sequence), "data": batch}
+        if number % 50 == 49:
+            sequence += 1
+            yield {"type": "erase", "id": (origin, sequence), "strokes": [[1 + (number - 7) % 3, number - 7, 40]]}
+
+
+def write_journal(path, segments, compact_every):
+    peer = PeerEngine("127.0.0.1", 0)
+    peer.open_journal(path)
+    peer.board_log.compact_every = compact_every
+    start = time.perf_counter()
+    for message in session(segments):
+        peer.apply_op(message)
+    peer.close()  # Waits for the last checkpoint
+    return time.perf_counter() - start, peer.scene.segment_count
+
+
+def reopen(path):
+    peer = PeerEngine("127.0.0.1", 0)
+    start = time.perf_counter()
+    peer.open_journal(path, compact=False)
+    elapsed = time.perf_counter() - start
+    return peer, elapsed
+
+
+def run_case(segments, directory):
+    path = os.path.join(directory, f"board-{segments}.journal")
+    raw_path = os.path.join(directory, f"board-{segments}-ops.journal")
+    write_time, live_segments = write_journal(path, segments, 4096)
+    write_journal(raw_path, segments, 1 << 30)
+
+    peer, replay_time = reopen(path)
+    ops_peer, ops_replay_time = reopen(raw_path)
+    if peer.scene.segment_count != live_segments or ops_peer.scene.segment_count != live_segments:
+        raise AssertionError(f"replayed {peer.scene.segment_count} / {ops_peer.scene.segment_count} "
+                             f"of {live_segments} segments")
+
+    start = time.perf_counter()
+    sync_messages = sum(1 for _ in peer.board_log.messages())
+    sync_time = time.perf_counter() - start
+    start = time.perf_counter()
+    export_svg(peer.board, os.path.join(directory, "board.svg"))
+    export_time = time.perf_counter() - start
+    peer.close()
+    ops_peer.close()
+    return {
+        "segments": live_segments,
+        "journal_bytes": os.path.getsize(path),
+        "bytes_per_segment": round(os.path.getsize(path) / live_segments, 2),
+        "write_s": round(write_time, 2),
+        "replay_s": round(replay_time, 3),
+        "ops_only_bytes": os.path.getsize(raw_path),
+        "ops_only_replay_s": round(ops_replay_time, 3),
+        "sync_messages": sync_messages,
+        "sync_read_s": round(sync_time, 3),
+        "svg_export_s": round(export_time, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for segments in args.segments:
+            results.append(run_case(segments, directory))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['segments']:>8} segments  journal {r['journal_bytes'] / 1e6:.2f} MB"
+                      f" ({r['bytes_per_segment']} B/segment)  reopen {r['replay_s']} s"
+                      f"  (ops only: {r['ops_only_bytes'] / 1e6:.2f} MB, {r['ops_only_replay_s']} s)"
+                      f"  sync read {r['sync_read_s']} s  SVG {r['svg_export_s']} s", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
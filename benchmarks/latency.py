@@ -0,0 +1,248 @@
+"""End-to-end stroke latency and traffic for N peers in a chain, star or full mesh.
+
+Every peer is a headless PeerEngine in its own process, on the same
+process_message / relay_message path the three Tk scripts run, so CPU
+time is measured per peer.  Peer i connects to peer i-1 (chain), to peer
+0 (star) or to every earlier peer (mesh, what peer_list gossip builds).
+The last --drawers peers draw: the far end of the chain, leaves of the
+star.  They either drag random strokes through the engine's stroke batcher
+at --rate points a second, or replay the draw ops of a node.py --record
+file.  Reports how long a batch takes from its broadcast to being applied
+at every other peer, messages and bytes sent a second, CPU per peer, and
+batches dropped, applied twice or dropped as duplicates on arrival.
+
+    python -m benchmarks.latency [--peers 10] [--topologies chain star mesh] [--drawers 2]
+                                 [--rate 120] [--seconds 5] [--trace FILE] [--transport threads] [--local]
+"""
+import argparse
+import collections
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.harness import free_port
+from engine import PeerEngine
+from recording import read_recording
+
+DRAW_OPS = ("draw_batch", "draw_event")
+
+
+class LoadPeer(PeerEngine):
+    """Times when each draw op of ours was sent and when each of a peer's was applied."""
+
+    def __init__(self, port, transport, local=False):
+        super().__init__("127.0.0.1", port, transport=transport, manage_links=False,  # Keep the chain a chain
+                         local=local)
+        self.sent = {}
+        self.received = {}
+        self.drawn = collections.Counter()
+        self.arrivals = 0
+        self.lock = threading.Lock()
+
+    def process_message(self, message, sender_connection):
+        if message["type"] in DRAW_OPS:
+            with self.lock:
+                self.arrivals += 1
+        super().process_message(message, sender_connection)
+
+    def broadcast(self, message):
+        sent_at = time.monotonic()
+        super().broadcast(message)
+        if message["type"] in DRAW_OPS:
+            self.sent[message["id"]] = sent_at
+        return message
+
+    def applied(self, message):
+        if message["type"] in DRAW_OPS:
+            with self.lock:
+                self.drawn[message["id"]] += 1
+                self.received.setdefault(message["id"], time.monotonic())
+
+    def traffic(self):
+        connections = list(self.connections)
+        return (sum(connection.messages_sent for connection in connections),
+                sum(connection.bytes_sent for connection in connections))
+
+
+def drag(peer, rate, seconds, stroke_points):
+    """Random-walk strokes of `stroke_points` points, one point every 1/rate s."""
+    rng = random.Random(peer.port)
+    end = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while next_at < end:
+        x, y = rng.randrange(1920), rng.randrange(1080)
+        peer.begin_stroke(x, y)
+        for _ in range(stroke_points):
+            x = min(1919, max(0, x + rng.randint(-6, 6)))
+            y = min(1079, max(0, y + rng.randint(-6, 6)))
+            peer.add_point(x, y)
+            next_at += 1 / rate
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if next_at >= end:
+                break
+        peer.end_stroke()
+
+
+def replay(peer, path, seconds, speed):
+    """Re-send the recorded draw ops as our own, at their recorded pace."""
+    strokes = {}
+    start = time.monotonic()
+    for at, message in read_recording(path):
+        if message["type"] not in DRAW_OPS:
+            continue
+        if at / speed >= seconds:
+            break
+        delay = start + at / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        author = message.pop("id", (0, 0))[0]
+        message.pop("sync", None)
+        if "stroke" in message["data"]:
+            # Stroke numbers are only unique per author; we are the author now
+            key = (author, message["data"]["stroke"])
+            message["data"]["stroke"] = strokes.setdefault(key, len(strokes) + 1)
+        peer.broadcast(message)
+
+
+def run_peer(config):
+    """Child process: join, draw when told to go, report when told to stop."""
+    peer = LoadPeer(config["port"], config["transport"], config["local"])
+    peer.start_server()
+    for port in config["connect"]:
+        peer.connect_to_peer("127.0.0.1", port, sync=False)
+    print("ready", flush=True)
+    sys.stdin.readline()
+    cpu_start = time.process_time()
+    messages_start, bytes_start = peer.traffic()
+    if config["draw"]:
+        if config["trace"]:
+            replay(peer, config["trace"], config["seconds"], config["speed"])
+        else:
+            drag(peer, config["rate"], config["seconds"], config["stroke_points"])
+    sys.stdin.readline()
+    messages, sent_bytes = peer.traffic()
+    with peer.lock:
+        report = {
+            "cpu": time.process_time() - cpu_start,
+            "messages_sent": messages - messages_start,
+            "bytes_sent": sent_bytes - bytes_start,
+            "arrivals": peer.arrivals,
+            "applied_twice": sum(count > 1 for count in peer.drawn.values()),
+            "threads": threading.active_count(),
+            "sent": [[*message_id, at] for message_id, at in peer.sent.items()],
+            "received": [[*message_id, at] for message_id, at in peer.received.items()],
+        }
+    print(json.dumps(report), flush=True)
+    peer.close()
+
+
+def links(topology, i):
+    if i == 0:
+        return []
+    return {"chain": [i - 1], "star": [0], "mesh": list(range(i))}[topology]
+
+
+def percentile(values, fraction):
+    return round(1000 * values[min(len(values) - 1, int(len(values) * fraction))], 2) if values else None
+
+
+def run_case(topology, args):
+    ports = [free_port() for _ in range(args.peers)]
+    children = []
+    for i, port in enumerate(ports):
+        config = {"port": port, "transport": args.transport, "local": args.local,
+                  "connect": [ports[j] for j in links(topology, i)],
+                  "draw": i >= args.peers - args.drawers, "rate": args.rate, "seconds": args.seconds,
+                  "stroke_points": args.stroke_points, "trace": args.trace, "speed": args.speed}
+        child = subprocess.Popen([sys.executable, "-m", "benchmarks.latency", "--peer", json.dumps(config)],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        child.stdout.readline()
+        children.append(child)
+    time.sleep(0.5)
+    for child in children:
+        child.stdin.write("go\n")
+        child.stdin.flush()
+    time.sleep(args.seconds + args.drain)
+    for child in children:
+        child.stdin.write("stop\n")
+        child.stdin.flush()
+    reports = [json.loads(child.stdout.readline()) for child in children]
+    for child in children:
+        child.wait()
+
+    sent = {(origin, number): at for report in reports for origin, number, at in report["sent"]}
+    latencies = sorted(
+        at - sent[origin, number]
+        for report in reports
+        for origin, number, at in report["received"]
+        if (origin, number) in sent
+    )
+    expected = len(sent) * (args.peers - 1)
+    duration = args.seconds + args.drain
+    messages = sum(report["messages_sent"] for report in reports)
+    sent_bytes = sum(report["bytes_sent"] for report in reports)
+    cpu = [report["cpu"] for report in reports]
+    return {
+        "topology": topology,
+        "peers": args.peers,
+        "transport": args.transport,
+        "local": args.local,
+        "drawers": args.drawers,
+        "ops_sent": len(sent),
+        "latency_p50_ms": percentile(latencies, 0.5),
+        "latency_p99_ms": percentile(latencies, 0.99),
+        "latency_max_ms": percentile(latencies, 1.0),
+        "messages_per_s": round(messages / duration),
+        "bytes_per_s": round(sent_bytes / duration),
+        "cpu_per_peer_s": [round(seconds, 3) for seconds in cpu],
+        "cpu_mean_pct": round(100 * sum(cpu) / len(cpu) / duration, 1),
+        "cpu_max_pct": round(100 * max(cpu) / duration, 1),
+        "dropped": expected - len(latencies),
+        "applied_twice": sum(report["applied_twice"] for report in reports),
+        "duplicate_arrivals": sum(report["arrivals"] for report in reports) - len(latencies),
+        "threads_per_peer": max(report["threads"] for report in reports),
+    }
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--peer":
+        run_peer(json.loads(sys.argv[2]))
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10)
+    parser.add_argument("--topologies", nargs="+", default=["chain", "star", "mesh"], choices=["chain", "star", "mesh"])
+    parser.add_argument("--drawers", type=int, default=2)
+    parser.add_argument("--rate", type=int, default=120, help="pointer motions per second per drawer")
+    parser.add_argument("--stroke-points", type=int, default=200, help="points per synthetic stroke")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--drain", type=float, default=2, help="seconds allowed for the last ops to arrive")
+    parser.add_argument("--trace", metavar="FILE", help="replay the draw ops of a node.py --record file instead")
+    parser.add_argument("--speed", type=float, default=1, help="replay the trace this many times faster")
+    parser.add_argument("--transport", default="threads", choices=["threads", "asyncio"])
+    parser.add_argument("--local", action="store_true", help="connect over Unix sockets instead of TCP loopback")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+    args.drawers = min(args.drawers, args.peers)
+
+    results = []
+    for topology in args.topologies:
+        results.append(run_case(topology, args))
+        if not args.json:
+            r = results[-1]
+            print(f"{r['topology']:<6} {r['peers']:>3} peers  {r['ops_sent']:>5} ops"
+                  f"  latency p50 {r['latency_p50_ms']} ms p99 {r['latency_p99_ms']} ms"
+                  f"  {r['messages_per_s']:>6} msg/s {r['bytes_per_s']:>8} B/s"
+                  f"  CPU/peer mean {r['cpu_mean_pct']}% max {r['cpu_max_pct']}%"
+                  f"  dropped {r['dropped']} applied twice {r['applied_twice']}"
+                  f" duplicates {r['duplicate_arrivals']}", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
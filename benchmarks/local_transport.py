@@ -0,0 +1,47 @@
+"""Same-host peers over TCP loopback vs. Unix domain sockets.
+
+Runs benchmarks.latency for 2 to 16 peer processes on this machine, once
+connected over TCP loopback and once over the transports' local Unix
+sockets, and compares stroke latency and CPU per peer.  The peers form a
+full mesh by default, where every batch crosses the most sockets.
+
+    python -m benchmarks.local_transport [--peers 2 4 8 16] [--topology mesh] [--transport threads]
+"""
+import argparse
+import json
+
+from benchmarks import latency
+from transport import LOCAL_SOCKETS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--topology", default="mesh", choices=["chain", "star", "mesh"])
+    parser.add_argument("--drawers", type=int, default=2)
+    parser.add_argument("--rate", type=int, default=120, help="pointer motions per second per drawer")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--transport", default="threads", choices=["threads", "asyncio"])
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+    if not LOCAL_SOCKETS:
+        parser.error("Unix domain sockets are not available here")
+
+    results = []
+    for peers in args.peers:
+        for local in (False, True):
+            case = argparse.Namespace(peers=peers, drawers=min(args.drawers, peers), rate=args.rate,
+                                      stroke_points=200, seconds=args.seconds, drain=1, trace=None, speed=1,
+                                      transport=args.transport, local=local)
+            results.append(latency.run_case(args.topology, case))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['peers']:>3} peers  {'unix' if local else 'tcp':<4}  latency p50 {r['latency_p50_ms']} ms"
+                      f" p99 {r['latency_p99_ms']} ms  CPU/peer mean {r['cpu_mean_pct']}% max {r['cpu_max_pct']}%"
+                      f"  dropped {r['dropped']}", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
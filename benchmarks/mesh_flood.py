@@ -0,0 +1,65 @@
+"""Check duplicate suppression on a fully connected loopback mesh.
+
+Every peer draws a few strokes; afterwards each peer must have drawn every
+other peer's batches exactly once, and the frames put on the wire per
+batch must stay within the 2 * edges bound of flooding with suppression.
+Exits non-zero if either check fails.
+
+    python -m benchmarks.mesh_flood [--peers 10] [--batches 20]
+"""
+import argparse
+import itertools
+import sys
+import time
+
+from benchmarks.harness import HeadlessPeer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10)
+    parser.add_argument("--batches", type=int, default=20, help="batches drawn by each peer")
+    parser.add_argument("--transport", choices=("threads", "asyncio"), default="asyncio")
+    args = parser.parse_args()
+
+    peers = [HeadlessPeer(transport=args.transport, keep_board=False) for _ in range(args.peers)]
+    for a, b in itertools.combinations(peers, 2):
+        a.join(b)
+    edges = args.peers * (args.peers - 1) // 2
+    while sum(len(peer.connections) for peer in peers) < 2 * edges:
+        time.sleep(0.05)
+
+    # One stroke per batch, so no two batches can be coalesced in a send queue
+    for n in range(args.batches):
+        for peer in peers:
+            peer.broadcast({"type": "draw_batch", "data": {"stroke": n, "index": 0, "points": [n, n, n + 1, n + 1]}})
+
+    expected = {(peer.ids.origin, seq) for peer in peers for seq in range(1, args.batches + 1)}
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if all(len(peer.drawn) == len(expected) - args.batches for peer in peers):
+            break
+        time.sleep(0.05)
+    time.sleep(0.2)  # Give any storm a chance to show up
+
+    failures = []
+    for i, peer in enumerate(peers):
+        own = {message_id for message_id in expected if message_id[0] == peer.ids.origin}
+        missing = expected - own - set(peer.drawn)
+        repeated = {message_id for message_id, count in peer.drawn.items() if count != 1}
+        if missing or repeated:
+            failures.append(f"peer {i}: {len(missing)} missing, {len(repeated)} drawn more than once")
+    frames = sum(peer.frames_sent() for peer in peers)
+    per_batch = frames / len(expected)
+    print(f"{args.peers} peers, {edges} edges, {len(expected)} batches")
+    print(f"frames sent: {frames} ({per_batch:.1f} per batch, bound {2 * edges})")
+    if per_batch > 2 * edges:
+        failures.append("wire traffic exceeds 2 * edges frames per batch")
+    for peer in peers:
+        peer.close()
+    print("\n".join(failures) or "every peer drew every batch exactly once")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Per-peer bandwidth and stroke latency of the overlays as sessions grow.
+
+Builds N GUI-free loopback peers for each overlay, has a few of them draw,
+and reports upload per peer per batch (mean and worst), end-to-end
+latency and delivery coverage.  Then 10% of the peers leave, and coverage
+is measured again once the overlay has had a moment to repair itself.
+The tree is also checked after the root's heir leaves and then the root
+itself, which must leave one tree, not a root per orphaned child.
+
+    python -m benchmarks.overlay_sim [--peers 5 25 50 100 200] [--overlays mesh tree gossip]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks.harness import HeadlessPeer
+
+# Full-mesh sockets per process, kept well under the descriptor limit
+MAX_MESH_PEERS = 100
+
+
+def build(kind, count):
+    peers = []
+    for i in range(count):
+        peer = HeadlessPeer(overlay=kind, keep_board=False)
+        if kind == "mesh":
+            for other in peers:
+                peer.join(other)
+        elif peers:
+            peer.join(peers[0] if kind == "tree" else random.choice(peers))
+        peers.append(peer)
+    settle(peers)
+    return peers
+
+
+def settle(peers, timeout=10.0):
+    """Wait until the neighbour counts stop changing."""
+    previous = None
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.3)
+        current = [peer.overlay.neighbours() for peer in peers]
+        if current == previous:
+            return
+        previous = current
+
+
+def draw(peers, origins, batches, timeout=10.0):
+    """Send batches from the origins; returns (bytes per peer per batch, latencies, coverage)."""
+    before = [peer.bytes_sent() for peer in peers]
+    points = [random.randrange(700) for _ in range(64)]
+    sent = {}
+    for n in range(batches):
+        for origin in origins:
+            message = origin.broadcast({"type": "draw_batch", "data": {"stroke": n, "index": 0, "points": points}})
+            sent[message["id"]] = (time.perf_counter(), origin)
+        time.sleep(0.01)
+    expected = len(sent) * (len(peers) - 1)
+    deadline = time.time() + timeout
+    while time.time() < deadline and deliveries(peers, sent) < expected:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    latencies = sorted(
+        peer.received_at[message_id] - sent_at
+        for message_id, (sent_at, origin) in sent.items()
+        for peer in peers
+        if peer is not origin and message_id in peer.received_at
+    )
+    upload = [(peer.bytes_sent() - start) / len(sent) for peer, start in zip(peers, before)]
+    return upload, latencies, len(latencies) / expected
+
+
+def heir_then_root(count, batches):
+    """Tree coverage after the root's heir leaves and then the root."""
+    peers = build("tree", count)
+    root = peers[0]
+    with root.overlay.lock:
+        heir_address = root.overlay.children[0].peer_address
+    heir = next(peer for peer in peers if (peer.host, peer.port) == heir_address)
+    for leaving in (heir, root):
+        leaving.close()
+        peers.remove(leaving)
+        settle(peers)
+    _, _, coverage = draw(peers, random.sample(peers, min(5, len(peers))), batches)
+    for peer in peers:
+        peer.close()
+    return coverage
+
+
+def deliveries(peers, sent):
+    return sum(1 for peer in peers for message_id in sent if message_id in peer.received_at)
+
+
+def run_case(kind, count, batches):
+    peers = build(kind, count)
+    origins = random.sample(peers, min(5, count))
+    upload, latencies, coverage = draw(peers, origins, batches)
+
+    leaving = random.sample([peer for peer in peers if peer not in origins], count // 10)
+    for peer in leaving:
+        peer.close()
+    remaining = [peer for peer in peers if peer not in leaving]
+    settle(remaining)
+    _, _, churn_coverage = draw(remaining, origins, batches)
+    for peer in remaining:
+        peer.close()
+    result = {
+        "overlay": kind,
+        "peers": count,
+        "upload_mean_b": round(statistics.mean(upload)),
+        "upload_max_b": round(max(upload)),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 2) if latencies else None,
+        "p99_ms": round(1000 * latencies[int(0.99 * (len(latencies) - 1))], 2) if latencies else None,
+        "coverage": round(coverage, 4),
+        "coverage_after_churn": round(churn_coverage, 4),
+    }
+    if kind == "tree" and count >= 4:
+        result["coverage_after_heir_and_root"] = round(heir_then_root(count, batches), 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, nargs="+", default=[5, 25, 50, 100, 200])
+    parser.add_argument("--overlays", nargs="+", default=["mesh", "tree", "gossip"])
+    parser.add_argument("--batches", type=int, default=10, help="batches drawn by each of 5 origins")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.peers:
+        for kind in args.overlays:
+            if kind == "mesh" and count > MAX_MESH_PEERS:
+                continue
+            results.append(run_case(kind, count, args.batches))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['overlay']:<7}{r['peers']:>5} peers  upload/batch mean {r['upload_mean_b']:>6} B"
+                      f" max {r['upload_max_b']:>7} B  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms"
+                      f"  coverage {r['coverage']:.2%}  after churn {r['coverage_after_churn']:.2%}"
+                      + (f"  after heir and root leave {r['coverage_after_heir_and_root']:.2%}"
+                         if "coverage_after_heir_and_root" in r else ""), flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
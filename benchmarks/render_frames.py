@@ -0,0 +1,207 @@
+"""Tk-thread load of remote drawing: one callback per message vs. one per frame.
+
+Simulated peers send strokes the way an old peer does, one draw_event per
+mouse motion, from a network thread.  The per-message strategy is the old
+code path (a root.after(0) per event, a line item per segment, and the name
+tag deleted and re-created each time); the frame strategy queues them on a
+FrameScheduler.  Reports canvas calls, Tk-thread time, the inbound queue
+depth and how long an event waits before it is on the canvas.
+
+Uses a real Tk canvas when a display is available, otherwise a canvas that
+only counts calls (so Tk's own drawing cost is left out).
+
+    python -m benchmarks.render_frames [--drawers 1 5 10] [--rate 250] [--seconds 3]
+"""
+import argparse
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+
+from board import Board
+from render import FrameScheduler
+from scene import CanvasView
+
+
+class CountingCanvas:
+    """Counts the calls made to a Tk canvas, or stands in for one without a display."""
+
+    def __init__(self, canvas=None):
+        self.canvas = canvas
+        self.calls = 0
+        self.items = itertools.count(1)
+
+    def __getattr__(self, name):
+        method = getattr(self.canvas, name, None)
+
+        def call(*args, **options):
+            self.calls += 1
+            if method is not None:
+                return method(*args, **options)
+            return next(self.items) if name.startswith("create_") else None
+        return call
+
+
+class Loop:
+    """A minimal root.after event loop, used when there is no Tk."""
+
+    def __init__(self):
+        self.jobs = []
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def after(self, ms, function, *args):
+        with self.lock:
+            job = next(self.ids)
+            heapq.heappush(self.jobs, (time.perf_counter() + ms / 1000, job, function, args))
+        return job
+
+    def after_cancel(self, job):
+        pass
+
+    def run_until(self, deadline):
+        while time.perf_counter() < deadline:
+            with self.lock:
+                due = self.jobs and self.jobs[0][0] <= time.perf_counter()
+                job = heapq.heappop(self.jobs) if due else None
+            if job is None:
+                time.sleep(0.0005)
+                continue
+            job[2](*job[3])
+
+
+def make_root():
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception:
+        return Loop(), CountingCanvas(), False
+    canvas = tkinter.Canvas(root, width=1920, height=1080)
+    canvas.pack()
+    return root, CountingCanvas(canvas), True
+
+
+def run_until(root, deadline):
+    if hasattr(root, "run_until"):
+        root.run_until(deadline)
+        return
+    while time.perf_counter() < deadline:
+        root.update()
+        time.sleep(0.0005)
+
+
+def drawers_thread(deliver, drawers, rate, seconds):
+    """Each drawer sends `rate` draw_events a second, one per motion."""
+    rng = random.Random(drawers)
+    positions = [[rng.randrange(1920), rng.randrange(1080)] for _ in range(drawers)]
+    interval = 1 / (rate * drawers)
+    end = time.perf_counter() + seconds
+    next_at = time.perf_counter()
+    for n in itertools.count():
+        if next_at >= end:
+            return
+        user = n % drawers
+        x, y = positions[user]
+        nx, ny = min(1919, max(0, x + rng.randint(-6, 6))), min(1079, max(0, y + rng.randint(-6, 6)))
+        positions[user] = [nx, ny]
+        event = {"prev_x": x, "prev_y": y, "x": nx, "y": ny, "user_name": f"user{user}"}
+        deliver(event, time.perf_counter())
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_case(strategy, drawers, rate, seconds):
+    root, canvas, real_tk = make_root()
+    board = Board()
+    view = CanvasView(canvas, board.scene)
+    waits, busy, depths = [], [0.0], []
+
+    if strategy == "per-message":
+        def show(event, sent_at):
+            start = time.perf_counter()
+            segment = (event["prev_x"], event["prev_y"], event["x"], event["y"])
+            view.render(board.add_points(None, 0, segment, user_name=event["user_name"]))
+            canvas.delete("name_tag")
+            canvas.create_text(event["x"] + 15, event["y"] - 10, text=event["user_name"], tags="name_tag")
+            waits.append(time.perf_counter() - sent_at)
+            busy[0] += time.perf_counter() - start
+
+        def deliver(event, sent_at):
+            root.after(0, show, event, sent_at)
+    else:
+        drawn = []
+
+        def apply(event, sent_at):
+            segment = (event["prev_x"], event["prev_y"], event["x"], event["y"])
+            frames.render(board.add_segment(segment, user_name=event["user_name"]))
+            frames.name_tag(event["user_name"], event["x"], event["y"], "black")
+            drawn.append(sent_at)
+
+        def on_frame(depth, frame_time):
+            now = time.perf_counter()
+            waits.extend(now - sent_at for sent_at in drawn)
+            drawn.clear()
+            busy[0] += frame_time
+            depths.append(depth)
+
+        frames = FrameScheduler(root, view, on_frame=on_frame)
+        frames.start()
+
+        def deliver(event, sent_at):
+            frames.call(apply, event, sent_at)
+
+    producer = threading.Thread(target=drawers_thread, args=(deliver, drawers, rate, seconds), daemon=True)
+    start = time.perf_counter()
+    producer.start()
+    run_until(root, start + seconds + 0.5)
+    producer.join()
+    if real_tk:
+        root.destroy()
+
+    events = drawers * rate * seconds
+    waits.sort()
+    return {
+        "strategy": strategy,
+        "drawers": drawers,
+        "events": len(waits),
+        "real_tk": real_tk,
+        "canvas_calls": canvas.calls,
+        "canvas_items": len(view.items),
+        "tk_busy_pct": round(100 * busy[0] / seconds, 1),
+        "wait_p50_ms": round(1000 * waits[len(waits) // 2], 2) if waits else None,
+        "wait_p99_ms": round(1000 * waits[int(len(waits) * 0.99)], 2) if waits else None,
+        "max_queue_depth": max(depths) if depths else None,
+        "expected_events": events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drawers", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--rate", type=int, default=250, help="draw_events per second per drawer")
+    parser.add_argument("--seconds", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for drawers in args.drawers:
+        for strategy in ("per-message", "frame"):
+            results.append(run_case(strategy, drawers, args.rate, args.seconds))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['drawers']:>3} drawers  {r['strategy']:<11}  {r['canvas_calls']:>7} canvas calls"
+                      f"  {r['canvas_items']:>6} items  Tk busy {r['tk_busy_pct']:>5}%"
+                      f"  wait p50 {r['wait_p50_ms']} ms p99 {r['wait_p99_ms']} ms"
+                      f"  max queue {r['max_queue_depth']}", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif results and not results[0]["real_tk"]:
+        print("(no display: canvas calls counted, Tk drawing time not included)")
+
+
+if __name__ == "__main__":
+    main()
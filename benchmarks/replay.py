@@ -0,0 +1,62 @@
+"""Headless replay throughput: decode, process_message and board updates, no network.
+
+Records a session of --segments segments (the strokes and erases of
+benchmarks.journal_replay) the way a peer records what it receives, then
+plays it back flat out into a fresh headless peer with replay.py and
+reports messages and segments a second, split into decoding and
+process_message.  --trace replays a recording made with --record instead.
+
+    python -m benchmarks.replay [--segments 100000 1000000] [--trace FILE] [--json]
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from benchmarks.journal_replay import session
+from engine import PeerEngine
+from replay import replay, summary
+
+
+def record_session(path, segments):
+    peer = PeerEngine("127.0.0.1", 0, manage_links=False)
+    peer.record(path)
+    for message in session(segments):
+        peer.process_message(message, None)
+    peer.close()
+
+
+def run_case(path):
+    peer = PeerEngine("127.0.0.1", 0, manage_links=False)
+    result = summary(peer, replay(peer, path, speed=None))
+    result["recording_bytes"] = os.path.getsize(path)
+    peer.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--trace", metavar="FILE", help="replay this recording instead of a synthetic session")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [args.trace] if args.trace else []
+        for segments in [] if args.trace else args.segments:
+            paths.append(os.path.join(directory, f"session-{segments}.bin"))
+            record_session(paths[-1], segments)
+        for path in paths:
+            results.append(run_case(path))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['segments']:>8} segments  {r['messages']} messages, {r['recording_bytes'] / 1e6:.2f} MB"
+                      f"  decode {r['decode_s']:.2f} s  process_message {r['process_s']:.2f} s"
+                      f"  {r['messages_per_s']} messages/s  {r['segments_per_s']} segments/s", flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
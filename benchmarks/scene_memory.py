@@ -0,0 +1,137 @@
+"""Memory and query cost of the Scene model against one canvas item per segment.
+
+Builds a board of random-walk strokes and reports bytes per 100k segments
+for the Scene (int16 point arrays plus the grid index, via tracemalloc) and,
+when a display is available, the process RSS growth of a Tk canvas holding
+one line item per segment (the old drawing code) vs. one per stroke
+(CanvasView).  Then times hit-tests, region queries and viewport culling
+against a linear scan over every stroke.
+
+    python -m benchmarks.scene_memory [--segments 100000] [--stroke-length 100]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from scene import CanvasView, Scene
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def random_strokes(segments, stroke_length):
+    strokes = []
+    for _ in range(segments // stroke_length):
+        x, y = random.randrange(WIDTH), random.randrange(HEIGHT)
+        points = [x, y]
+        for _ in range(stroke_length):
+            x = min(WIDTH - 1, max(0, x + random.randint(-6, 6)))
+            y = min(HEIGHT - 1, max(0, y + random.randint(-6, 6)))
+            points += (x, y)
+        strokes.append(points)
+    return strokes
+
+
+def build_scene(strokes):
+    scene = Scene()
+    for number, points in enumerate(strokes):
+        scene.add_points((0, number), 0, points)
+    return scene
+
+
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def canvas_bytes(strokes, per_segment):
+    """RSS growth of a Tk canvas holding the strokes, or None without a display."""
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception:
+        return None
+    root.withdraw()
+    canvas = tkinter.Canvas(root, width=WIDTH, height=HEIGHT)
+    root.update()
+    gc.collect()
+    before = rss()
+    if per_segment:
+        for points in strokes:
+            for i in range(0, len(points) - 2, 2):
+                canvas.create_line(*points[i:i + 4], fill="black", width=2)
+    else:
+        view = CanvasView(canvas, build_scene(strokes))
+        view.redraw()
+    root.update()
+    size = rss() - before
+    root.destroy()
+    return size
+
+
+def timed(function, args):
+    start = time.perf_counter()
+    for arg in args:
+        function(*arg)
+    return 1e6 * (time.perf_counter() - start) / len(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=100000)
+    parser.add_argument("--stroke-length", type=int, default=100, help="segments per stroke")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    random.seed(1)
+    strokes = random_strokes(args.segments, args.stroke_length)
+    segments = sum(len(points) // 2 - 1 for points in strokes)
+    scale = 100000 / segments
+    scene, scene_size = traced_bytes(lambda: build_scene(strokes))
+    _, tuples_size = traced_bytes(lambda: [tuple(p[i:i + 4]) for p in strokes for i in range(0, len(p) - 2, 2)])
+    per_segment_canvas = canvas_bytes(strokes, per_segment=True)
+    per_stroke_canvas = canvas_bytes(strokes, per_segment=False)
+
+    points = [(random.randrange(WIDTH), random.randrange(HEIGHT)) for _ in range(2000)]
+    rects = [(x, y, x + 200, y + 200) for x, y in points[:500]]
+    everything = list(scene)
+    results = {
+        "segments": segments,
+        "strokes": len(scene),
+        "scene_b_per_100k": round(scene_size * scale),
+        "segment_tuples_b_per_100k": round(tuples_size * scale),
+        "canvas_item_per_segment_b_per_100k": per_segment_canvas and round(per_segment_canvas * scale),
+        "canvas_item_per_stroke_b_per_100k": per_stroke_canvas and round(per_stroke_canvas * scale),
+        "hit_test_us": round(timed(scene.hit_test, points), 1),
+        "hit_test_linear_us": round(timed(lambda x, y: min(everything, key=lambda s: s.distance(x, y)), points[:20]), 1),
+        "query_200px_us": round(timed(scene.query, rects), 1),
+        "visible_viewport_us": round(timed(scene.visible, [(0, 0, 730, 300)] * 100), 1),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['segments']} segments in {results['strokes']} strokes, per 100k segments:")
+    print(f"  scene (int16 arrays + grid)    {results['scene_b_per_100k'] / 1e6:8.2f} MB")
+    print(f"  (x0, y0, x1, y1) tuples        {results['segment_tuples_b_per_100k'] / 1e6:8.2f} MB")
+    for label, key in (("canvas, item per segment", "canvas_item_per_segment_b_per_100k"),
+                       ("canvas, item per stroke", "canvas_item_per_stroke_b_per_100k")):
+        value = results[key]
+        print(f"  {label:<30} " + (f"{value / 1e6:8.2f} MB" if value is not None else "  skipped (no display)"))
+    print(f"hit test {results['hit_test_us']} us (linear scan {results['hit_test_linear_us']} us), "
+          f"200px region query {results['query_200px_us']} us, 730x300 viewport {results['visible_viewport_us']} us")
+
+
+if __name__ == "__main__":
+    main()
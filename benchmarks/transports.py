@@ -0,0 +1,130 @@
+"""Thread-per-connection vs. asyncio transport under many loopback peers.
+
+A relay peer runs in its own process with the chosen transport and relays
+every message to all other connections, like process_message does.  This
+process opens N client sockets to it, sends draw batches at a fixed total
+rate from random clients and times how long each takes to reach the others.
+
+    python -m benchmarks.transports [--peers 10 50 100] [--rate 200] [--seconds 3]
+"""
+import argparse
+import json
+import random
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.harness import free_port
+from protocol import MessageDecoder, encode_message
+from transport import create_transport
+
+
+def run_relay(kind, port):
+    """Child process: relay everything until told to stop, then report."""
+    transport = None
+
+    def relay(message, sender):
+        for connection in list(transport.connections):
+            if connection is not sender:
+                connection.send(message)
+
+    transport = create_transport(kind, relay)
+    transport.listen("127.0.0.1", port)
+    print("ready", flush=True)
+    cpu_start = time.process_time()
+    sys.stdin.readline()
+    print(json.dumps({"threads": threading.active_count(), "cpu": time.process_time() - cpu_start}), flush=True)
+
+
+def run_case(kind, peers, rate, seconds):
+    port = free_port()
+    relay = subprocess.Popen([sys.executable, "-m", "benchmarks.transports", "--relay", kind, str(port)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    relay.stdout.readline()
+    selector = selectors.DefaultSelector()
+    clients = []
+    for _ in range(peers):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, MessageDecoder())
+        clients.append(sock)
+    time.sleep(0.5)
+
+    sent = {}
+    latencies = []
+    points = [random.randrange(700) for _ in range(64)]
+    start = time.perf_counter()
+    next_send = start
+    stroke = 0
+    # Send for `seconds`, then allow one more second for the relay to catch up
+    while True:
+        now = time.perf_counter()
+        if now - start >= seconds + 1 or (now - start >= seconds and len(latencies) == stroke * (peers - 1)):
+            break
+        if now >= next_send and now - start < seconds:
+            stroke += 1
+            message = {"type": "draw_batch", "data": {"stroke": stroke, "index": 0, "points": points}}
+            sent[stroke] = time.perf_counter()
+            random.choice(clients).sendall(encode_message(message))
+            next_send += 1 / rate
+        for key, _ in selector.select(max(0.0, next_send - time.perf_counter())):
+            decoder = key.data
+            try:
+                if not decoder.recv_from(key.fileobj):
+                    continue
+            except BlockingIOError:
+                continue
+            received = time.perf_counter()
+            for message in decoder.messages():
+                latencies.append(received - sent[message["data"]["stroke"]])
+
+    relay.stdin.write("stop\n")
+    relay.stdin.flush()
+    stats = json.loads(relay.stdout.readline())
+    for sock in clients:
+        sock.close()
+    relay.stdin.close()
+    relay.wait()
+    latencies.sort()
+    expected = stroke * (peers - 1)
+    return {
+        "transport": kind,
+        "peers": peers,
+        "relay_threads": stats["threads"],
+        "relay_cpu_s": round(stats["cpu"], 3),
+        "delivered": len(latencies),
+        "expected": expected,
+        "p50_ms": round(1000 * statistics.median(latencies), 2) if latencies else None,
+        "p99_ms": round(1000 * latencies[int(0.99 * (len(latencies) - 1))], 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--rate", type=float, default=200, help="batches sent per second in total")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    parser.add_argument("--relay", nargs=2, metavar=("KIND", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.relay:
+        run_relay(args.relay[0], int(args.relay[1]))
+        return
+
+    results = [run_case(kind, peers, args.rate, args.seconds) for peers in args.peers for kind in ("threads", "asyncio")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'transport':<10}{'peers':>6}{'threads':>9}{'cpu s':>8}{'delivered':>12}{'p50 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        print(f"{r['transport']:<10}{r['peers']:>6}{r['relay_threads']:>9}{r['relay_cpu_s']:>8}"
+              f"{r['delivered']:>6}/{r['expected']:<5}{r['p50_ms']:>9}{r['p99_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Redraw cost against board history: drawing everything vs. the viewport with tiles.
+
+Random-walk strokes are spread over a board --extent units square, for
+boards of growing history.  A CanvasView redraw (every stroke a line
+item, the pre-viewport code) is compared with a 730x300 ViewportView
+once the strokes have settled: with Pillow tiles and, for reference,
+with line items only.  Each one is panned in 20 px steps at 1x, zoomed
+out to 1/8x and panned again; reports the time and canvas calls per pan,
+the time and frames to zoom out (the first frame is the one the user
+waits for; without tiles the others simplify the strokes on screen a
+SIMPLIFY_BUDGET at a time), the items on the canvas and how many points
+the simplified strokes keep.
+
+Uses a canvas that only counts calls, so Tk's own drawing is left out;
+tiles are rasterised but not handed to Tk.
+
+    python -m benchmarks.viewport [--segments 10000 100000 1000000] [--extent 4000] [--pans 50]
+"""
+import argparse
+import json
+import random
+import time
+
+import viewport
+from benchmarks.render_frames import CountingCanvas
+from scene import CanvasView, Scene
+from viewport import ViewportView
+
+WIDTH, HEIGHT = 730, 300
+STROKE_SEGMENTS = 100
+
+
+class HeadlessView(ViewportView):
+    """A ViewportView on a counting canvas: fixed size, tile images kept as Pillow images."""
+
+    def size(self):
+        return WIDTH, HEIGHT
+
+    def _photo(self, image):
+        return image
+
+
+def build_scene(segments, extent, seed=1):
+    rng = random.Random(seed)
+    scene = Scene()
+    for number in range(segments // STROKE_SEGMENTS):
+        x, y = rng.randrange(extent), rng.randrange(extent)
+        points = [x, y]
+        for _ in range(STROKE_SEGMENTS):
+            x, y = x + rng.randint(-6, 6), y + rng.randint(-6, 6)
+            points += (x, y)
+        scene.add_points((1, number), 0, points, color=rng.choice(("black", "red", "blue")))
+    return scene
+
+
+def settle(view):
+    """Run the view's frames until every tile is drawn and stroke simplified; returns how many it took."""
+    frames = 0
+    while view.stale or view.pending:
+        view.flush()
+        frames += 1
+    return frames
+
+
+def timed_pans(view, canvas, pans):
+    """Mean ms and canvas calls per 20 px pan, with the frames drawing new tiles."""
+    calls = canvas.calls
+    start = time.perf_counter()
+    for i in range(pans):
+        view.pan(-20 if i % 20 < 10 else 20, -5)
+        settle(view)
+    return round(1000 * (time.perf_counter() - start) / pans, 3), round((canvas.calls - calls) / pans, 1)
+
+
+def viewport_case(scene, extent, tiles, pans):
+    canvas = CountingCanvas()
+    view = HeadlessView(canvas, scene, tiles=tiles)
+    view.viewport.x = view.viewport.y = extent / 2
+    start = time.perf_counter()
+    view.redraw()
+    settle(view)
+    result = {"view": "viewport + tiles" if tiles else "viewport, items only",
+              "redraw_ms": round(1000 * (time.perf_counter() - start), 2)}
+    result["pan_1x_ms"], result["pan_1x_calls"] = timed_pans(view, canvas, pans)
+    result["items_1x"] = len(view.items) + len(view.tile_items)
+    start = time.perf_counter()
+    view.zoom(-3 * viewport.ZOOM_STEPS, WIDTH / 2, HEIGHT / 2)
+    result["zoom_out_first_frame_ms"] = round(1000 * (time.perf_counter() - start), 2)
+    result["zoom_out_frames"] = settle(view) + 1
+    result["zoom_out_ms"] = round(1000 * (time.perf_counter() - start), 2)
+    result["pan_8th_ms"], result["pan_8th_calls"] = timed_pans(view, canvas, pans)
+    result["items_8th"] = len(view.items) + len(view.tile_items)
+    kept = sum(len(view._points(stroke)) for stroke in scene if stroke.key in view.items or stroke.key in view.flat)
+    total = sum(len(stroke.points) for stroke in scene if stroke.key in view.items or stroke.key in view.flat)
+    result["points_kept_8th"] = round(kept / total, 3) if total else None
+    return result
+
+
+def run_case(segments, args):
+    scene = build_scene(segments, args.extent)
+    canvas = CountingCanvas()
+    start = time.perf_counter()
+    CanvasView(canvas, scene).redraw()
+    rows = [{"view": "every stroke an item", "redraw_ms": round(1000 * (time.perf_counter() - start), 2),
+             "items_1x": len(scene)}]
+    if viewport.Image is not None:
+        rows.append(viewport_case(scene, args.extent, True, args.pans))
+    rows.append(viewport_case(scene, args.extent, False, args.pans))
+    for row in rows:
+        row["segments"] = scene.segment_count
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--extent", type=int, default=4000, help="board units the strokes are spread over")
+    parser.add_argument("--pans", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = []
+    if viewport.Image is None and not args.json:
+        print("Pillow is not installed: no tiles")
+    for segments in args.segments:
+        rows = run_case(segments, args)
+        results += rows
+        if args.json:
+            continue
+        print(f"{rows[0]['segments']} segments")
+        for r in rows:
+            line = f"  {r['view']:<22} redraw {r['redraw_ms']:>9} ms  {r['items_1x']:>6} items at 1x"
+            if "pan_1x_ms" in r:
+                line += (f"  pan {r['pan_1x_ms']} ms ({r['pan_1x_calls']} calls)"
+                         f"  zoom to 1/8x {r['zoom_out_ms']} ms in {r['zoom_out_frames']} frames"
+                         f" (first {r['zoom_out_first_frame_ms']} ms): {r['items_8th']} items, pan {r['pan_8th_ms']} ms ({r['pan_8th_calls']} calls),"
+                         f" {r['points_kept_8th']} of the points")
+            print(line, flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
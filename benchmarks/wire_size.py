@@ -0,0 +1,191 @@
+"""Bytes per segment on the wire for handwriting, before and after delta encoding.
+
+Synthetic cursive handwriting (loops along a baseline, a pen lift between
+words, sampled at --rate Hz) from --writers users is batched the way the
+GUI batches it and sent interleaved over one connection, as a relay
+forwards it.  Compares per-segment draw_events, stateless draw_batch
+frames and a connection's DRAW_DELTA frames, for the GUI's 12 ms batches
+and for full 64 point ones, and a board snapshot with and without zlib.
+Every frame is decoded again and checked against what was sent.
+
+    python -m benchmarks.wire_size [--writers 3] [--seconds 20] [--rate 125] [--trace FILE] [--json]
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+from protocol import HEADER, FrameEncoder, MessageDecoder, _encode_sync_strokes, encode_message
+from strokes import StrokeBatcher
+
+
+def handwriting(rng, rate, seconds):
+    """Yield (t, x, y, new_stroke) samples of one writer's cursive words."""
+    t = 0.0
+    x0, y0 = 20, 40
+    while t < seconds:
+        letters = rng.randint(2, 8)
+        size = rng.uniform(14, 26)
+        speed = rng.uniform(2.5, 5)  # letters per second
+        phase = rng.uniform(0, math.pi)
+        for i in range(int(letters / speed * rate)):
+            u = i * speed / rate  # letters written so far
+            x = x0 + size * (0.8 * u + 0.35 * math.cos(2 * math.pi * u + phase))
+            y = y0 - size * (0.5 + 0.5 * math.sin(2 * math.pi * u + phase)) * (1 + 0.6 * math.sin(0.7 * u))
+            yield t, round(x), round(y), i == 0
+            t += 1 / rate
+        t += rng.uniform(0.15, 0.4)  # Pen up between words
+        x0 += size * (0.8 * letters + 1.2)
+        if x0 > 1800:
+            x0, y0 = 20, y0 + 60
+
+
+def batches(trace, window, max_points, user_name, color):
+    """The draw_batch data the GUI would send for a trace, with the time of each."""
+    now = [0.0]
+    out = []
+    clock = [0]
+
+    def send(stroke, index, points):
+        out.append((now[0], {"stroke": stroke, "index": index, "points": list(points), "clock": clock[0],
+                             "width": 2, "color": color, "user_name": user_name}))
+
+    batcher = StrokeBatcher(send, window, max_points, clock=lambda: now[0])
+    deadline = None
+    for t, x, y, new_stroke in trace:
+        now[0] = t
+        if deadline is not None and t >= deadline:
+            batcher.flush()  # Stand-in for the GUI's flush timer
+            deadline = None
+        if new_stroke:
+            batcher.begin(x, y)
+            clock[0] += 1
+            deadline = None
+            continue
+        batcher.add(x, y)
+        if batcher.pending and deadline is None:
+            deadline = t + window
+    batcher.end()
+    return out
+
+
+def synthetic_messages(writers, seconds, rate, window, max_points):
+    """Every writer's batches as stamped draw_batch messages, interleaved by time."""
+    timed = []
+    for writer in range(writers):
+        rng = random.Random(writer)
+        trace = list(handwriting(rng, rate, seconds))
+        sequence = 0
+        for at, batch in batches(trace, window, max_points, f"writer{writer}", ("black", "red", "#1f6feb")[writer % 3]):
+            sequence += 1
+            timed.append((at, {"type": "draw_batch", "id": (1000 + writer, sequence), "data": batch}))
+    timed.sort(key=lambda item: item[0])
+    return [message for _, message in timed]
+
+
+def recorded_messages(path):
+    from recording import read_recording
+    return [message for _, message in read_recording(path) if message["type"] == "draw_batch" and "id" in message]
+
+
+def segments(messages):
+    return sum(len(message["data"]["points"]) // 2 - 1 for message in messages)
+
+
+def per_segment_bytes(messages):
+    """What the same strokes cost as one draw_event per segment."""
+    total = 0
+    for message in messages:
+        points, batch = message["data"]["points"], message["data"]
+        for i in range(2, len(points), 2):
+            event = {"prev_x": points[i - 2], "prev_y": points[i - 1], "x": points[i], "y": points[i + 1],
+                     "user_name": batch.get("user_name", "")}
+            total += len(encode_message({"type": "draw_event", "id": message["id"], "data": event}))
+    return total
+
+
+def measure(name, messages, encode):
+    """Encode and decode every message; returns bytes per segment and timings."""
+    start = time.perf_counter()
+    frames = [encode(message) for message in messages]
+    encode_time = time.perf_counter() - start
+    decoder = MessageDecoder()
+    start = time.perf_counter()
+    decoded = [message for frame in frames for message in decoder.feed(frame)]
+    decode_time = time.perf_counter() - start
+    for sent, received in zip(messages, decoded):
+        if tuple(sent["id"]) != tuple(received["id"]) or list(sent["data"]["points"]) != list(received["data"]["points"]):
+            raise AssertionError(f"{name}: {received} decoded for {sent}")
+    if len(decoded) != len(messages):
+        raise AssertionError(f"{name}: {len(decoded)} of {len(messages)} messages decoded")
+    total = sum(map(len, frames))
+    return {
+        "encoding": name,
+        "frames": len(frames),
+        "bytes": total,
+        "bytes_per_segment": round(total / segments(messages), 2),
+        "encode_us_per_frame": round(1e6 * encode_time / len(frames), 2),
+        "decode_us_per_frame": round(1e6 * decode_time / len(frames), 2),
+    }
+
+
+def snapshot(messages):
+    """A board snapshot of the same strokes, raw and zlib compressed."""
+    strokes = {}
+    for message in messages:
+        batch = message["data"]
+        key = (message["id"][0], batch["stroke"])
+        points = strokes.setdefault(key, (batch, []))[1]
+        points += batch["points"] if not points else batch["points"][2:]
+    records = [(key, batch["clock"], 0, batch["color"], batch["width"], batch["user_name"], points)
+               for key, (batch, points) in strokes.items()]
+    raw = compressed = 0
+    for i in range(0, len(records), 50):
+        chunk = {"type": "sync_strokes", "strokes": records[i:i + 50]}
+        raw += HEADER.size + len(_encode_sync_strokes(chunk)[1])
+        compressed += len(encode_message(chunk))
+    count = segments(messages)
+    return [{"encoding": "snapshot", "bytes": raw, "bytes_per_segment": round(raw / count, 2)},
+            {"encoding": "snapshot zlib", "bytes": compressed, "bytes_per_segment": round(compressed / count, 2)}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--rate", type=int, default=125, help="pointer samples per second")
+    parser.add_argument("--trace", metavar="FILE", help="use the draw batches of a node.py --record file instead")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    cases = []
+    if args.trace:
+        cases.append(("recorded", recorded_messages(args.trace)))
+    else:
+        for label, window, max_points in (("12 ms batches", 0.012, 64), ("64 point batches", 10.0, 64)):
+            cases.append((label, synthetic_messages(args.writers, args.seconds, args.rate, window, max_points)))
+
+    results = []
+    for label, messages in cases:
+        rows = [{"encoding": "draw_event", "bytes": per_segment_bytes(messages)}]
+        rows[0]["bytes_per_segment"] = round(rows[0]["bytes"] / segments(messages), 2)
+        rows.append(measure("draw_batch", messages, encode_message))
+        rows.append(measure("draw_delta", messages, FrameEncoder().encode))
+        rows += snapshot(messages)
+        for row in rows:
+            row["case"] = label
+            row["segments"] = segments(messages)
+        results += rows
+        if not args.json:
+            print(f"{label}: {segments(messages)} segments in {len(messages)} batches")
+            for row in rows:
+                timing = (f"  encode {row['encode_us_per_frame']} us  decode {row['decode_us_per_frame']} us per frame"
+                          if "encode_us_per_frame" in row else "")
+                print(f"  {row['encoding']:<14}{row['bytes']:>10} B  {row['bytes_per_segment']:>6} B/segment{timing}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Replicated board state that converges on every peer without a coordinator.
+
+The board is an add-wins set of strokes.  A stroke is keyed by its
+author's (origin, stroke number) and its points arrive as draw batches
+carrying the stroke's color, width and Lamport clock; (clock, origin,
+number) is the stacking order every replica agrees on.  Removal is
+recorded as tombstones over what the remover had observed:
+
+erase   [origin, number, count] per stroke: its first `count` points are
+        dead.  Points added beyond them (drawn concurrently) survive.
+clear   a causal cut, [origin, number, count] per author: that author's
+        strokes before `number` are dead, and the first `count` points of
+        stroke `number`.  Strokes begun after the cut survive.
+
+Applying the same ops in any order, any number of times, gives the same
+board.  Batches that arrive ahead of a gap in their stroke wait until it
+is filled.  The tombstone of a stroke this replica drew and then lost
+entirely is folded into a per-author floor once the author is `gc_lag`
+strokes further on, so memory stays bounded in long sessions.  The floor
+only passes stroke numbers whose fate is known here, so a stroke that
+arrives late is judged by its own tombstone; the one thing assumed is
+that a stroke wholly erased gets no new batches that many strokes later.
+"""
+import re
+
+from scene import Scene
+
+ALL = 0x3FFFFFFF  # A dead prefix covering the whole stroke
+MAX_PENDING = 256  # Out-of-order batches kept per stroke
+COLOR = re.compile(r"#(?:[0-9a-fA-F]{3}){1,4}|[A-Za-z][A-Za-z0-9 ]{0,31}")  # Tk's #rgb forms or a color name
+
+
+def valid_color(color):
+    """True if color has the shape of a Tk color; whether Tk knows the name is up to Tk."""
+    return isinstance(color, str) and COLOR.fullmatch(color) is not None
+
+
+class Board:
+    def __init__(self, scene=None, gc_lag=64):
+        self.scene = scene or Scene()
+        self.gc_lag = gc_lag
+        self.clock = 0  # Lamport clock
+        self.dead = {}  # Stroke key -> points erased from its start
+        self.cuts = {}  # Origin -> (stroke number, points) cleared
+        self.floors = {}  # Origin -> strokes below this number that we lack and hold no tombstone for are dead
+        self.gone = set()  # Keys of strokes drawn here and then wholly removed, until folded into a floor
+        self.latest = {}  # Origin -> highest stroke number seen
+        self.pending = {}  # Stroke key -> {index: batch} waiting for a gap
+        self.segment_strokes = {}  # User name -> local key of their last id-less stroke
+
+    def tick(self):
+        """Advance the clock for a stroke started here; returns its clock."""
+        self.clock += 1
+        return self.clock
+
+    def _dead_prefix(self, key):
+        origin, number = key
+        if key not in self.scene.strokes and key not in self.dead and number < self.floors.get(origin, 0):
+            return ALL
+        dead = self.dead.get(key, 0)
+        cut = self.cuts.get(origin)
+        if cut is not None:
+            if number < cut[0]:
+                return ALL
+            if number == cut[0]:
+                dead = max(dead, cut[1])
+        return dead
+
+    def _have(self, key):
+        stroke = self.scene.get(key)
+        return stroke.end if stroke is not None else self._dead_prefix(key)
+
+    def add_points(self, key, index, points, clock=0, color="black", width=2, user_name=""):
+        """Apply a draw batch; returns the stroke if it changed, else None.
+
+        `index` None appends to a stroke drawn here.  A None key is a
+        segment from a peer that sends no ids; it is kept locally only.
+        A batch whose color is not one is dropped, the same on every peer.
+        """
+        if not valid_color(color):
+            return None
+        self.clock = max(self.clock, clock)
+        if key is None:
+            return self.scene.add_points(None, 0, points, color, width, user_name, (clock, 0, 0))
+        self._seen_stroke(key)
+        if index is None:
+            index = self._have(key)
+        elif index > self._have(key):
+            waiting = self.pending.setdefault(key, {})
+            if len(waiting) < MAX_PENDING:
+                waiting[index] = (points, clock, color, width, user_name)
+            return None
+        stroke = self._add(key, index, points, clock, color, width, user_name)
+        return self._drain(key) or stroke
+
+    def add_segment(self, segment, color="black", user_name="", clock=0):
+        """Add a draw_event segment from a peer that sends no ids; returns its stroke.
+
+        A segment starting where the user's last one ended extends that
+        stroke, so a drag sent segment by segment is still one polyline.
+        """
+        stroke = self.scene.get(self.segment_strokes.get(user_name))
+        if stroke is not None and tuple(stroke.points[-2:]) == tuple(segment[:2]) and stroke.color == color:
+            return self.scene.add_points(stroke.key, None, segment[2:], color)
+        stroke = self.add_points(None, 0, segment, clock, color, user_name=user_name)
+        self.segment_strokes[user_name] = stroke.key
+        return stroke
+
+    def _add(self, key, index, points, clock, color, width, user_name):
+        dead = self._dead_prefix(key)
+        skip = max(0, dead - index)
+        if 2 * skip >= len(points):
+            return None
+        order = (clock, key[0], key[1])
+        self.gone.discard(key)  # Points drawn beyond an erase bring it back
+        return self.scene.add_points(key, index + skip, points[2 * skip:], color, width, user_name, order)
+
+    def _drain(self, key):
+        """Add waiting batches that now join on; returns the stroke if any did."""
+        stroke = None
+        waiting = self.pending.get(key)
+        while waiting:
+            have = self._have(key)
+            ready = [index for index in waiting if index <= have]
+            if not ready:
+                break
+            index = min(ready)
+            stroke = self._add(key, index, *waiting.pop(index)) or stroke
+        if not waiting:
+            self.pending.pop(key, None)
+        return stroke
+
+    def _seen_stroke(self, key):
+        origin, number = key
+        if number <= self.latest.get(origin, -1):
+            return
+        self.latest[origin] = number
+        self._collect(origin, number)
+
+    def _collect(self, origin, latest):
+        """Raise the author's floor over the strokes we know about, then fold the gone ones below it."""
+        floor = max(1, self.floors.get(origin, 0))  # Stroke numbers start at 1
+        cut = self.cuts.get(origin, (0, 0))[0]
+        while floor + self.gc_lag <= latest:
+            key = (origin, floor)
+            if not (floor < cut or key in self.scene.strokes or key in self.gone or key in self.dead):
+                break  # Never seen here: it may still be on its way
+            floor += 1
+        self.floors[origin] = floor
+        for key in [k for k in self.gone if k[0] == origin and k[1] < floor]:
+            self.gone.discard(key)
+            self.dead.pop(key, None)
+            self.pending.pop(key, None)
+
+    def erase(self, entries):
+        """Apply erase entries; returns (removed strokes, changed strokes)."""
+        for origin, number, count in entries:
+            key = (origin, number)
+            self._seen_stroke(key)
+            self.dead[key] = max(self.dead.get(key, 0), count)
+        return self._apply_tombstones([(origin, number) for origin, number, _ in entries])
+
+    def erase_at(self, x, y, radius):
+        """Erase the strokes near (x, y); returns (entries for peers, removed strokes)."""
+        strokes = self.scene.near(x, y, radius)
+        local = [self.scene.remove(s.key) for s in strokes if not isinstance(s.key, tuple)]
+        entries = [[s.key[0], s.key[1], s.end] for s in strokes if isinstance(s.key, tuple)]
+        removed, _ = self.erase(entries)
+        return entries, local + removed
+
+    def cut(self):
+        """The causal cut of everything this replica has seen, for a clear."""
+        return [[origin, number, self._have((origin, number))] for origin, number in self.latest.items()]
+
+    def clear(self, cut):
+        """Apply a clear's cut; returns (removed strokes, changed strokes)."""
+        local = [self.scene.remove(s.key) for s in self.scene if not isinstance(s.key, tuple)]
+        removed, changed = self._merge_cuts(cut)
+        return local + removed, changed
+
+    def _merge_cuts(self, cut):
+        for origin, number, count in cut:
+            self._seen_stroke((origin, number))
+            self.cuts[origin] = max(self.cuts.get(origin, (0, 0)), (number, count))
+        # Per-stroke tombstones below a cut say nothing more
+        for key in [k for k in self.dead if k[0] in self.cuts and k[1] < self.cuts[k[0]][0]]:
+            del self.dead[key]
+        return self._apply_tombstones([s.key for s in self.scene] + list(self.pending))
+
+    def _apply_tombstones(self, keys):
+        removed, changed = [], []
+        for key in keys:
+            stroke = self.scene.get(key)
+            if stroke is not None:
+                dead = self._dead_prefix(key)
+                if dead >= stroke.end:
+                    removed.append(self.scene.remove(key))
+                    self.gone.add(key)
+                elif dead > stroke.start:
+                    changed.append(self.scene.trim(key, dead))
+            # The dead prefix may have closed the gap in front of waiting batches
+            drained = self._drain(key)
+            if drained is not None and drained not in changed:
+                changed.append(drained)
+        return removed, changed
+
+    def tombstones(self):
+        """Everything removed so far, for a joining peer: {cuts, dead, floors}."""
+        return {
+            "cuts": [[origin, number, count] for origin, (number, count) in self.cuts.items()],
+            "dead": [[origin, number, count] for (origin, number), count in self.dead.items()],
+            "floors": [[origin, floor] for origin, floor in self.floors.items()],
+        }
+
+    def load_tombstones(self, tombstones):
+        """Merge another replica's tombstones; returns (removed strokes, changed strokes)."""
+        removed, changed = self._merge_cuts(tombstones["cuts"])
+        erased, trimmed = self.erase(tombstones["dead"])
+        for origin, floor in tombstones["floors"]:
+            self.floors[origin] = max(self.floors.get(origin, 0), floor)
+        return removed + erased, changed + trimmed
@@ -0,0 +1,105 @@
+"""LAN peer discovery over UDP multicast.
+
+Every peer started with --discover announces its listening address to a
+multicast group every couple of seconds and listens for the others'.  An
+announce is one protocol frame (protocol.py):
+
+    {"type": "announce", "origin": <message id origin>, "addr": [host, port]}
+
+A peer listening on 0.0.0.0 is reached at the address its datagrams come
+from.  Announces stay on the local network (TTL 1).
+"""
+import random
+import socket
+import struct
+import threading
+import traceback
+
+from protocol import MessageDecoder, ProtocolError, encode_message
+
+GROUP = "239.255.77.77"
+PORT = 45077
+ANNOUNCE_INTERVAL = 2.0  # Seconds, give or take a fifth
+
+
+def _announced(message):
+    """(origin, (host, port)) of a well-formed announce, else None; anyone on the LAN can send us one."""
+    if not isinstance(message, dict) or message.get("type") != "announce":
+        return None
+    origin, address = message.get("origin"), message.get("addr")
+    if type(origin) is not int or not isinstance(address, list) or len(address) != 2:
+        return None
+    host, port = address
+    if not isinstance(host, str) or type(port) is not int or not 0 < port < 65536:
+        return None
+    return origin, (host, port)
+
+
+class Discovery:
+    """Announces a peer and calls on_peer(origin, (host, port)) for each announce heard.
+
+    Our own announces are skipped; the others' repeat, so on_peer has to
+    cope with peers it already knows.
+    """
+
+    def __init__(self, origin, address, on_peer, group=GROUP, port=PORT, interval=ANNOUNCE_INTERVAL):
+        self.origin = origin
+        self.address = address
+        self.on_peer = on_peer
+        self.group = group
+        self.port = port
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # Several peers on one host
+        self.receiver.bind(("", port))
+        self.receiver.settimeout(interval)  # So that stop() is noticed
+        membership = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+        self.receiver.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def start(self):
+        threading.Thread(target=self._listen, name="discovery", daemon=True).start()
+        threading.Thread(target=self._announce, name="announce", daemon=True).start()
+        return self
+
+    def _announce(self):
+        frame = encode_message({"type": "announce", "origin": self.origin, "addr": list(self.address)})
+        while not self.stopped.is_set():
+            try:
+                self.sender.sendto(frame, (self.group, self.port))
+            except OSError:
+                pass  # No route to the group yet, e.g. the network is down
+            self.stopped.wait(self.interval * random.uniform(0.8, 1.2))
+
+    def _listen(self):
+        while not self.stopped.is_set():
+            try:
+                data, (source, _) = self.receiver.recvfrom(2048)
+                messages = MessageDecoder().feed(data)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            except ProtocolError:
+                continue
+            for message in messages:
+                peer = _announced(message)
+                if peer is None or peer[0] == self.origin:
+                    continue  # Not an announce we understand, or our own
+                origin, (host, port) = peer
+                if host in ("", "0.0.0.0"):
+                    host = source
+                try:
+                    self.on_peer(origin, (host, port))
+                except Exception:
+                    traceback.print_exc()  # Keep listening; the next announce may do better
+
+    def stop(self):
+        self.stopped.set()
+        self.receiver.close()
+        self.sender.close()
@@ -0,0 +1,338 @@
+"""GUI-free core of a whiteboard peer: networking, board state and sync.
+
+PeerEngine joins the overlay, drops duplicate messages, relays the rest,
+keeps the replicated board (board.py) and serves and fetches late-joiner
+syncs (sync.py).  Its LinkManager (links.py) handshakes, heartbeats and
+redials its links, and discover() finds peers on the LAN (discovery.py).
+record() writes what it handles and sends to a session recording.
+The Tk windows are thin clients on top of it and node.py runs it with
+no window at all.
+
+Board work is handed to call() so that it runs on one thread at a time:
+by default in place under a lock, while the Tk peers queue it for their
+frame scheduler.  Subclasses are told about board changes through
+render(), remove(), name_tag(), board_cleared() and applied().
+What it handles is counted in a metrics.Metrics, reported by stats().
+"""
+import threading
+import time
+
+from board import Board
+from discovery import Discovery
+from journal import Journal
+from links import LinkManager
+from mesh import MessageIds, SeenSet
+from metrics import Metrics
+from overlay import create_overlay
+from recording import Recorder
+from strokes import StrokeBatcher
+from sync import BOARD_OPS, BoardLog, JoinSync, load_strokes, send_board
+from transport import create_transport
+
+ERASER_RADIUS = 8
+
+
+class PeerEngine:
+    def __init__(self, host, port, user_name="", batch_window=0.012, batch_points=64, transport="threads",
+                 overlay="mesh", manage_links=True, local=True, **overlay_options):
+        self.host = host
+        self.port = port
+        self.user_name = user_name
+        self.transport = create_transport(transport, self.process_message, on_accept=self.on_accept,
+                                          on_close=self.on_close, local=local)  # Same-host peers over Unix sockets
+        self.connections = self.transport.connections
+        self.metrics = Metrics()
+        self.overlay = create_overlay(overlay, self, **overlay_options)
+        self.known_peers = set()  # (host, port) of peers we connected to or heard of
+        self.links = LinkManager(self, active=manage_links)
+        self.discovery = None
+        self.recorder = None
+        self.ids = MessageIds()
+        self.seen = SeenSet()
+        self.board = Board()
+        self.scene = self.board.scene
+        self.board_lock = threading.RLock()
+        self.board_log = BoardLog()  # What a joining peer is sent
+        self.join_sync = JoinSync()
+        self.batcher = StrokeBatcher(self.send_batch, batch_window, batch_points)
+        self.color = "black"
+        self.stroke_key = None  # Board key of the stroke we are drawing
+        self.stroke_clock = 0
+
+    # Hooks for subclasses; called on the board's thread
+
+    def render(self, stroke):
+        """A stroke was added to or changed."""
+
+    def remove(self, stroke):
+        """A stroke was erased or cleared."""
+
+    def name_tag(self, user_name, x, y, color):
+        """A user drew at (x, y)."""
+
+    def board_cleared(self):
+        """A clear was applied."""
+
+    def applied(self, message):
+        """A board op or sync chunk from a peer was applied."""
+
+    def call(self, function, *args):
+        """Run board work; network threads hand it over through here."""
+        with self.board_lock:
+            function(*args)
+
+    # Networking
+
+    def start_server(self):
+        self.transport.listen(self.host, self.port)
+        self.links.start()
+
+    def connect_to_peer(self, peer_host, peer_port, sync=True):
+        """Join through a peer and, unless told not to, fetch its board.
+
+        Returns the connection, or None if the peer could not be reached;
+        the link manager tries again later.
+        """
+        self.known_peers.add((peer_host, peer_port))
+        return self.links.dial(peer_host, peer_port, sync)
+
+    def discover(self, **options):
+        """Announce ourselves on the LAN and link up with the peers heard there."""
+        self.discovery = Discovery(self.ids.origin, (self.host, self.port), self.on_discovered, **options).start()
+
+    def on_discovered(self, origin, address):
+        self.known_peers.add(address)
+        # Only the lower origin dials, so two peers hearing each other do not cross
+        if origin > self.ids.origin:
+            self.overlay.discovered(address)
+
+    def on_accept(self, connection):
+        self.links.opened(connection)
+
+    def on_close(self, connection):
+        self.links.closed(connection)
+        self.join_sync.on_close(connection)
+        self.overlay.on_close(connection)
+
+    def queue_depths(self):
+        """(address, stats) of each connection; local ones may share an address."""
+        return [(connection.address, connection.stats()) for connection in self.connections]
+
+    def stats(self):
+        """Counters, histograms and each connection's queue and traffic, as JSON-ready dicts."""
+        stats = self.metrics.snapshot()
+        stats["connections"] = [dict(counters, address="%s:%s" % address[:2])
+                                for address, counters in self.queue_depths()]
+        stats["board"] = {"strokes": len(self.scene), "segments": self.scene.segment_count}
+        return stats
+
+    def process_message(self, message, sender_connection):
+        self.metrics.count("in." + message["type"])
+        if not self.seen.is_new(message):
+            self.metrics.count("duplicates")
+            return  # Already handled; it came round again over another path
+        if self.recorder is not None:
+            self.recorder.write(message)
+        self.join_sync.on_message(sender_connection)
+        if self.links.on_message(message, sender_connection):
+            return
+        if self.overlay.on_message(message, sender_connection):
+            return
+        if message["type"] == "sync_request":
+            # Behind the ops handed to call() before it, which the joiner missed
+            self.call(self.serve_sync, sender_connection)
+            return
+        if message["type"] == "sync_strokes":
+            self.call(self.load_board, message)
+            return
+        if message["type"] == "sync_tombstones":
+            self.call(self.load_tombstones, message)
+            return
+        if message["type"] == "sync_done":
+            self.call(self.finish_sync, sender_connection)
+            return
+        if message.get("sync"):
+            self.call(self.apply_op, message)
+            return  # Logged op of the board we are joining; the others have it
+        if message["type"] == "peer_list":
+            self.connect_to_listed(message["data"])
+            return
+
+        # Relay first: applying the op must not add to every hop's latency
+        self.relay_message(message, sender_connection)
+        if message["type"] in BOARD_OPS:
+            self.call(self.apply_op, message)
+
+    def serve_sync(self, connection):
+        """Capture the board for a joiner on the board's thread and send it from another."""
+        messages = self.board_log.messages()
+        threading.Thread(target=send_board, args=(connection, messages), daemon=True).start()
+
+    def connect_to_listed(self, peers):
+        # Only the full mesh connects to every peer it hears of
+        if self.overlay.name != "mesh":
+            return
+        for peer in map(tuple, peers):
+            self.known_peers.add(peer)
+            self.links.connect(peer)
+
+    def send_peer_list(self, connection):
+        """Tell a new neighbour where our other neighbours listen."""
+        peers = {other.peer_address for other in self.connections
+                 if other is not connection and other.peer_address is not None and not other.closed}
+        connection.send({"type": "peer_list", "data": [list(peer) for peer in peers]})
+
+    def relay_message(self, message, sender_connection):
+        start = time.perf_counter()
+        targets = self.overlay.targets(message, sender_connection)
+        # Our own messages may come from the Tk thread, which must never wait
+        # on a stalled peer; relays from the network threads may.
+        block = sender_connection is not None
+        for connection in targets:
+            connection.send(message, block)
+        self.metrics.observe("relay", time.perf_counter() - start)
+        if targets:
+            self.metrics.count("out." + message["type"], len(targets))
+
+    def broadcast(self, message):
+        """Stamp a message originating here and send it to the overlay; returns it."""
+        self.ids.stamp(message)
+        self.seen.add(message["id"])
+        if message["type"] in BOARD_OPS:
+            self.board_log.append(message, self.board)
+        if self.recorder is not None:
+            self.recorder.write(message)
+        self.relay_message(message, None)
+        return message
+
+    def close(self):
+        self.links.stop()
+        if self.discovery is not None:
+            self.discovery.stop()
+        self.transport.close()
+        if self.board_log.journal is not None:
+            self.board_log.journal.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def record(self, path):
+        """Append every message handled from peers and broadcast from here, with its time, to path."""
+        self.recorder = Recorder(path)
+
+    def open_journal(self, path, compact=True):
+        """Rebuild the board from a journal file (journal.py) and journal every op from now on.
+
+        Call it before connecting to peers, on the board's thread.  With
+        compact, a fresh checkpoint of the board is written straight away.
+        """
+        journal = Journal(path)
+        for message in journal.replay():
+            if message["type"] == "sync_strokes":
+                self.update_view((), load_strokes(self.board, message["strokes"]))
+            elif message["type"] == "sync_tombstones":
+                self.update_view(*self.board.load_tombstones(message))
+            elif message["type"] in BOARD_OPS:
+                self.apply_to_board(message)
+        self.board_log = BoardLog(journal=journal)
+        if compact:
+            self.board_log.compact(self.board)
+
+    # Board work, on the board's thread
+
+    def apply_op(self, message):
+        start = time.perf_counter()
+        self.apply_to_board(message)
+        self.board_log.append(message, self.board)
+        self.metrics.observe("apply", time.perf_counter() - start)
+        self.applied(message)
+
+    def apply_to_board(self, message):
+        if message["type"] == "clear":
+            # A clear from a peer that sends no cut clears what we have seen
+            self.clear(message["cut"] if "cut" in message else self.board.cut())
+        elif message["type"] == "erase":
+            self.update_view(*self.board.erase(message["strokes"]))
+        else:
+            self.draw_from_network(message)
+
+    def load_board(self, message):
+        for stroke in load_strokes(self.board, message["strokes"]):
+            self.render(stroke)
+        self.applied(message)
+
+    def load_tombstones(self, message):
+        self.update_view(*self.board.load_tombstones(message))
+        self.applied(message)
+
+    def finish_sync(self, connection):
+        if self.join_sync.finish(connection):
+            self.board_log.compact(self.board)
+
+    def update_view(self, removed, changed):
+        for stroke in removed:
+            self.remove(stroke)
+        for stroke in changed:
+            self.render(stroke)
+
+    def draw_from_network(self, message):
+        event = message["data"]
+        user_name = event.get("user_name", "")
+        if "points" in event:
+            # A stroke is known to every peer by its author's id origin and number
+            key = (message["id"][0], event["stroke"]) if "id" in message else None
+            stroke = self.board.add_points(key, event["index"], event["points"], event["clock"],
+                                           event["color"], event["width"], user_name)
+            x, y = event["points"][-2:]
+        else:
+            segment = (event["prev_x"], event["prev_y"], event["x"], event["y"])
+            stroke = self.board.add_segment(segment, user_name=user_name)
+            x, y = event["x"], event["y"]
+        if stroke is not None:
+            self.render(stroke)
+            self.name_tag(user_name, x, y, stroke.color)
+
+    def begin_stroke(self, x, y):
+        """Start a stroke of ours at (x, y) in the current color."""
+        self.batcher.begin(x, y)
+        self.stroke_key = (self.ids.origin, self.batcher.stroke)
+        self.stroke_clock = self.board.tick()
+        self.board.add_points(self.stroke_key, 0, (x, y), self.stroke_clock, self.color, user_name=self.user_name)
+
+    def add_point(self, x, y):
+        """Extend our stroke; the point goes out with the next batch."""
+        stroke = self.board.add_points(self.stroke_key, None, (x, y), self.stroke_clock, self.color,
+                                       user_name=self.user_name)
+        if stroke is not None:  # None once a peer has erased it
+            self.render(stroke)
+        self.batcher.add(x, y)
+        if self.user_name:
+            self.name_tag(self.user_name, x, y, self.color)
+
+    def flush_stroke(self):
+        self.batcher.flush()
+
+    def end_stroke(self):
+        self.batcher.end()
+
+    def send_batch(self, stroke, index, points):
+        batch = {"stroke": stroke, "index": index, "points": points, "user_name": self.user_name,
+                 "clock": self.stroke_clock, "color": self.color}
+        self.broadcast({"type": "draw_batch", "data": batch})
+
+    def erase_at(self, x, y, radius=ERASER_RADIUS):
+        """Erase the strokes near (x, y) and tell the peers how much of each."""
+        entries, erased = self.board.erase_at(x, y, radius)
+        for stroke in erased:
+            self.remove(stroke)
+        if entries:
+            self.broadcast({"type": "erase", "strokes": entries})
+
+    def clear(self, cut=None):
+        """Clear the board; a peer's clear only removes what its cut covers."""
+        local = cut is None
+        if local:
+            cut = self.board.cut()
+        self.update_view(*self.board.clear(cut))
+        self.board_cleared()
+        if local:
+            self.broadcast({"type": "clear", "cut": cut})
@@ -1,21 +1,21 @@
 import tkinter as tk
 from tkinter import *
-import socket
+import sys
 import threading
-import pickle
+from engine import ERASER_RADIUS, PeerEngine
+from metrics import instrumented
+from render import FrameScheduler
+from viewport import ViewportView
 
 
-class WhiteboardPeer:
-    def __init__(self, host, port, user_name):
-        self.host = host
-        self.port = port
-        self.user_name = user_name
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connections = []
-        self.is_running = True
+class WhiteboardPeer(PeerEngine):
+    """A Tk window on a PeerEngine: draws its board and feeds it the mouse."""
+
+    def __init__(self, host, port, user_name, batch_window=0.012, batch_points=64, transport="threads", overlay="mesh"):
+        super().__init__(host, port, user_name, batch_window, batch_points, transport, overlay)
+        self.flush_job = None
 
         # Tkinter GUI setup
-        self.color = "black"
         self.root = tk.Tk()
         self.root.geometry("850x400+150+50")
         self.root.configure(bg="#f2f3f5")
@@ -25,6 +25,8 @@ class WhiteboardPeer:
         # Canvas
         self.canvas = Canvas(self.root, width=730, height=300, bg="white", cursor="hand2", relief="groove", bd=2)
         self.canvas.place(x=100, y=10)
+        self.view = ViewportView(self.canvas, self.scene)  # Wheel zooms, middle button pans
+        self.frames = FrameScheduler(self.root, self.view, metrics=self.metrics)  # Runs the board work once per frame
 
         # Color Palette
         self.colors = Canvas(self.root, bg="#ffffff", width=37, height=300, bd=0, relief="flat")
@@ -41,9 +43,14 @@ class WhiteboardPeer:
         self.display_palette()
         self.canvas.bind("<B1-Motion>", self.draw)
         self.canvas.bind('<Button-1>', self.locate_xy)
+        self.canvas.bind("<ButtonRelease-1>", self.stop_draw)
+        self.canvas.bind("<Button-3>", self.erase)
+        self.canvas.bind("<B3-Motion>", self.erase)
+        self.view.bind_navigation()
 
-        # Networking thread
-        threading.Thread(target=self.start_server, daemon=True).start()
+        # Networking
+        self.start_server()
+        self.frames.start()
 
     def open_connect_dialog(self):
         dialog = Toplevel(self.root)
@@ -68,68 +75,56 @@ class WhiteboardPeer:
         Button(dialog, text="Connect", command=connect_to_peer, bg="#0078D7", fg="white", font=("Arial", 10, "bold"), relief="raised").grid(row=2, column=0, columnspan=2, pady=20)
 
     def start_server(self):
-        self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
+        super().start_server()
         print(f"Listening on {self.host}:{self.port}")
-        while self.is_running:
-            connection, address = self.socket.accept()
-            self.connections.append(connection)
-            threading.Thread(target=self.handle_client, args=(connection,), daemon=True).start()
-
-    def connect_to_peer(self, peer_host, peer_port):
-        connection = socket.create_connection((peer_host, peer_port))
-        self.connections.append(connection)
-        threading.Thread(target=self.handle_client, args=(connection,), daemon=True).start()
-
-    def handle_client(self, connection):
-        while self.is_running:
-            try:
-                data = connection.recv(4096)
-                if data:
-                    message = pickle.loads(data)
-                    self.process_message(message, connection)
-            except (socket.error, EOFError):
-                break
-        connection.close()
-
-    def process_message(self, message, sender_connection):
-        if message["type"] == "draw_event":
-            self.root.after(0, self.draw_from_network, message["data"])
-        elif message["type"] == "clear":
-            self.root.after(0, self.clear_canvas, False)
-        elif message["type"] == "color_change":
-            self.root.after(0, lambda: setattr(self, "color", message["color"]))
-
-        self.relay_message(message, sender_connection)
-
-    def relay_message(self, message, sender_connection):
-        for connection in self.connections:
-            if connection != sender_connection:
-                try:
-                    connection.sendall(pickle.dumps(message))
-                except socket.error:
-                    self.connections.remove(connection)
+
+    def frame_stats(self):
+        return self.frames.stats()
+
+    def stats(self):
+        return dict(super().stats(), frames=self.frame_stats())
+
+    # The board lives on the Tk thread and the canvas follows it
+
+    def call(self, function, *args):
+        self.frames.call(function, *args)
+
+    def render(self, stroke):
+        self.frames.render(stroke)
+
+    def remove(self, stroke):
+        self.frames.remove(stroke)
+
+    def name_tag(self, user_name, x, y, color):
+        self.frames.name_tag(user_name, x, y, color)
+
+    def board_cleared(self):
+        self.frames.clear_name_tags()
 
     def draw(self, event):
-        self.canvas.create_line(self.prev_x, self.prev_y, event.x, event.y, fill=self.color, width=2)
-        event_data = {
-            "prev_x": self.prev_x,
-            "prev_y": self.prev_y,
-            "x": event.x,
-            "y": event.y,
-            "user_name": self.user_name,
-        }
-        self.relay_message({"type": "draw_event", "data": event_data}, None)
-        self.prev_x, self.prev_y = event.x, event.y
-
-        self.display_name(event.x, event.y, self.user_name)
-
-    def draw_from_network(self, event):
-        self.canvas.create_line(event["prev_x"], event["prev_y"], event["x"], event["y"], fill=self.color, width=2)
-        self.display_name(event["x"], event["y"], event["user_name"])
+        x, y = self.view.to_world(event.x, event.y)
+        self.add_point(x, y)
+        if self.batcher.pending and self.flush_job is None:
+            self.flush_job = self.root.after(int(self.batcher.window * 1000), self.flush_stroke)
+        self.prev_x, self.prev_y = x, y
+
+    def flush_stroke(self):
+        self.flush_job = None
+        super().flush_stroke()
+
+    def stop_draw(self, event):
+        if self.flush_job is not None:
+            self.root.after_cancel(self.flush_job)
+            self.flush_job = None
+        self.end_stroke()
 
     def locate_xy(self, event):
-        self.prev_x, self.prev_y = event.x, event.y
+        self.prev_x, self.prev_y = self.view.to_world(event.x, event.y)
+        self.begin_stroke(self.prev_x, self.prev_y)
+
+    def erase(self, event):
+        x, y = self.view.to_world(event.x, event.y)
+        self.erase_at(x, y, ERASER_RADIUS / self.view.viewport.scale)
 
     def display_palette(self):
         colors = ['black', 'grey', 'brown4', 'red', 'blue', 'orange', 'yellow', 'green', 'purple']
@@ -138,18 +133,11 @@ class WhiteboardPeer:
             self.colors.tag_bind(rect, '<Button-1>', lambda event, c=color: self.change_color(c))
 
     def change_color(self, new_color):
+        # Strokes carry their own color, so this is not sent to peers
         self.color = new_color
-        self.relay_message({"type": "color_change", "color": new_color}, None)
 
-    def clear_canvas(self, broadcast=True):
-        self.canvas.delete('all')
-        self.display_palette()
-        if broadcast:
-            threading.Thread(target=lambda: self.relay_message({"type": "clear"}, None), daemon=True).start()
-
-    def display_name(self, x, y, name):
-        self.canvas.delete("name_tag")
-        self.canvas.create_text(x + 15, y - 10, text=name, fill=self.color, font=("Arial", 10), tags="name_tag")
+    def clear_canvas(self):
+        self.clear()
 
     def start_gui(self):
         self.root.mainloop()
@@ -178,13 +166,24 @@ def show_input_dialog():
         port = int(port_entry.get())
         name = name_entry.get()
         input_root.destroy()
-        peer = WhiteboardPeer(host, port, name)
-        peer.start_gui()
+        peer = WhiteboardPeer(host, port, name, transport="asyncio" if "--asyncio" in sys.argv else "threads", overlay=option("overlay", "mesh"))
+        if option("journal"):
+            peer.open_journal(option("journal"))  # Reopen the board saved there and keep saving to it
+        if "--discover" in sys.argv:
+            peer.discover()  # Link up with the peers announcing themselves on the LAN
+        if option("record"):
+            peer.record(option("record"))  # Replay it with replay.py
+        with instrumented(peer.stats, option("stats-port"), option("profile")):
+            peer.start_gui()
 
     Button(input_root, text="Submit", command=submit_details, bg="#0078D7", fg="white", font=("Arial", 10, "bold"), relief="raised").grid(row=3, column=0, columnspan=2, pady=20)
 
     input_root.mainloop()
 
 
+def option(name, default=None):
+    return next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith(f"--{name}=")), default)
+
+
 if __name__ == "__main__":
     show_input_dialog()
@@ -0,0 +1,237 @@
+"""Append-only board journal: save, reopen and export a board.
+
+A journal file is a run of protocol frames (protocol.py), the same ones
+that go over the wire.  Every board op a peer applies is appended as it
+happens.  Now and then the board is checkpointed: a block of sync_strokes
+and sync_tombstones chunks between a {"type": "checkpoint"} and a
+{"type": "checkpoint_end"} frame.  The checkpoint frame says how many
+bytes of ops before it the snapshot did not include yet (it is encoded on
+a background thread while ops keep being appended).  Reopening
+memory-maps the file, skips to the last complete checkpoint by reading
+only frame headers, loads its chunks and replays the ops after it.  A
+board of a million segments is a few dozen chunks, not a million records.
+When most of the file is history before the last checkpoint, the rest is
+copied to a new file that replaces it.
+
+The same messages are what a late joiner is sent (sync.BoardLog) and
+what `python journal.py FILE --svg OUT` exports.
+"""
+import argparse
+import mmap
+import os
+import threading
+import time
+from xml.sax.saxutils import quoteattr
+
+from protocol import HEADER, JSON, decode_payload, encode_message
+from sync import snapshot_chunks
+
+SYNC_CHUNKS = ("sync_strokes", "sync_tombstones")
+MARKERS = {"checkpoint": 1, "checkpoint_end": -1}
+
+
+def _frames(view):
+    """Yield (offset, end, code) of each whole frame; stops at a torn tail."""
+    offset = 0
+    while offset + HEADER.size <= len(view):
+        length, code = HEADER.unpack_from(view, offset)
+        end = offset + HEADER.size + length
+        if end > len(view):
+            return
+        yield offset, end, code
+        offset = end
+
+
+def _marker(view, offset, end, code):
+    """A checkpoint marker frame as a message, else None; only JSON frames are parsed."""
+    if code != JSON:
+        return None
+    message = decode_payload(code, view, offset + HEADER.size, end)
+    return message if message["type"] in MARKERS else None
+
+
+def board_messages(view):
+    """Yield the messages that rebuild the board in a journal: snapshot chunks, then ops.
+
+    Ops carry no sync flag; the caller decides how to treat them.
+    """
+    last = None  # (start of the ops after the snapshot, checkpoint start, checkpoint end)
+    start = back = None
+    for offset, end, code in _frames(view):
+        marker = _marker(view, offset, end, code)
+        if marker is None:
+            continue
+        if marker["type"] == "checkpoint":
+            start, back = offset, marker["back"]
+        elif start is not None:
+            last = (start - back, start, end)
+            start = None
+    ops_from = 0
+    if last is not None:
+        ops_from, checkpoint_start, checkpoint_end = last
+        for offset, end, code in _frames(view[checkpoint_start:checkpoint_end]):
+            message = decode_payload(code, view, checkpoint_start + offset + HEADER.size, checkpoint_start + end)
+            if message["type"] in SYNC_CHUNKS:
+                yield message
+    depth = 0  # Inside a checkpoint block
+    for offset, end, code in _frames(view[ops_from:]):
+        message = decode_payload(code, view, ops_from + offset + HEADER.size, ops_from + end)
+        if message["type"] in MARKERS:
+            depth += MARKERS[message["type"]]
+        elif depth == 0:
+            yield message
+
+
+class Journal:
+    """One peer's journal file, appended to by the board's thread."""
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()  # One checkpoint written at a time
+        self.size = self._valid_size()
+        with open(path, "ab") as file:
+            file.truncate(self.size)  # Drop a frame torn by a crash
+        self.file = open(path, "ab")
+        self.live_from = 0  # Everything before this is history the last checkpoint covers
+
+    def _valid_size(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return 0
+        size = open_block = None
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset, end, code in _frames(view):
+                    size = end
+                    marker = _marker(view, offset, end, code)
+                    if marker is not None:
+                        open_block = offset if marker["type"] == "checkpoint" else None
+        # A checkpoint cut short by a crash would hide the ops appended after it
+        return open_block if open_block is not None else size or 0
+
+    def replay(self):
+        """Yield the journalled board's messages, read from a memory map of the file."""
+        if self.size == 0:
+            return
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield from board_messages(view)
+            finally:
+                view.release()
+
+    def append(self, message):
+        if message.get("sync"):
+            message = {key: value for key, value in message.items() if key != "sync"}
+        frame = encode_message(message)
+        with self.lock:
+            self.file.write(frame)
+            self.file.flush()
+            self.size += len(frame)
+
+    def checkpoint(self, snapshot):
+        """Write a snapshot of the board as it is now, after the ops appended so far.
+
+        Call it from the board's thread; the chunks are encoded and written
+        on a background thread.
+        """
+        with self.lock:
+            since = self.size
+        threading.Thread(target=self._write_checkpoint, args=(snapshot, since), daemon=True).start()
+
+    def _write_checkpoint(self, snapshot, since):
+        with self.checkpoint_lock:
+            chunks = b"".join(encode_message(message) for message in snapshot_chunks(snapshot))
+            with self.lock:
+                if self.file.closed:
+                    return
+                block = (encode_message({"type": "checkpoint", "back": self.size - since}) + chunks
+                         + encode_message({"type": "checkpoint_end"}))
+                self.file.write(block)
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+                self.size += len(block)
+                self.live_from = since
+                if self.live_from > self.size // 2:
+                    self._rewrite()
+
+    def _rewrite(self):
+        """Keep only the last checkpoint and the ops it needs; holding self.lock."""
+        self.file.close()
+        temporary = self.path + ".tmp"
+        with open(self.path, "rb") as source, open(temporary, "wb") as target:
+            source.seek(self.live_from)
+            while True:
+                data = source.read(1 << 20)
+                if not data:
+                    break
+                target.write(data)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, self.path)
+        self.size -= self.live_from
+        self.live_from = 0
+        self.file = open(self.path, "ab")
+
+    def sync_messages(self):
+        """The board as a joining peer is sent it: snapshot chunks, then ops flagged sync.
+
+        The journal is read now; the messages are decoded as they are taken.
+        """
+        with self.lock:
+            with open(self.path, "rb") as file:
+                file.seek(self.live_from)
+                data = file.read(self.size - self.live_from)
+        return _flag_sync(board_messages(memoryview(data)))
+
+    def close(self):
+        with self.checkpoint_lock, self.lock:
+            self.file.close()
+
+
+def _flag_sync(messages):
+    for message in messages:
+        if message["type"] not in SYNC_CHUNKS:
+            message["sync"] = True
+        yield message
+
+
+def export_svg(board, path):
+    """Write the board's strokes, bottom to top, as an SVG drawing."""
+    strokes = sorted(board.scene, key=lambda stroke: stroke.order)
+    boxes = [stroke.bbox for stroke in strokes if stroke.bbox]
+    width = max((box[2] for box in boxes), default=0) + 10
+    height = max((box[3] for box in boxes), default=0) + 10
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                   f'fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+        for stroke in strokes:
+            points = " ".join(f"{x},{y}" for x, y in zip(stroke.points[0::2], stroke.points[1::2]))
+            # Colors and widths come from peers: quote them, whatever they hold
+            file.write(f'<polyline stroke={quoteattr(str(stroke.color))} stroke-width={quoteattr(str(stroke.width))}'
+                       f' points="{points}"/>\n')
+        file.write("</svg>\n")
+
+
+def main():
+    from engine import PeerEngine
+
+    parser = argparse.ArgumentParser(description="Replay a board journal and optionally export it.")
+    parser.add_argument("journal")
+    parser.add_argument("--svg", metavar="FILE", help="write the board as an SVG drawing")
+    args = parser.parse_args()
+
+    peer = PeerEngine("127.0.0.1", 0)
+    start = time.perf_counter()
+    peer.open_journal(args.journal, compact=False)
+    print(f"{len(peer.scene)} strokes, {peer.scene.segment_count} segments "
+          f"replayed in {time.perf_counter() - start:.2f} s from {os.path.getsize(args.journal)} bytes")
+    if args.svg:
+        export_svg(peer.board, args.svg)
+    peer.close()
+
+
+if __name__ == "__main__":
+    main()
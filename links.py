@@ -0,0 +1,252 @@
+"""Keeping a peer's links up: handshake, duplicate links, heartbeats and reconnects.
+
+Both ends of a new link send a hello with their message id origin and
+listening address:
+
+    {"type": "hello", "origin": 1234, "addr": [host, port]}
+
+so every link knows who is at the other end, whoever dialed it.  Two
+peers that dial each other at once (after hearing each other's announce
+or peer_list) end up with two links; both ends keep the one dialed by the
+peer with the lower origin and close the other.  A new mesh neighbour is
+sent our peer_list, so a joiner meets the whole mesh through one peer.
+A link dialed over a Unix socket is closed if the hello's address is not
+the one dialed.
+
+Every HEARTBEAT_INTERVAL, a link that had nothing to send gets a ping,
+and a link we heard nothing on for DEAD_AFTER seconds is closed: a peer
+that crashed or lost its network goes away without its socket ever
+saying so.  When a link to a live peer's address drops, the end with the
+lower origin redials it, after 0.5, 1, 2, ... up to 30 seconds with
+jitter, so a restarting peer is not hit by everyone at once.
+"""
+import random
+import threading
+import time
+
+from transport import same_listener
+
+HEARTBEAT_INTERVAL = 1.0
+DEAD_AFTER = 5.0  # Seconds of silence; a quiet link is pinged every 2 intervals
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+MAX_ATTEMPTS = 8  # Redials of one address before it is forgotten
+LINK_MESSAGES = ("hello", "ping")
+
+
+def backoff(attempt):
+    """Seconds to wait before redial number `attempt` (from 0): exponential, with jitter."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+class _Link:
+    __slots__ = ("connection", "origin", "received", "heard", "sent")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.origin = None  # From the peer's hello
+        self.received = 0
+        self.heard = time.monotonic()
+        self.sent = 0
+
+
+class LinkManager:
+    """The links of one PeerEngine.
+
+    dial() replaces a bare overlay join: a refused connection is retried
+    with backoff rather than raised.  The engine reports links opening and
+    closing and hands over the hello and ping messages.  With active off,
+    links are left alone, as the benchmarks' fixed topologies need.
+    """
+
+    def __init__(self, peer, active=True, interval=HEARTBEAT_INTERVAL, dead_after=DEAD_AFTER):
+        self.peer = peer
+        self.active = active
+        self.interval = interval
+        self.dead_after = dead_after
+        self.links = {}  # Connection -> _Link
+        self.peers = {}  # Origin -> the _Link kept to that peer
+        self.duplicates = set()  # Connections closed for being a second link to a peer
+        self.dialing = set()  # Addresses being connected to
+        self.attempts = {}  # Address -> redials since it was last reached
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.active:
+            threading.Thread(target=self._heartbeat, name="heartbeat", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    # Opening links
+
+    def dial(self, host, port, sync=False, retry=True):
+        """Connect to a peer through the overlay; returns the connection, or None if that failed.
+
+        A failed dial is tried again later, unless retry is off or links are not managed.
+        """
+        address = (host, port)
+        self.peer.metrics.count("links.dial")
+        with self.lock:
+            self.dialing.add(address)
+        try:
+            connection = self.peer.overlay.join(host, port)
+        except OSError as error:
+            self.peer.metrics.count("links.failed")
+            if address not in self.attempts:
+                print(f"Could not connect to {host}:{port}: {error}", flush=True)  # Not again for each redial
+            if retry:
+                self._retry(address, sync)
+            return None
+        finally:
+            with self.lock:
+                self.dialing.discard(address)
+        if sync:
+            self.peer.join_sync.request(connection)
+        return connection
+
+    def connect(self, address, sync=False):
+        """Dial a peer we heard of in the background, unless we are linked to it or dialing it."""
+        if not self.active or address == (self.peer.host, self.peer.port) or self.linked(address):
+            return
+        with self.lock:
+            if address in self.dialing:
+                return
+            self.dialing.add(address)  # dial() adds it again; this only closes the race
+        threading.Thread(target=self.dial, args=(*address, sync, False), daemon=True).start()
+
+    def linked(self, address):
+        return any(connection.peer_address == address and not connection.closed
+                   for connection in self.peer.connections)
+
+    def opened(self, connection):
+        """A link came up, dialed by the overlay or accepted; say hello on it."""
+        if not self.active:
+            return
+        with self.lock:
+            self.links.setdefault(connection, _Link(connection))
+        if connection.closed:
+            self._forget(connection)  # It closed before we got to it; closed() may have run already
+            return
+        connection.send({"type": "hello", "origin": self.peer.ids.origin, "addr": [self.peer.host, self.peer.port]})
+
+    # Messages
+
+    def on_message(self, message, connection):
+        """Handle a hello or ping; returns False for anything else."""
+        if message["type"] not in LINK_MESSAGES:
+            return False
+        if message["type"] == "hello" and self.active:
+            self._hello(message, connection)
+        return True
+
+    def _hello(self, message, connection):
+        origin = message["origin"]
+        address = (message["addr"][0], int(message["addr"][1]))
+        if origin == self.peer.ids.origin:
+            connection.close()  # We dialed ourselves, e.g. our own announce
+            return
+        if connection.local and connection.dialed and not same_listener(connection.address, address):
+            # Whoever owns that Unix socket is not the peer we dialed
+            print(f"Closing the connection to {connection.address}: the peer there listens on {address}", flush=True)
+            self.peer.metrics.count("links.mismatch")
+            connection.close()
+            return
+        if address[0] in ("", "0.0.0.0"):
+            address = (connection.address[0], address[1])
+        connection.peer_address = address
+        with self.lock:
+            link = self.links.setdefault(connection, _Link(connection))  # Its hello beat opened()
+            link.origin = origin
+            self.attempts.pop(address, None)
+            kept = self.peers.get(origin)
+            duplicate = None
+            if kept is not None and kept is not link and not kept.connection.closed:
+                # Both ends keep the link the lower origin dialed
+                lower = min(origin, self.peer.ids.origin)
+                if self._dialer(kept) == self._dialer(link) or self._dialer(kept) == lower:
+                    duplicate = link
+                else:
+                    duplicate, self.peers[origin] = kept, link
+                self.duplicates.add(duplicate.connection)
+            else:
+                self.peers[origin] = link
+        if connection.closed:
+            self._forget(connection)
+            return
+        self.peer.known_peers.add(address)
+        if duplicate is not None:
+            self.peer.metrics.count("links.duplicate")
+            duplicate.connection.close()
+        elif self.peer.overlay.name == "mesh":
+            self.peer.send_peer_list(connection)
+
+    def _dialer(self, link):
+        return self.peer.ids.origin if link.connection.dialed else link.origin
+
+    # Closing links
+
+    def _forget(self, connection):
+        with self.lock:
+            link = self.links.pop(connection, None)
+            self.duplicates.discard(connection)
+            if link is not None and link.origin is not None and self.peers.get(link.origin) is link:
+                del self.peers[link.origin]
+        return link
+
+    def closed(self, connection):
+        """A link went down; redial its peer if it was ours to keep up."""
+        with self.lock:
+            duplicate = connection in self.duplicates
+        link = self._forget(connection)
+        if duplicate or link is None:
+            return
+        with self.lock:
+            others = any(not c.closed for c in self.links)
+        address = connection.peer_address
+        if self.stopped.is_set() or address is None or self.peer.overlay.name != "mesh":
+            return  # The tree and gossip overlays repair themselves
+        # One end redials: the lower origin, or the dialer if no hello came
+        if link.origin is None and connection.dialed or link.origin is not None and self.peer.ids.origin < link.origin:
+            self._retry(address, sync=not others)  # Ops may have been missed if it was our only link
+
+    def _retry(self, address, sync):
+        with self.lock:
+            attempt = self.attempts.get(address, 0)
+            if not self.active or self.stopped.is_set() or attempt >= MAX_ATTEMPTS:
+                self.attempts.pop(address, None)
+                return
+            self.attempts[address] = attempt + 1
+        timer = threading.Timer(backoff(attempt), self._redial, args=(address, sync))
+        timer.daemon = True
+        timer.start()
+
+    def _redial(self, address, sync):
+        if self.stopped.is_set() or self.linked(address):
+            return
+        self.peer.metrics.count("links.redial")
+        self.dial(*address, sync=sync)
+
+    # Heartbeats
+
+    def _heartbeat(self):
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            with self.lock:
+                links = list(self.links.values())
+            for link in links:
+                connection = link.connection
+                if connection.closed:
+                    continue
+                if connection.messages_received != link.received:
+                    link.received, link.heard = connection.messages_received, now
+                elif link.origin is not None and now - link.heard > self.dead_after:
+                    # Only links that said hello: an older peer never pings
+                    self.peer.metrics.count("links.dead")
+                    connection.close()
+                    continue
+                if connection.messages_sent == link.sent:
+                    connection.send({"type": "ping"})
+                link.sent = connection.messages_sent
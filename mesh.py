@@ -0,0 +1,51 @@
+"""Message ids and duplicate suppression for flooding over a peer mesh.
+
+Every message a peer originates is stamped with (origin, sequence).  Peers
+remember the ids they have handled in a bounded LRU set and drop repeats
+before rendering or relaying, so cycles in the peer graph cannot turn one
+stroke into a broadcast storm.
+"""
+import collections
+import itertools
+import random
+import threading
+
+
+class MessageIds:
+    """Stamps locally created messages with a globally unique id."""
+
+    def __init__(self, origin=None):
+        self.origin = random.getrandbits(32) if origin is None else origin
+        self.sequence = itertools.count(1)
+
+    def stamp(self, message):
+        message["id"] = (self.origin, next(self.sequence))
+        return message
+
+
+class SeenSet:
+    """The most recent `capacity` message ids, evicted least recently seen first."""
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.ids = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, message_id):
+        """Record an id; returns False if it had already been seen."""
+        with self.lock:
+            if message_id in self.ids:
+                self.ids.move_to_end(message_id)
+                return False
+            self.ids[message_id] = None
+            if len(self.ids) > self.capacity:
+                self.ids.popitem(last=False)
+            return True
+
+    def is_new(self, message):
+        """True unless the message carries an id that was already seen."""
+        message_id = message.get("id")
+        return message_id is None or self.add(message_id)
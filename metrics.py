@@ -0,0 +1,162 @@
+"""Counters, latency histograms, a local stats endpoint and a sampling profiler.
+
+PeerEngine counts what it handles in a Metrics; stats() joins that with
+each connection's queue and traffic counters.  Any peer can serve its
+stats as JSON on a local port and sample its threads' stacks to find
+where time goes under load:
+
+    python gui_network2.py --stats-port=8765 --profile=peer.folded
+    curl http://127.0.0.1:8765/
+"""
+import bisect
+import collections
+import contextlib
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Counts of durations falling in each of the BUCKETS_MS, plus their sum and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        ms = 1000 * seconds
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket the given fraction of durations fall within."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max, 3),
+            "buckets_ms": {str(bound): count for bound, count in zip(BUCKETS_MS + ("inf",), self.counts)},
+        }
+
+
+class Metrics:
+    """Named counters and duration histograms; safe to update from any thread."""
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(Histogram)
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms[name].observe(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.monotonic() - self.start, 3),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+
+
+def serve_stats(stats, port, host="127.0.0.1"):
+    """Serve stats() as JSON on http://host:port/ from a daemon thread; returns the server."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(stats(), indent=2, default=str).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Sampler:
+    """Samples every thread's stack every `interval` seconds.
+
+    Unlike cProfile, which only sees the thread that enabled it, this sees
+    the reader, writer and event loop threads as well as the Tk one, and
+    costs the peer little.  The samples are wall-clock: a thread blocked in
+    recv shows up there.  dump() writes one "thread;outer;...;inner count"
+    line per stack, the folded format flame graph tools read.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self.thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[(names.get(ident, str(ident)), *reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            for stack, samples in self.stacks.most_common():
+                file.write(f"{';'.join(stack)} {samples}\n")
+
+
+@contextlib.contextmanager
+def instrumented(stats, stats_port=None, profile=None):
+    """Serve stats() on stats_port and sample the threads into profile, if given, while in the block."""
+    server = serve_stats(stats, int(stats_port)) if stats_port else None
+    sampler = Sampler().start() if profile else None
+    try:
+        yield
+    finally:
+        if server is not None:
+            server.shutdown()
+        if sampler is not None:
+            sampler.stop()
+            sampler.dump(profile)
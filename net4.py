@@ -2,23 +2,23 @@ import tkinter as tk
 from tkinter import *
 from tkinter.colorchooser import askcolor
 from tkinter import ttk
-import socket
+import sys
 import threading
-import pickle
+from engine import ERASER_RADIUS, PeerEngine
+from metrics import instrumented
+from render import FrameScheduler
+from viewport import ViewportView
 
-class WhiteboardPeer:
-    def __init__(self, host, port):
-        self.host = host
-        self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connections = []  # List of connected peers
-        self.known_peers = set()  # Set of known peers (host, port)
-        self.is_running = True
+class WhiteboardPeer(PeerEngine):
+    """Tk front end; networking and the board live in the PeerEngine (engine.py)."""
+
+    def __init__(self, host, port, batch_window=0.012, batch_points=64, transport="threads", overlay="mesh"):
+        super().__init__(host, port, batch_window=batch_window, batch_points=batch_points, transport=transport, overlay=overlay)
+        self.flush_job = None
 
         # Tkinter GUI setup
         self.current_x=0
         self.current_y=0
-        self.color="black"
         self.root = tk.Tk()
         self.root.geometry("850x350+150+50")
         self.root.configure(bg="#f2f3f5")
@@ -26,6 +26,8 @@ class WhiteboardPeer:
         self.root.title(f"P2P Whiteboard - {host}:{port}")
         self.canvas = Canvas(self.root, width=730, height=300, bg="white",cursor="hand2")
         self.canvas.place(x=100,y=10)
+        self.view = ViewportView(self.canvas, self.scene)  # Wheel zooms, middle button pans
+        self.frames = FrameScheduler(self.root, self.view, metrics=self.metrics)  # Runs the board work and redraws once per frame
         self.colors=Canvas(self.root,bg="#ffffff",width=37,height=300,bd=0)
         self.colors.place(x=30,y=10) 
         self.eraser= Button(self.root,text="clear",command=self.new_canvas,bg="#f2f3f5")
@@ -36,124 +38,95 @@ class WhiteboardPeer:
         self.canvas.bind("<B1-Motion>", self.draw)  # Mouse drag to draw
         self.canvas.bind("<ButtonRelease-1>", self.stop_draw)  # Stop drawing
         self.canvas.bind('<Button-1>',self.locate_xy)
+        self.canvas.bind("<Button-3>", self.erase)  # Right-drag erases whole strokes
+        self.canvas.bind("<B3-Motion>", self.erase)
+        self.view.bind_navigation()
 
         self.drawing = False
 
-        # Networking in a background thread
-        threading.Thread(target=self.start_server, daemon=True).start()
+        # Networking runs in the background (reader threads or an asyncio loop)
+        self.start_server()
+        self.frames.start()
 
     def start_server(self):
         """Start the server to accept connections."""
-        self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
+        super().start_server()
         print(f"Listening for connections on {self.host}:{self.port}")
-        while self.is_running:
-            connection, address = self.socket.accept()
-            print(f"Accepted connection from {address}")
-            self.connections.append(connection)
-            threading.Thread(target=self.handle_client, args=(connection, address), daemon=True).start()
-
-    def connect_to_peer(self, peer_host, peer_port):
-        """Connect to an existing peer."""
-        connection = socket.create_connection((peer_host, peer_port))
-        self.connections.append(connection)
-        self.known_peers.add((peer_host, peer_port))
-        print(f"Connected to {peer_host}:{peer_port}")
-        threading.Thread(target=self.handle_client, args=(connection, (peer_host, peer_port)), daemon=True).start()
-
-    def handle_client(self, connection, address):
-        """Handle incoming data from a peer."""
-        while self.is_running:
-            try:
-                data = connection.recv(4096)
-                if data:
-                    message = pickle.loads(data)
-                    self.process_message(message, connection)
-            except (socket.error, EOFError):
-                break
-
-        print(f"Connection closed with {address}")
-        connection.close()
-        if connection in self.connections:
-            self.connections.remove(connection)
-
-    def process_message(self, message, sender_connection):
-        """Process incoming messages and update UI or state."""
-        if message["type"] == "draw_event":
-            self.draw_from_network(message["data"])
-            self.relay_message(message, sender_connection)
-        elif message["type"] == "clear":
-            # Clear the canvas locally
-            self.root.after(0, self.new_canvas)
-        elif message["type"] == "color_change":
-            # Update the color locally
-            self.root.after(0, lambda: setattr(self, "color", message["color"]))
-        elif message["type"] == "peer_list":
-            new_peers = message["data"]
-            for peer in new_peers:
-                if peer not in self.known_peers and (peer[0], peer[1]) != (self.host, self.port):
-                    self.known_peers.add(peer)
-                    threading.Thread(target=lambda: self.connect_to_peer(*peer), daemon=True).start()
-
-
-    def relay_message(self, message, sender_connection):
-        """Relay a message to all connected peers except the sender."""
-        for connection in self.connections:
-            if connection != sender_connection:
-                try:
-                    connection.sendall(pickle.dumps(message))
-                except socket.error:
-                    if connection in self.connections:
-                        self.connections.remove(connection)
-
-    def send_event(self, event):
-        """Send drawing events to all peers."""
-        message = {"type": "draw_event", "data": event}
-        self.relay_message(message, None)  # Send to all peers
-
-    def send_peer_list(self, connection):
-        """Send the list of known peers to a new connection."""
-        message = {"type": "peer_list", "data": list(self.known_peers)}
-        try:
-            connection.sendall(pickle.dumps(message))
-        except socket.error:
-            pass
+
+    def connect_to_peer(self, peer_host, peer_port, sync=True):
+        """Connect to an existing peer and, unless told not to, fetch its board."""
+        connection = super().connect_to_peer(peer_host, peer_port, sync)
+        if connection is not None:
+            print(f"Connected to {peer_host}:{peer_port}")
+        return connection
+
+    def on_accept(self, connection):
+        print(f"Accepted connection from {connection.address}")
+        super().on_accept(connection)
+
+    def on_close(self, connection):
+        print(f"Connection closed with {connection.address}")
+        super().on_close(connection)
+
+    def frame_stats(self):
+        """Inbound queue depth and frame times of the render scheduler."""
+        return self.frames.stats()
+
+    def stats(self):
+        return dict(super().stats(), frames=self.frame_stats())
+
+    def call(self, function, *args):
+        """Board work from the network runs on the Tk thread, once per frame."""
+        self.frames.call(function, *args)
+
+    def render(self, stroke):
+        self.frames.render(stroke)  # Drawn once this frame, however many batches it grew by
+
+    def remove(self, stroke):
+        self.frames.remove(stroke)
 
     def draw(self, event):
         """Draw on the local canvas and broadcast the event."""
+        x, y = self.view.to_world(event.x, event.y)  # Where the pointer is on the board
         if not self.drawing:
             self.drawing = True
-            self.prev_x, self.prev_y = event.x, event.y
+            self.prev_x, self.prev_y = x, y
+            self.begin_stroke(x, y)
             return
 
-        # Draw on local canvas
-        self.canvas.create_line(self.prev_x, self.prev_y, event.x, event.y, fill=self.color, width=2)
-
-        # Broadcast event to peers
-        event_data = {"prev_x": self.prev_x, "prev_y": self.prev_y, "x": event.x, "y": event.y}
-        self.send_event(event_data)
+        # Extend the stroke on the board; the point goes out with the next batch
+        self.add_point(x, y)
+        if self.batcher.pending and self.flush_job is None:
+            self.flush_job = self.root.after(int(self.batcher.window * 1000), self.flush_stroke)
 
         # Update previous coordinates
-        self.prev_x, self.prev_y = event.x, event.y
+        self.prev_x, self.prev_y = x, y
 
     def stop_draw(self, event):
         """Stop the current drawing session."""
         self.drawing = False
+        if self.flush_job is not None:
+            self.root.after_cancel(self.flush_job)
+            self.flush_job = None
+        self.end_stroke()
 
-    def draw_from_network(self, event):
-        """Draw events received from peers on the local canvas."""
-        self.canvas.create_line(event["prev_x"], event["prev_y"], event["x"], event["y"], fill=self.color, width=2)
+    def flush_stroke(self):
+        """Send the points gathered during the current batch window."""
+        self.flush_job = None
+        super().flush_stroke()
+
+    def erase(self, event):
+        """Erase the strokes under the pointer and tell the peers how much of each."""
+        x, y = self.view.to_world(event.x, event.y)
+        self.erase_at(x, y, ERASER_RADIUS / self.view.viewport.scale)
 
     def start_gui(self):
         """Start the Tkinter mainloop in the main thread."""
         self.root.mainloop()
     
     def show_color(self,new_color): 
-        """Update the current drawing color and optionally broadcast the change."""
-        self.color = new_color
-        # Broadcast color change if synchronization is needed
-        message = {"type": "color_change", "color": new_color}
-        self.relay_message(message, None)
+        """Update the color of the strokes drawn from now on."""
+        self.color = new_color  # Each stroke carries its color, so peers need no color_change
     def locate_xy(self,event):
         self.current_x=event.x
         self.current_y=event.y
@@ -165,17 +138,25 @@ class WhiteboardPeer:
             rect_id = self.colors.create_rectangle((10, 10 + i * 30, 30, 30 + i * 30), fill=color)
             self.colors.tag_bind(rect_id, '<Button-1>', lambda event, c=color: self.show_color(c))
     def new_canvas(self):
-        """Clear the canvas locally and broadcast the clear event."""
-        self.canvas.delete('all')
-        self.display_pallete()  # Redisplay the palette
-        message = {"type": "clear"}
-        self.relay_message(message, None)
+        """Clear the board and broadcast the clear."""
+        self.clear()
+def option(name, default=None):
+    """A --name=value command line option, e.g. --overlay=mesh|tree|gossip."""
+    return next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith(f"--{name}=")), default)
+
+
 # Usage Example
 if __name__ == "__main__":
     # Start a peer instance
     host = input("Enter your host (e.g., 127.0.0.1): ")
     port = int(input("Enter your port (e.g., 9000): "))
-    peer = WhiteboardPeer(host, port)
+    peer = WhiteboardPeer(host, port, transport="asyncio" if "--asyncio" in sys.argv else "threads", overlay=option("overlay", "mesh"))
+    if option("journal"):
+        peer.open_journal(option("journal"))  # Reopen the board saved there and keep saving to it
+    if "--discover" in sys.argv:
+        peer.discover()  # Link up with the peers announcing themselves on the LAN
+    if option("record"):
+        peer.record(option("record"))  # Replay it with replay.py
 
     # Optionally connect to an existing peer
     if input("Connect to another peer? (y/n): ").lower() == "y":
@@ -183,5 +164,6 @@ if __name__ == "__main__":
         peer_port = int(input("Enter peer port (e.g., 9001): "))
         threading.Thread(target=lambda: peer.connect_to_peer(peer_host, peer_port), daemon=True).start()
 
-    # Start the GUI
-    peer.start_gui()
+    # Start the GUI; --stats-port=N serves its counters, --profile=FILE samples its threads
+    with instrumented(peer.stats, option("stats-port"), option("profile")):
+        peer.start_gui()
@@ -0,0 +1,98 @@
+"""Headless whiteboard peer: relays strokes, serves the board to joiners, can record.
+
+Runs a PeerEngine with no window and no prompts, so it can sit on a
+server with a lot of bandwidth as a relay for many peers, act as the
+always-on peer late joiners sync from, or record a session.
+
+    python node.py --port 9000 [--host 0.0.0.0] [--connect HOST:PORT ...] [--discover]
+                   [--overlay mesh|tree|gossip] [--transport asyncio|threads]
+                   [--record FILE] [--journal FILE] [--stats SECONDS] [--stats-port PORT] [--profile FILE]
+
+--record writes a session recording (recording.py) that replay.py plays back.
+"""
+import argparse
+import signal
+import threading
+
+from engine import PeerEngine
+from metrics import instrumented
+
+class RelayNode(PeerEngine):
+    def __init__(self, host, port, record=None, **options):
+        super().__init__(host, port, **options)
+        if record:
+            self.record(record)
+
+    def on_accept(self, connection):
+        print(f"Accepted connection from {connection.address}", flush=True)
+        super().on_accept(connection)
+
+    def on_close(self, connection):
+        print(f"Connection closed with {connection.address}", flush=True)
+        super().on_close(connection)
+
+    def stats_line(self):
+        stats = [counters for _, counters in self.queue_depths()]
+        return (f"{len(stats)} connections, {len(self.scene)} strokes, "
+                f"{sum(s['queue_depth'] for s in stats)} queued, "
+                f"{sum(s['messages_sent'] for s in stats)} messages / {sum(s['bytes_sent'] for s in stats)} bytes sent")
+
+
+def raise_open_file_limit():
+    """Allow as many sockets as the hard limit does; a relay serves hundreds of peers."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 65536 if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--connect", type=address, nargs="*", default=[], metavar="HOST:PORT",
+                        help="peers to join through; the first one sends us its board")
+    parser.add_argument("--discover", action="store_true", help="find and link up with peers on the LAN by multicast")
+    parser.add_argument("--overlay", default="mesh", choices=["mesh", "tree", "gossip"])
+    parser.add_argument("--transport", default="asyncio", choices=["threads", "asyncio"])
+    parser.add_argument("--record", metavar="FILE", help="record every message handled and sent to FILE")
+    parser.add_argument("--journal", metavar="FILE", help="reopen the board saved in FILE and keep saving to it")
+    parser.add_argument("--stats", type=float, default=0, metavar="SECONDS", help="print traffic counters this often")
+    parser.add_argument("--stats-port", type=int, help="serve counters and histograms as JSON on this local port")
+    parser.add_argument("--profile", metavar="FILE", help="sample the threads' stacks into FILE (folded format)")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    node = RelayNode(args.host, args.port, args.record, transport=args.transport, overlay=args.overlay)
+    if args.journal:
+        node.open_journal(args.journal)
+    node.start_server()
+    print(f"Listening on {args.host}:{args.port}", flush=True)
+    for i, (host, port) in enumerate(args.connect):
+        if node.connect_to_peer(host, port, sync=i == 0) is not None:
+            print(f"Connected to {host}:{port}", flush=True)
+    if args.discover:
+        node.discover()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    with instrumented(node.stats, args.stats_port, args.profile):
+        try:
+            while not stop.wait(args.stats or None):
+                print(node.stats_line(), flush=True)
+        except KeyboardInterrupt:
+            pass
+    node.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Dissemination overlays: which connections a message is forwarded to.
+
+mesh    every connection, the original behaviour.  Once everyone connects to
+        everyone (net4.py's peer_list), per-peer upload grows with the
+        session size and total traffic with its square.
+tree    a spanning tree where each peer accepts at most `max_children`
+        children and redirects further joins down the tree.  Each message
+        crosses every tree edge exactly once, and a peer whose parent
+        leaves re-attaches to the nearest live ancestor.
+gossip  a random graph where each peer keeps about `degree` neighbours and
+        forwards a new message to `fanout` of them.  It is cheaper and has
+        no structure to repair, but delivery is probabilistic.
+
+An overlay is driven by its peer: join() replaces a plain connect,
+on_message() consumes the overlay's own control messages, targets() picks
+the relay targets, on_close() repairs after a connection is lost and
+discovered() is told of peers announced on the LAN.  The peer must
+provide host, port, transport, connections, links and join_sync.
+"""
+import random
+import threading
+
+
+def _address(address):
+    return (address[0], int(address[1]))
+
+
+def _spawn(target, *args):
+    # Connecting blocks, and overlay callbacks may run on the asyncio loop
+    # that has to complete the connection.
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+class MeshOverlay:
+    name = "mesh"
+
+    def __init__(self, peer):
+        self.peer = peer
+        self.address = (peer.host, peer.port)
+        self.lock = threading.RLock()
+
+    def join(self, host, port):
+        """Connect to a peer and take part in the overlay through it."""
+        connection = self.peer.transport.connect(host, port)
+        connection.peer_address = (host, port)
+        self.peer.links.opened(connection)
+        return connection
+
+    def on_message(self, message, connection):
+        """Handle an overlay control message; returns False for anything else."""
+        return False
+
+    def targets(self, message, sender_connection):
+        return [connection for connection in self.peer.connections if connection is not sender_connection]
+
+    def on_close(self, connection):
+        pass
+
+    def discovered(self, address):
+        """A peer with a higher origin announced itself; the mesh links up with everyone."""
+        self._link(address)
+
+    def _link(self, address):
+        # Fetch the board from the first peer we find, unless we have one already
+        peer = self.peer
+        peer.links.connect(address, sync=not peer.connections and not peer.join_sync.waiting)
+
+    def neighbours(self):
+        return len(self.peer.connections)
+
+
+class TreeOverlay(MeshOverlay):
+    name = "tree"
+
+    def __init__(self, peer, max_children=3, max_ancestors=8):
+        super().__init__(peer)
+        self.max_children = max_children
+        self.max_ancestors = max_ancestors
+        self.parent = None
+        self.children = []
+        self.ancestors = []  # Listening addresses from our parent up to the root
+        self.heir = None  # Set by the root: the child that takes over if it leaves
+        self.next_redirect = 0
+
+    def join(self, host, port):
+        connection = super().join(host, port)
+        connection.send({"type": "tree_join", "addr": list(self.address)})
+        return connection
+
+    def on_message(self, message, connection):
+        kind = message["type"]
+        if kind == "tree_join":
+            self._on_join(message, connection)
+        elif kind in ("tree_accept", "tree_info"):
+            with self.lock:
+                if kind == "tree_accept":
+                    self.parent = connection
+                if connection is not self.parent:
+                    return True
+                self.ancestors = [_address(address) for address in message["ancestors"]]
+                self.heir = message["heir"] and _address(message["heir"])
+            self._update_children()
+        elif kind == "tree_redirect":
+            connection.close()
+            _spawn(self._join_any, [_address(message["addr"])])
+        else:
+            return False
+        return True
+
+    def _on_join(self, message, connection):
+        connection.peer_address = _address(message["addr"])
+        with self.lock:
+            if len(self.children) < self.max_children:
+                self.children.append(connection)
+                redirect = None
+            else:
+                redirect = self.children[self.next_redirect % len(self.children)].peer_address
+                self.next_redirect += 1
+        if redirect is None:
+            connection.send(dict(self._info(), type="tree_accept"))
+            # A root's heir is its first child, which may just have changed
+            if self.parent is None and self.children[0] is connection:
+                self._update_children()
+        else:
+            # The joiner closes the connection once it has read the redirect
+            connection.send({"type": "tree_redirect", "addr": list(redirect)})
+
+    def _info(self):
+        with self.lock:
+            heir = None
+            if self.parent is None and self.children:
+                heir = list(self.children[0].peer_address)
+            ancestors = [self.address] + self.ancestors[:self.max_ancestors - 1]
+            return {"ancestors": [list(address) for address in ancestors], "heir": heir}
+
+    def _update_children(self):
+        info = dict(self._info(), type="tree_info")
+        with self.lock:
+            children = list(self.children)
+        for child in children:
+            child.send(info)
+
+    def targets(self, message, sender_connection):
+        with self.lock:
+            links = self.children + [self.parent] if self.parent else list(self.children)
+        return [connection for connection in links if connection is not sender_connection and not connection.closed]
+
+    def on_close(self, connection):
+        with self.lock:
+            if connection in self.children:
+                # A root losing its heir names the next child to the others
+                was_heir = self.parent is None and self.children[0] is connection
+                self.children.remove(connection)
+                was_heir = was_heir and bool(self.children)
+            elif connection is self.parent:
+                self.parent = None
+                candidates = self.ancestors[1:]
+                if not candidates and self.heir not in (None, self.address):
+                    # Our parent was the root; its heir takes over
+                    candidates = [self.heir]
+                self.ancestors = []
+                self.heir = None
+                _spawn(self._join_any, candidates)
+                return
+            else:
+                return
+        if was_heir:
+            self._update_children()
+
+    def discovered(self, address):
+        # Every peer but the one with the highest origin finds a parent, so
+        # parents have higher origins and the links cannot form a cycle
+        if self.parent is None:
+            self._link(address)
+
+    def _join_any(self, candidates):
+        for host, port in candidates:
+            try:
+                self.join(host, port)
+                return
+            except OSError:
+                continue
+        # Nobody above us is reachable: carry on as the root of our subtree
+        self._update_children()
+
+    def neighbours(self):
+        with self.lock:
+            return len(self.children) + (self.parent is not None)
+
+
+class GossipOverlay(MeshOverlay):
+    name = "gossip"
+
+    def __init__(self, peer, fanout=4, degree=None):
+        super().__init__(peer)
+        self.fanout = fanout
+        self.degree = degree or 2 * fanout
+        self.known = set()  # Listening addresses we have heard of
+        self.filling = False
+
+    def join(self, host, port):
+        connection = super().join(host, port)
+        with self.lock:
+            self.known.add((host, port))
+        connection.send({"type": "gossip_hello", "addr": list(self.address)})
+        return connection
+
+    def on_message(self, message, connection):
+        kind = message["type"]
+        if kind == "gossip_hello":
+            connection.peer_address = _address(message["addr"])
+            with self.lock:
+                self.known.add(connection.peer_address)
+                sample = random.sample(sorted(self.known), min(len(self.known), 4 * self.degree))
+            connection.send({"type": "gossip_peers", "peers": [list(address) for address in sample + [self.address]]})
+        elif kind == "gossip_peers":
+            with self.lock:
+                self.known.update(_address(address) for address in message["peers"])
+                self.known.discard(self.address)
+            self._fill()
+        else:
+            return False
+        return True
+
+    def _fill(self):
+        with self.lock:
+            if self.filling:
+                return
+            self.filling = True
+        _spawn(self._connect_more)
+
+    def _connect_more(self):
+        try:
+            while len(self.peer.connections) < self.degree:
+                connected = {connection.peer_address for connection in self.peer.connections}
+                with self.lock:
+                    candidates = sorted(self.known - connected - {self.address})
+                if not candidates:
+                    break
+                address = random.choice(candidates)
+                try:
+                    self.join(*address)
+                except OSError:
+                    with self.lock:
+                        self.known.discard(address)
+        finally:
+            with self.lock:
+                self.filling = False
+
+    def targets(self, message, sender_connection):
+        others = super().targets(message, sender_connection)
+        return random.sample(others, min(self.fanout, len(others)))
+
+    def on_close(self, connection):
+        address = connection.peer_address
+        if not self.peer.links.linked(address):  # Not if it was the duplicate of a live link
+            with self.lock:
+                self.known.discard(address)
+        self._fill()
+
+    def discovered(self, address):
+        with self.lock:
+            self.known.add(address)
+        self._fill()
+
+
+OVERLAYS = {overlay.name: overlay for overlay in (MeshOverlay, TreeOverlay, GossipOverlay)}
+
+
+def create_overlay(kind, peer, **kwargs):
+    """Build the "mesh", "tree" or "gossip" overlay for a peer."""
+    if kind not in OVERLAYS:
+        raise ValueError(f"unknown overlay {kind!r}")
+    return OVERLAYS[kind](peer, **kwargs)
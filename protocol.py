@@ -0,0 +1,496 @@
+"""Length-prefixed binary wire protocol shared by all whiteboard peers.
+
+Every message travels as one frame: a 3 byte header (payload length and a
+message type code) followed by the payload.  Flooded messages set the high
+bit of the type code and carry their (origin, sequence) id right after the
+header; ops replayed to a joining peer (see sync.py) set the SYNC bit.
+Draw events, polyline batches and board snapshots use fixed struct
+layouts; rare control messages fall back to JSON so nothing on the wire is
+ever unpickled.  Payloads of COMPRESS_MIN bytes or more are zlib
+compressed (the ZLIB bit) when that makes them smaller.
+
+On a connection, a FrameEncoder sends draw batches as DRAW_DELTA frames
+instead: the stroke's origin, number, clock, width, color and user name
+are sent once and then referred to by a small slot number, and the ids,
+indexes and coordinates as zigzag varint deltas from the stroke's last
+batch.  The connection's MessageDecoder keeps the same slot table.
+"""
+import collections
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+HEADER = struct.Struct("!HB")
+MESSAGE_ID = struct.Struct("!II")
+HAS_ID = 0x80
+SYNC = 0x40
+ZLIB = 0x20
+FLAGS = HAS_ID | SYNC | ZLIB
+MAX_PAYLOAD = 0xFFFF
+MAX_FRAME = HEADER.size + MAX_PAYLOAD
+RECEIVE_BUFFER = 16384  # Initial size; grows to 2 * MAX_FRAME if frames need it
+COMPRESS_MIN = 512
+
+# Message type codes
+JSON = 0
+DRAW_EVENT = 1
+CLEAR = 2
+COLOR_CHANGE = 3
+DRAW_BATCH = 4
+SYNC_STROKES = 5
+DRAW_DELTA = 6
+
+DRAW = struct.Struct("!hhhh")
+# stroke, index, point count, Lamport clock, width, color length
+BATCH = struct.Struct("!IIHIBB")
+# origin, stroke number, clock, index, point count, width, color and name lengths
+STROKE_RECORD = struct.Struct("!IIIIHBBB")
+# origin, stroke number, point count: one author's entry in a clear's cut
+CUT_ENTRY = struct.Struct("!III")
+COUNT = struct.Struct("!H")
+# Strokes a connection's DRAW_DELTA frames can refer to at once; a slot
+# number below 64 keeps the slot varint to one byte.
+MAX_SLOTS = 64
+
+
+class ProtocolError(ValueError):
+    """Raised when a peer sends a frame we cannot decode."""
+
+
+def _clamp(value):
+    return max(-0x8000, min(0x7FFF, int(value)))
+
+
+def _encode_draw_event(message):
+    event = message["data"]
+    payload = DRAW.pack(_clamp(event["prev_x"]), _clamp(event["prev_y"]), _clamp(event["x"]), _clamp(event["y"]))
+    if event.get("user_name"):
+        payload += event["user_name"].encode("utf-8")
+    return DRAW_EVENT, payload
+
+
+def _decode_draw_event(view, start, end):
+    prev_x, prev_y, x, y = DRAW.unpack_from(view, start)
+    event = {"prev_x": prev_x, "prev_y": prev_y, "x": x, "y": y}
+    if end > start + DRAW.size:
+        event["user_name"] = bytes(view[start + DRAW.size:end]).decode("utf-8")
+    return {"type": "draw_event", "data": event}
+
+
+def _network_order(points):
+    if sys.byteorder == "little":
+        points.byteswap()
+    return points
+
+
+def _encode_draw_batch(message):
+    batch = message["data"]
+    points = _network_order(array("h", map(_clamp, batch["points"])))
+    color = batch.get("color", "black").encode("utf-8")
+    header = BATCH.pack(batch["stroke"], batch["index"], len(points) // 2, batch.get("clock", 0),
+                        batch.get("width", 2), len(color))
+    payload = header + color + points.tobytes()
+    if batch.get("user_name"):
+        payload += batch["user_name"].encode("utf-8")
+    return DRAW_BATCH, payload
+
+
+def _decode_draw_batch(view, start, end):
+    stroke, index, count, clock, width, color_length = BATCH.unpack_from(view, start)
+    points_start = start + BATCH.size + color_length
+    points_end = points_start + 4 * count
+    if points_end > end:
+        raise ProtocolError("truncated draw_batch")
+    color = bytes(view[start + BATCH.size:points_start]).decode("utf-8")
+    points = array("h")
+    points.frombytes(view[points_start:points_end])
+    batch = {"stroke": stroke, "index": index, "points": _network_order(points),
+             "clock": clock, "width": width, "color": color}
+    if end > points_end:
+        batch["user_name"] = bytes(view[points_end:end]).decode("utf-8")
+    return {"type": "draw_batch", "data": batch}
+
+
+def stroke_record_size(color, user_name, count):
+    """Encoded size of one sync_strokes record."""
+    return STROKE_RECORD.size + len(color.encode("utf-8")) + len(user_name.encode("utf-8")[:255]) + 4 * count
+
+
+def _encode_sync_strokes(message):
+    parts = [COUNT.pack(len(message["strokes"]))]
+    for key, clock, index, color, width, user_name, points in message["strokes"]:
+        origin, number = key
+        color = color.encode("utf-8")
+        name = user_name.encode("utf-8")[:255]
+        points = _network_order(array("h", points))
+        parts.append(STROKE_RECORD.pack(origin or 0, number, clock, index, len(points) // 2, width, len(color), len(name)))
+        parts += (color, name, points.tobytes())
+    return SYNC_STROKES, b"".join(parts)
+
+
+def _decode_sync_strokes(view, start, end):
+    (count,) = COUNT.unpack_from(view, start)
+    offset = start + COUNT.size
+    strokes = []
+    for _ in range(count):
+        origin, number, clock, index, points_count, width, color_length, name_length = STROKE_RECORD.unpack_from(view, offset)
+        offset += STROKE_RECORD.size
+        color = bytes(view[offset:offset + color_length]).decode("utf-8")
+        offset += color_length
+        user_name = bytes(view[offset:offset + name_length]).decode("utf-8", "ignore")
+        offset += name_length
+        if offset + 4 * points_count > end:
+            raise ProtocolError("truncated sync_strokes")
+        points = array("h")
+        points.frombytes(view[offset:offset + 4 * points_count])
+        offset += 4 * points_count
+        strokes.append(((origin, number), clock, index, color, width, user_name, _network_order(points)))
+    return {"type": "sync_strokes", "strokes": strokes}
+
+
+def _encode_clear(message):
+    if "cut" not in message:
+        return CLEAR, b""
+    cut = message["cut"]
+    return CLEAR, COUNT.pack(len(cut)) + b"".join(CUT_ENTRY.pack(*entry) for entry in cut)
+
+
+def _decode_clear(view, start, end):
+    if start == end:
+        return {"type": "clear"}  # From a peer that predates cuts
+    (count,) = COUNT.unpack_from(view, start)
+    offset = start + COUNT.size
+    if offset + count * CUT_ENTRY.size > end:
+        raise ProtocolError("truncated clear")
+    cut = [list(CUT_ENTRY.unpack_from(view, offset + i * CUT_ENTRY.size)) for i in range(count)]
+    return {"type": "clear", "cut": cut}
+
+
+def _encode_color_change(message):
+    return COLOR_CHANGE, message["color"].encode("utf-8")
+
+
+def _decode_color_change(view, start, end):
+    return {"type": "color_change", "color": bytes(view[start:end]).decode("utf-8")}
+
+
+def _decode_json(view, start, end):
+    message = json.loads(bytes(view[start:end]))
+    if not isinstance(message, dict) or "type" not in message:
+        raise ProtocolError("JSON frame is not a message")
+    return message
+
+
+def _zigzag(value):
+    return 2 * value if value >= 0 else -2 * value - 1
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+# Single-byte zigzag varints (0..127) to their value as a signed byte
+_UNZIGZAG_BYTE = bytes(_unzigzag(value) & 0xFF for value in range(128)) + bytes(128)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(view, offset, end):
+    value = shift = 0
+    while True:
+        if offset >= end or shift > 35:
+            raise ProtocolError("truncated varint")
+        byte = view[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _write_text(out, text):
+    data = text.encode("utf-8")[:255]
+    out.append(len(data))
+    out += data
+
+
+def _read_text(view, offset, end):
+    length = view[offset]
+    offset += 1
+    if offset + length > end:
+        raise ProtocolError("truncated draw_delta")
+    return bytes(view[offset:offset + length]).decode("utf-8", "ignore"), offset + length
+
+
+class _Slot:
+    """What both ends of a connection remember about one stroke's last batch."""
+
+    __slots__ = ("number", "origin", "stroke", "style", "sequence", "index", "x", "y")
+
+    def __init__(self, number, origin, stroke, style):
+        self.number = number
+        self.origin = origin
+        self.stroke = stroke
+        self.style = style  # (clock, width, color, user_name)
+        self.sequence = self.index = self.x = self.y = 0
+
+
+class FrameEncoder:
+    """Encodes the frames sent on one connection, draw batches as DRAW_DELTA.
+
+    The slot table is shared with the peer's decoder through the frames
+    themselves, so the frames must reach it in the order they were
+    encoded, which a single TCP connection guarantees.
+    """
+
+    def __init__(self):
+        self.slots = collections.OrderedDict()  # (origin, stroke) -> _Slot, least recently used first
+
+    def encode(self, message):
+        if message["type"] != "draw_batch" or "id" not in message:
+            return encode_message(message)
+        return _frame(DRAW_DELTA, self._encode_delta(message), message, with_id=False)
+
+    def _encode_delta(self, message):
+        batch = message["data"]
+        origin, sequence = message["id"]
+        key = (origin, batch["stroke"])
+        style = (batch.get("clock", 0), batch.get("width", 2), batch.get("color", "black"), batch.get("user_name", ""))
+        out = bytearray()
+        slot = self.slots.pop(key, None)
+        if slot is None or slot.style != style:
+            if slot is None:
+                number = len(self.slots) if len(self.slots) < MAX_SLOTS else self.slots.popitem(last=False)[1].number
+            else:
+                number = slot.number
+            slot = _Slot(number, origin, batch["stroke"], style)
+            _write_varint(out, number << 1 | 1)
+            for value in (origin, batch["stroke"], style[0], style[1]):
+                _write_varint(out, value)
+            _write_text(out, style[2])
+            _write_text(out, style[3])
+        else:
+            _write_varint(out, slot.number << 1)
+        self.slots[key] = slot
+
+        try:
+            points = array("h", batch["points"]).tolist()
+        except (OverflowError, TypeError):
+            points = [_clamp(value) for value in batch["points"]]
+        count = len(points) // 2
+        _write_varint(out, _zigzag(sequence - slot.sequence))
+        _write_varint(out, _zigzag(batch["index"] - slot.index))
+        _write_varint(out, count)
+        deltas = [_zigzag(value - previous) for value, previous in zip(points, [slot.x, slot.y] + points[:-2])]
+        if max(deltas, default=0) < 0x80:
+            out += bytes(deltas)  # Every delta fits a single varint byte, the usual case
+        else:
+            for delta in deltas:
+                _write_varint(out, delta)
+        slot.sequence = sequence
+        if count:
+            slot.index = batch["index"] + count - 1
+            slot.x, slot.y = points[-2:]
+        return bytes(out)
+
+
+def _decode_draw_delta(view, start, end, slots):
+    tag, offset = _read_varint(view, start, end)
+    number = tag >> 1
+    if number >= MAX_SLOTS:
+        raise ProtocolError(f"draw_delta slot {number} out of range")
+    if tag & 1:
+        values = []
+        for _ in range(4):
+            value, offset = _read_varint(view, offset, end)
+            values.append(value)
+        color, offset = _read_text(view, offset, end)
+        user_name, offset = _read_text(view, offset, end)
+        slots[number] = _Slot(number, values[0], values[1], (values[2], values[3], color, user_name))
+    slot = slots.get(number)
+    if slot is None:
+        raise ProtocolError(f"draw_delta refers to undefined slot {number}")
+    sequence, offset = _read_varint(view, offset, end)
+    index, offset = _read_varint(view, offset, end)
+    count, offset = _read_varint(view, offset, end)
+    sequence = slot.sequence + _unzigzag(sequence)
+    index = slot.index + _unzigzag(index)
+    raw = bytes(view[offset:min(end, offset + 2 * count)])
+    if len(raw) == 2 * count and raw.isascii():
+        deltas = array("b", raw.translate(_UNZIGZAG_BYTE))  # All single-byte varints
+    else:
+        deltas = []
+        for _ in range(2 * count):
+            delta, offset = _read_varint(view, offset, end)
+            deltas.append(_unzigzag(delta))
+    points = array("h", bytes(4 * count))
+    try:
+        points[0::2] = array("h", accumulate(deltas[0::2], initial=slot.x))[1:]
+        points[1::2] = array("h", accumulate(deltas[1::2], initial=slot.y))[1:]
+    except OverflowError as exc:
+        raise ProtocolError("draw_delta point out of range") from exc
+    slot.sequence = sequence
+    if count:
+        slot.index = index + count - 1
+        slot.x, slot.y = points[-2:]
+    clock, width, color, user_name = slot.style
+    batch = {"stroke": slot.stroke, "index": index, "points": points, "clock": clock, "width": width, "color": color}
+    if user_name:
+        batch["user_name"] = user_name
+    return {"type": "draw_batch", "id": (slot.origin, sequence), "data": batch}
+
+
+_ENCODERS = {
+    "draw_event": _encode_draw_event,
+    "draw_batch": _encode_draw_batch,
+    "clear": _encode_clear,
+    "color_change": _encode_color_change,
+    "sync_strokes": _encode_sync_strokes,
+}
+
+_DECODERS = {
+    JSON: _decode_json,
+    DRAW_EVENT: _decode_draw_event,
+    DRAW_BATCH: _decode_draw_batch,
+    CLEAR: _decode_clear,
+    COLOR_CHANGE: _decode_color_change,
+    SYNC_STROKES: _decode_sync_strokes,
+}
+
+
+def encode_message(message):
+    """Encode a message dict into a single frame."""
+    encoder = _ENCODERS.get(message["type"])
+    if encoder is None:
+        fields = {key: value for key, value in message.items() if key not in ("id", "sync")}
+        code, payload = JSON, json.dumps(fields, separators=(",", ":")).encode("utf-8")
+    else:
+        code, payload = encoder(message)
+    return _frame(code, payload, message)
+
+
+def _frame(code, payload, message, with_id=True):
+    if len(payload) >= COMPRESS_MIN:
+        compressed = zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            code, payload = code | ZLIB, compressed
+    if message.get("sync"):
+        code |= SYNC
+    if with_id and "id" in message:
+        code |= HAS_ID
+        payload = MESSAGE_ID.pack(*message["id"]) + payload
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"{message['type']} payload too large ({len(payload)} bytes)")
+    return HEADER.pack(len(payload), code) + payload
+
+
+def _inflate(data):
+    inflater = zlib.decompressobj()
+    payload = inflater.decompress(data, MAX_PAYLOAD)
+    if inflater.unconsumed_tail or not inflater.eof:
+        raise ProtocolError("compressed payload too large or truncated")
+    return payload
+
+
+def decode_payload(code, view, start, end, slots=None):
+    """Decode the payload of one frame found at view[start:end].
+
+    `slots` is the connection's DRAW_DELTA slot table; frames read from
+    anywhere else cannot be DRAW_DELTA.
+    """
+    kind = code & ~FLAGS
+    decoder = _DECODERS.get(kind)
+    if decoder is None and not (kind == DRAW_DELTA and slots is not None):
+        raise ProtocolError(f"unknown message type {code}")
+    try:
+        message_id = None
+        if code & HAS_ID:
+            message_id = MESSAGE_ID.unpack_from(view, start)
+            start += MESSAGE_ID.size
+        if code & ZLIB:
+            payload = _inflate(view[start:end])
+            view, start, end = memoryview(payload), 0, len(payload)
+        if kind == DRAW_DELTA:
+            message = _decode_draw_delta(view, start, end, slots)
+        else:
+            message = decoder(view, start, end)
+        if message_id is not None:
+            message["id"] = message_id
+        if code & SYNC:
+            message["sync"] = True
+        return message
+    except ProtocolError:
+        raise
+    except (ValueError, IndexError, struct.error, zlib.error) as exc:
+        raise ProtocolError(str(exc)) from exc
+
+
+class MessageDecoder:
+    """Incremental decoder for one connection's byte stream.
+
+    Data is received straight into a single buffer and every complete
+    frame in it is decoded in place, so one recv can yield many messages
+    and a frame split across reads waits for the rest.  The buffer starts
+    small and doubles while it is more than half full of a frame still
+    arriving, so thousands of mostly idle connections stay cheap.
+    """
+
+    def __init__(self, size=RECEIVE_BUFFER):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.slots = {}  # DRAW_DELTA slot number -> _Slot, as the sender's FrameEncoder set them
+
+    def _compact(self):
+        pending = self.end - self.start
+        if 2 * pending > len(self.buffer) and len(self.buffer) < 2 * MAX_FRAME:
+            self.buffer = self.buffer[self.start:self.end] + bytes(min(2 * MAX_FRAME, 2 * len(self.buffer)) - pending)
+            self.view = memoryview(self.buffer)
+        else:
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        self.start, self.end = 0, pending
+
+    def recv_from(self, connection):
+        """Read once from a socket into the buffer; returns 0 on EOF."""
+        if self.end == len(self.buffer):
+            self._compact()
+        count = connection.recv_into(self.view[self.end:])
+        self.end += count
+        return count
+
+    def feed(self, data):
+        """Append bytes obtained elsewhere and return the decoded messages."""
+        messages = []
+        data = memoryview(data)
+        while data:
+            if self.end == len(self.buffer):
+                self._compact()
+            count = min(len(data), len(self.buffer) - self.end)
+            self.view[self.end:self.end + count] = data[:count]
+            self.end += count
+            data = data[count:]
+            messages.extend(self.messages())
+        return messages
+
+    def messages(self):
+        """Yield every complete message currently buffered."""
+        view = self.view
+        while self.end - self.start >= HEADER.size:
+            length, code = HEADER.unpack_from(view, self.start)
+            payload_start = self.start + HEADER.size
+            frame_end = payload_start + length
+            if frame_end > self.end:
+                break
+            self.start = frame_end
+            yield decode_payload(code, view, payload_start, frame_end, self.slots)
+        if self.start == self.end:
+            self.start = self.end = 0
@@ -0,0 +1,50 @@
+"""Session recordings: every message a peer handled or sent, with its time.
+
+A recording is a sequence of (seconds since start as a "!d" double,
+protocol frame) records.  PeerEngine.record() writes each message from
+a peer once it has passed duplicate suppression, and each message the
+peer broadcast itself; the peer's own ones carry its origin in their id.
+replay.py plays a recording back into a peer.
+"""
+import struct
+import threading
+import time
+
+from protocol import HEADER, decode_payload, encode_message
+
+RECORD_TIME = struct.Struct("!d")
+
+
+class Recorder:
+    """Appends timed messages to a recording; safe to write from any thread."""
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        frame = encode_message(message)
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(RECORD_TIME.pack(time.monotonic() - self.start) + frame)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    """Yield the (seconds, message) records of a file written by Recorder."""
+    with open(path, "rb") as file:
+        data = file.read()
+    view = memoryview(data)
+    offset = 0
+    while offset + RECORD_TIME.size + HEADER.size <= len(data):
+        seconds, = RECORD_TIME.unpack_from(view, offset)
+        length, code = HEADER.unpack_from(view, offset + RECORD_TIME.size)
+        start = offset + RECORD_TIME.size + HEADER.size
+        if start + length > len(data):
+            return  # Cut short while being written
+        yield seconds, decode_payload(code, view, start, start + length)
+        offset = start + length
@@ -0,0 +1,136 @@
+"""Frame-paced rendering: batch the board's canvas updates once per frame.
+
+Network threads (or the asyncio loop) hand work for the Tk thread to a
+FrameScheduler instead of scheduling a `root.after` call per message.
+Once per frame the scheduler runs the queued work, then redraws each
+stroke it touched once, whatever number of batches or segments it grew
+by, and moves each user's name tag once to where they last drew.  The
+view then finishes the frame (a ViewportView flattens settled strokes
+into its tiles there).
+"""
+import collections
+import time
+import tkinter as tk
+import traceback
+
+FRAME_MS = 16  # About 60 frames per second
+FRAME_BUDGET = 0.012  # Seconds of queued work per frame before yielding to Tk
+NAME_TAG = "name_tag"
+
+
+class FrameScheduler:
+    """Runs queued work on the Tk thread at most once per frame.
+
+    call() may be used from any thread; everything else from the Tk thread.
+    on_frame, if given, is called after each frame with (queue depth left,
+    frame time in seconds).  With a metrics.Metrics, how long each call
+    waited for its frame goes to its "callback_delay" histogram.
+    """
+
+    def __init__(self, root, view, frame_ms=FRAME_MS, budget=FRAME_BUDGET, on_frame=None, metrics=None):
+        self.root = root
+        self.view = view
+        self.frame_ms = frame_ms
+        self.budget = budget
+        self.on_frame = on_frame
+        self.metrics = metrics
+        self.inbox = collections.deque()
+        self.dirty = {}  # Stroke key -> stroke to redraw this frame
+        self.tags = {}  # User name -> (x, y, color) to show this frame
+        self.tag_items = {}  # User name -> canvas text item
+        self.frames = 0
+        self.frame_time = 0.0
+        self.max_frame_time = 0.0
+        self.job = None
+
+    def start(self):
+        self.job = self.root.after(self.frame_ms, self.frame)
+
+    def stop(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    def call(self, function, *args):
+        """Queue function(*args) for the next frame; thread safe."""
+        self.inbox.append((time.perf_counter(), function, args))
+
+    def render(self, stroke):
+        """Redraw a stroke at the end of this frame."""
+        self.dirty[stroke.key] = stroke
+
+    def remove(self, stroke):
+        self.dirty.pop(stroke.key, None)
+        self.view.remove(stroke)
+
+    def name_tag(self, user_name, x, y, color):
+        """Show a user's name where they last drew, as of the end of this frame."""
+        self.tags[user_name] = (x, y, color)
+
+    def clear_name_tags(self):
+        self.tags.clear()
+        self.tag_items.clear()
+        self.view.canvas.delete(NAME_TAG)
+
+    def depth(self):
+        return len(self.inbox)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.inbox),
+            "frames": self.frames,
+            "frame_ms": round(1000 * self.frame_time, 2),
+            "max_frame_ms": round(1000 * self.max_frame_time, 2),
+        }
+
+    def frame(self):
+        """Run queued work until the budget is spent, then draw what changed.
+
+        Work that raises is reported and skipped; the next frame is
+        scheduled whatever happens, so one bad op cannot stop the window.
+        """
+        start = time.perf_counter()
+        deadline = start + self.budget
+        try:
+            while self.inbox and time.perf_counter() < deadline:
+                queued_at, function, args = self.inbox.popleft()
+                if self.metrics is not None:
+                    self.metrics.observe("callback_delay", time.perf_counter() - queued_at)
+                try:
+                    function(*args)
+                except Exception:
+                    traceback.print_exc()
+            self.flush()
+        finally:
+            self.frame_time = time.perf_counter() - start
+            self.max_frame_time = max(self.max_frame_time, self.frame_time)
+            self.frames += 1
+            if self.on_frame is not None:
+                self.on_frame(len(self.inbox), self.frame_time)
+            delay = max(1, self.frame_ms - int(1000 * self.frame_time))
+            self.job = self.root.after(delay, self.frame)
+
+    def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        for key, stroke in dirty.items():
+            # A stroke trimmed meanwhile is a new object under the same key
+            if self.view.scene.get(key) is stroke:
+                try:
+                    self.view.render(stroke)
+                except tk.TclError:  # e.g. a color name Tk does not know; draw the others
+                    traceback.print_exc()
+        self.view.flush()
+        tags, self.tags = self.tags, {}
+        canvas = self.view.canvas
+        for user_name, (x, y, color) in tags.items():
+            x, y = self.view.to_screen(x, y)
+            item = self.tag_items.get(user_name)
+            try:
+                if item is None:
+                    self.tag_items[user_name] = canvas.create_text(
+                        x + 15, y - 10, text=user_name, fill=color, font=("Arial", 10), tags=NAME_TAG)
+                else:
+                    canvas.coords(item, x + 15, y - 10)
+                    canvas.itemconfigure(item, fill=color)
+            except tk.TclError:
+                traceback.print_exc()
@@ -0,0 +1,105 @@
+"""Play a session recording back into a peer, with or without a window.
+
+    python replay.py session.bin [--speed N | --max] [--gui] [--json]
+
+Every recorded message (recording.py) goes through process_message as if
+it had just arrived, so the board is rebuilt the way the recording peer
+built it.  Messages about the recording peer's links (hello, ping,
+peer_list, sync_request) are skipped: there is nobody at the other end.
+Messages are fed at their recorded times, --speed times faster, or with
+--max as fast as they can be.  With --gui the board is drawn in a
+whiteboard window (net4.py) through the usual frame scheduler.  Headless
+with --max, it measures the throughput of decoding, process_message and
+the board and scene updates with no network in the way.
+"""
+import argparse
+import json
+import threading
+import time
+
+from engine import PeerEngine
+from links import LINK_MESSAGES
+from recording import read_recording
+
+SKIPPED = LINK_MESSAGES + ("peer_list", "sync_request")
+
+
+def replay(peer, path, speed=1.0):
+    """Feed a recording to peer.process_message, `speed` times faster than recorded (None: flat out).
+
+    Returns the messages fed and the seconds spent reading and decoding
+    them, in process_message and in all.
+    """
+    records = read_recording(path)
+    stats = {"messages": 0, "decode_s": 0.0, "process_s": 0.0}
+    start = time.monotonic()
+    while True:
+        before = time.perf_counter()
+        record = next(records, None)
+        decoded = time.perf_counter()
+        stats["decode_s"] += decoded - before
+        if record is None:
+            break
+        at, message = record
+        if message["type"] in SKIPPED:
+            continue
+        if speed:
+            delay = start + at / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                decoded = time.perf_counter()
+        peer.process_message(message, None)
+        stats["process_s"] += time.perf_counter() - decoded
+        stats["messages"] += 1
+    stats["total_s"] = time.monotonic() - start
+    return stats
+
+
+def summary(peer, stats):
+    seconds = stats["decode_s"] + stats["process_s"]
+    return dict(stats, strokes=len(peer.scene), segments=peer.scene.segment_count,
+                messages_per_s=round(stats["messages"] / seconds) if seconds else None,
+                segments_per_s=round(peer.scene.segment_count / seconds) if seconds else None)
+
+
+def report(result, as_json):
+    if as_json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['messages']} messages in {result['total_s']:.2f} s: {result['strokes']} strokes,"
+          f" {result['segments']} segments")
+    print(f"  decode {result['decode_s']:.3f} s, process_message {result['process_s']:.3f} s:"
+          f" {result['messages_per_s']} messages/s, {result['segments_per_s']} segments/s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="play this many times faster than recorded")
+    parser.add_argument("--max", action="store_true", help="play as fast as possible")
+    parser.add_argument("--gui", action="store_true", help="draw the board in a whiteboard window")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+    speed = None if args.max else args.speed
+
+    if not args.gui:
+        peer = PeerEngine("127.0.0.1", 0, manage_links=False)
+        report(summary(peer, replay(peer, args.recording, speed)), args.json)
+        peer.close()
+        return
+
+    from net4 import WhiteboardPeer
+
+    peer = WhiteboardPeer("127.0.0.1", 0)
+    peer.root.title(f"P2P Whiteboard - replaying {args.recording}")
+
+    def play():
+        report(summary(peer, replay(peer, args.recording, speed)), args.json)
+
+    threading.Thread(target=play, daemon=True).start()
+    peer.start_gui()
+    peer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""In-memory board model: strokes in compact arrays behind a uniform grid index.
+
+The Scene is the board's state; the Tk canvas is only a view of it
+(CanvasView), so hit-testing, region queries, erasing and culling never
+have to ask Tk.  Each stroke keeps its points as one flat int16 array and
+is listed in every grid cell one of its segments passes through.
+"""
+import collections
+import itertools
+from array import array
+
+CELL_SIZE = 64
+
+
+class Stroke:
+    """One polyline: flat [x0, y0, x1, y1, ...] int16 points and its style."""
+
+    __slots__ = ("key", "order", "color", "width", "user_name", "start", "points", "bbox", "cells")
+
+    def __init__(self, key, order, color="black", width=2, user_name="", start=0):
+        self.key = key
+        self.order = order  # Drawing order; later strokes are on top
+        self.color = color
+        self.width = width
+        self.user_name = user_name
+        self.start = start  # Position in the stroke of the first point kept
+        self.points = array("h")
+        self.bbox = None  # (x0, y0, x1, y1) once there is a point
+        self.cells = set()
+
+    def __len__(self):
+        return len(self.points) // 2
+
+    @property
+    def end(self):
+        """Position in the stroke just past the last point kept."""
+        return self.start + len(self)
+
+    def segments(self):
+        """Yield (x0, y0, x1, y1) for each segment; a lone point as a zero-length one."""
+        p = self.points
+        if len(p) == 2:
+            yield p[0], p[1], p[0], p[1]
+        for i in range(0, len(p) - 2, 2):
+            yield p[i], p[i + 1], p[i + 2], p[i + 3]
+
+    def distance(self, x, y, limit=float("inf")):
+        """Distance from (x, y) to the nearest point of the stroke.
+
+        Segments whose bounding box is more than `limit` away are skipped, so
+        the result is only exact when it is within `limit`.
+        """
+        best = float("inf")
+        for ax, ay, bx, by in self.segments():
+            if (x + limit < min(ax, bx) or x - limit > max(ax, bx)
+                    or y + limit < min(ay, by) or y - limit > max(ay, by)):
+                continue
+            best = min(best, _segment_distance(x, y, ax, ay, bx, by))
+        return best
+
+    def crosses(self, x0, y0, x1, y1):
+        """True if any segment touches the rectangle."""
+        return any(_segment_in_rect(segment, x0, y0, x1, y1) for segment in self.segments())
+
+
+def _segment_distance(x, y, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length))
+    px, py = ax + t * dx - x, ay + t * dy - y
+    return (px * px + py * py) ** 0.5
+
+
+def _segment_in_rect(segment, x0, y0, x1, y1):
+    # Liang-Barsky clipping: does any part of the segment lie inside?
+    ax, ay, bx, by = segment
+    dx, dy = bx - ax, by - ay
+    low, high = 0.0, 1.0
+    for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+        if p == 0:
+            if q < 0:
+                return False
+        elif p < 0:
+            low = max(low, q / p)
+        else:
+            high = min(high, q / p)
+        if low > high:
+            return False
+    return True
+
+
+class Scene:
+    """Strokes by key, in drawing order, with a uniform grid spatial index.
+
+    Keys are whatever identifies a stroke across peers (the peers use
+    (origin, stroke number)); a stroke added without a key gets a local one.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.strokes = {}
+        self.grid = collections.defaultdict(set)
+        self.order = itertools.count()
+        self.segment_count = 0
+
+    def __len__(self):
+        return len(self.strokes)
+
+    def __iter__(self):
+        return iter(list(self.strokes.values()))
+
+    def get(self, key):
+        return self.strokes.get(key)
+
+    def add_points(self, key, index, points, color="black", width=2, user_name="", order=None):
+        """Add points starting at position `index` of stroke `key`; returns the stroke.
+
+        Creates the stroke on its first points and appends when `index` is
+        None.  Points the stroke already has are skipped, so a batch that
+        arrives twice is added once.  `order` sorts strokes that overlap;
+        by default they stack in the order they were added.
+        """
+        stroke = self.strokes.get(key) if key is not None else None
+        if stroke is None:
+            number = next(self.order)
+            key = number if key is None else key
+            order = (number,) if order is None else order
+            stroke = self.strokes[key] = Stroke(key, order, color, width, user_name, index or 0)
+        known = 0 if index is None else stroke.end - index
+        if known > 0:
+            points = points[2 * known:]
+        if len(points) < 2:
+            return stroke
+        start = len(stroke.points)
+        stroke.points.extend(array("h", points))
+        self._index(stroke, max(0, start - 2))
+        return stroke
+
+    def _index(self, stroke, start):
+        p = stroke.points
+        xs, ys = p[start::2], p[start + 1::2]
+        if stroke.bbox is None:
+            stroke.bbox = (xs[0], ys[0], xs[0], ys[0])
+        x0, y0, x1, y1 = stroke.bbox
+        stroke.bbox = (min(x0, min(xs)), min(y0, min(ys)), max(x1, max(xs)), max(y1, max(ys)))
+        self.segment_count += len(xs) - 1
+        size = self.cell_size
+        cxs = [x // size for x in xs]
+        cys = [y // size for y in ys]
+        cells = set(zip(cxs, cys))
+        # Most segments start and end in the same or a side-adjacent cell;
+        # only the others cover cells beyond their end points.
+        for ax, ay, bx, by in zip(cxs, cys, cxs[1:], cys[1:]):
+            if (ax - bx) ** 2 + (ay - by) ** 2 > 1:
+                cells.update(itertools.product(range(min(ax, bx), max(ax, bx) + 1),
+                                               range(min(ay, by), max(ay, by) + 1)))
+        cells -= stroke.cells
+        stroke.cells |= cells
+        for cell in cells:
+            self.grid[cell].add(stroke)
+
+    def remove(self, key):
+        """Remove a stroke; returns it, or None if there was none."""
+        stroke = self.strokes.pop(key, None)
+        if stroke is None:
+            return None
+        for cell in stroke.cells:
+            strokes = self.grid[cell]
+            strokes.discard(stroke)
+            if not strokes:
+                del self.grid[cell]
+        self.segment_count -= max(0, len(stroke) - 1)
+        return stroke
+
+    def trim(self, key, start):
+        """Drop the points of a stroke before position `start`; returns the stroke."""
+        stroke = self.strokes[key]
+        drop = start - stroke.start
+        if drop <= 0:
+            return stroke
+        self.remove(key)
+        return self.add_points(key, start, stroke.points[2 * drop:], stroke.color, stroke.width,
+                               stroke.user_name, stroke.order)
+
+    def clear(self):
+        self.strokes.clear()
+        self.grid.clear()
+        self.segment_count = 0
+
+    def candidates(self, x0, y0, x1, y1):
+        """Strokes listed in the grid cells overlapping the rectangle."""
+        size = self.cell_size
+        cx0, cy0, cx1, cy1 = int(x0) // size, int(y0) // size, int(x1) // size, int(y1) // size
+        found = set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.grid):
+            # Zoomed far out: fewer cells have strokes than the rectangle covers
+            for (cx, cy), strokes in self.grid.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.update(strokes)
+            return found
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                found.update(self.grid.get((cx, cy), ()))
+        return found
+
+    def visible(self, x0, y0, x1, y1):
+        """Strokes whose bounding box meets the viewport, in drawing order."""
+        return sorted(
+            (s for s in self.candidates(x0, y0, x1, y1)
+             if s.bbox[0] <= x1 and s.bbox[2] >= x0 and s.bbox[1] <= y1 and s.bbox[3] >= y0),
+            key=lambda s: s.order,
+        )
+
+    def query(self, x0, y0, x1, y1):
+        """Strokes with a segment inside the rectangle, in drawing order."""
+        return [s for s in self.visible(x0, y0, x1, y1) if s.crosses(x0, y0, x1, y1)]
+
+    def near(self, x, y, radius):
+        """Strokes passing within `radius` of (x, y), counting their width."""
+        found = []
+        for s in self.candidates(x - radius, y - radius, x + radius, y + radius):
+            limit = radius + s.width / 2
+            x0, y0, x1, y1 = s.bbox
+            if x0 - limit <= x <= x1 + limit and y0 - limit <= y <= y1 + limit and s.distance(x, y, limit) <= limit:
+                found.append(s)
+        return found
+
+    def hit_test(self, x, y, radius=3):
+        """The topmost stroke within `radius` of (x, y), or None."""
+        return max(self.near(x, y, radius), key=lambda s: s.order, default=None)
+
+    def erase(self, x, y, radius=8):
+        """Remove every stroke passing within `radius` of (x, y); returns them."""
+        return [self.remove(s.key) for s in sorted(self.near(x, y, radius), key=lambda s: s.order)]
+
+
+class CanvasView:
+    """Draws a Scene on a Tk canvas as one line item per stroke."""
+
+    def __init__(self, canvas, scene, tag="stroke"):
+        self.canvas = canvas
+        self.scene = scene
+        self.tag = tag
+        self.items = {}  # Stroke key -> canvas item
+
+    def render(self, stroke):
+        """Create or update the canvas item for a stroke."""
+        if len(stroke) < 2:
+            self.remove(stroke)  # Nothing to draw, e.g. trimmed down to a point
+            return
+        self._draw(stroke, stroke.points, stroke.width)
+
+    def _draw(self, stroke, coords, width):
+        item = self.items.get(stroke.key)
+        if item is None:
+            item = self.items[stroke.key] = self.canvas.create_line(
+                *coords, fill=stroke.color, width=width, tags=self.tag)
+            # Keep the stacking every peer agrees on, whatever the arrival order
+            above = [s for s in self.scene.visible(*stroke.bbox) if s.order > stroke.order and s.key in self.items]
+            if above:
+                self.canvas.tag_lower(item, self.items[min(above, key=lambda s: s.order).key])
+        else:
+            self.canvas.coords(item, *coords)
+        return item
+
+    def remove(self, stroke):
+        item = self.items.pop(stroke.key, None)
+        if item is not None:
+            self.canvas.delete(item)
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.items.clear()
+
+    def redraw(self, viewport=None):
+        """Re-create the items of every stroke, or only those meeting the viewport."""
+        self.clear()
+        for stroke in self.scene.visible(*viewport) if viewport else self.scene:
+            self.render(stroke)
+
+    def to_screen(self, x, y):
+        """Canvas position of a board point; the canvas is the board here."""
+        return x, y
+
+    def flush(self):
+        """End of a frame's drawing; nothing is deferred to it here."""
@@ -0,0 +1,74 @@
+"""Send-side coalescing of pointer motion into polyline batches."""
+import itertools
+import time
+
+
+class StrokeBatcher:
+    """Collects the points of the stroke being drawn into polyline batches.
+
+    `send(stroke, index, points)` is called with a flat [x0, y0, x1, y1, ...]
+    list once `max_points` points are pending or `window` seconds have passed
+    since the oldest pending point.  Each batch repeats the last point of the
+    previous one so the receiver can draw it as one connected line; `index`
+    is the position of its first point within the stroke.
+
+    The batcher has no timer of its own: the owner schedules flush() while
+    `pending` is true and calls end() when the button is released.
+    """
+
+    def __init__(self, send, window=0.012, max_points=64, clock=time.monotonic):
+        self.send = send
+        self.window = window
+        self.max_points = max_points
+        self.clock = clock
+        self.stroke_ids = itertools.count(1)
+        self.stroke = None
+        self.index = 0
+        self.points = []
+        self.oldest = None
+
+    @property
+    def pending(self):
+        return len(self.points) > 2
+
+    def begin(self, x, y):
+        """Start a new stroke at (x, y), flushing any unfinished one."""
+        self.end()
+        self.stroke = next(self.stroke_ids)
+        self.index = 0
+        self.points = [x, y]
+        self.oldest = None
+
+    def add(self, x, y):
+        """Extend the current stroke; flushes when a limit is reached."""
+        if self.stroke is None:
+            self.begin(x, y)
+            return
+        self.points += (x, y)
+        now = self.clock()
+        if self.oldest is None:
+            self.oldest = now
+        if len(self.points) >= 2 * self.max_points or now - self.oldest >= self.window:
+            self.flush()
+
+    def flush(self):
+        """Send the pending points, if any."""
+        if not self.pending:
+            return
+        self.send(self.stroke, self.index, self.points)
+        self.index += len(self.points) // 2 - 1
+        self.points = self.points[-2:]
+        self.oldest = None
+
+    def end(self):
+        """Flush and finish the current stroke.
+
+        A stroke that never grew past its first point (a click) is sent as
+        that one point, so the peers have every stroke this one has.
+        """
+        if self.stroke is not None and self.index == 0 and len(self.points) == 2:
+            self.send(self.stroke, 0, self.points)
+        self.flush()
+        self.stroke = None
+        self.points = []
+        self.oldest = None
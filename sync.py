@@ -0,0 +1,174 @@
+"""Late-joiner sync: hand a connecting peer the board drawn so far.
+
+Every peer keeps a BoardLog: a compacted snapshot of the board's strokes
+and tombstones, and the board ops applied since it was taken.  A joiner
+sends `sync_request` to the peer it connected to, which streams the
+snapshot as `sync_strokes` and `sync_tombstones` chunks, then the logged
+ops flagged `sync` (applied, never relayed), then `sync_done`.  The
+stream is paced on the connection's send queue so live relay traffic
+keeps flowing between chunks.  Board ops commute (board.py), so the
+joiner applies live ops as they come, interleaved with the stream.
+A peer that keeps a journal (journal.py) streams the board from it
+instead of holding a snapshot in memory.
+"""
+import itertools
+import threading
+
+from protocol import MAX_PAYLOAD, stroke_record_size
+
+BOARD_OPS = ("draw_event", "draw_batch", "clear", "erase")
+CHUNK_BYTES = MAX_PAYLOAD - 1024
+TOMBSTONES_PER_CHUNK = 2000
+SYNC_WINDOW = 8  # Stream messages allowed in the send queue at once
+
+
+class BoardLog:
+    """Snapshot of the board plus the ops applied since it was taken.
+
+    append() is called after an op has been applied to the board, from the
+    thread that owns the board; capture() and messages() may be called
+    from any thread.  With a journal.Journal the snapshot and ops go to
+    its file instead of being kept here.
+    """
+
+    def __init__(self, compact_every=4096, journal=None):
+        self.compact_every = compact_every
+        self.journal = journal
+        self.snapshot = ((), {"cuts": [], "dead": [], "floors": []})
+        self.ops = []
+        self.appended = 0  # Ops since the last compaction
+        self.lock = threading.Lock()
+
+    def append(self, message, board):
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append(message)
+            else:
+                self.ops.append(message)
+            self.appended += 1
+        # A clear usually leaves little to snapshot
+        if message["type"] == "clear" or self.appended >= self.compact_every:
+            self.compact(board)
+
+    def compact(self, board):
+        """Replace the snapshot with the board as it is now and empty the op tail."""
+        strokes = tuple(
+            (stroke.key, stroke.order[0], stroke.start, stroke.color, stroke.width, stroke.user_name, stroke.points[:])
+            for stroke in board.scene
+        )
+        with self.lock:
+            self.appended = 0
+            if self.journal is not None:
+                self.journal.checkpoint((strokes, board.tombstones()))
+            else:
+                self.snapshot, self.ops = (strokes, board.tombstones()), []
+
+    def capture(self):
+        """(snapshot, ops) as of now."""
+        with self.lock:
+            return self.snapshot, list(self.ops)
+
+    def messages(self):
+        """The board as a joining peer is sent it: snapshot chunks, then the ops flagged sync.
+
+        Taken as of the call; the board's thread makes it, so every op
+        handled before the joiner asked is in it.
+        """
+        if self.journal is not None:
+            return self.journal.sync_messages()
+        snapshot, ops = self.capture()
+        return itertools.chain(snapshot_chunks(snapshot), (dict(op, sync=True) for op in ops))
+
+
+def _wire_key(key):
+    # Strokes from peers that sent no id, or old single segments, only have
+    # a local key; they are sent under origin 0.
+    return key if isinstance(key, tuple) else (0, key)
+
+
+def snapshot_chunks(snapshot, chunk_bytes=CHUNK_BYTES):
+    """Yield sync_strokes messages of at most about chunk_bytes each, then the tombstones."""
+    snapshot_strokes, tombstones = snapshot
+    strokes, size = [], 0
+    for key, clock, start, color, width, user_name, points in snapshot_strokes:
+        count = len(points) // 2
+        index = 0
+        while index < count:
+            room = (chunk_bytes - size - stroke_record_size(color, user_name, 0)) // 4
+            if strokes and room < min(16, count - index):
+                yield {"type": "sync_strokes", "strokes": strokes}
+                strokes, size = [], 0
+                continue
+            take = min(room, count - index, 0x7FFF)
+            strokes.append((_wire_key(key), clock, start + index, color, width, user_name,
+                            points[2 * index:2 * (index + take)]))
+            size += stroke_record_size(color, user_name, take)
+            index += take
+    if strokes:
+        yield {"type": "sync_strokes", "strokes": strokes}
+    # After the strokes and the per-stroke tombstones, since a floor only
+    # kills strokes the joiner lacks and holds no tombstone for
+    dead = tombstones["dead"]
+    for i in range(0, max(1, len(dead)), TOMBSTONES_PER_CHUNK):
+        yield {
+            "type": "sync_tombstones",
+            "cuts": tombstones["cuts"] if i == 0 else [],
+            "dead": dead[i:i + TOMBSTONES_PER_CHUNK],
+            "floors": tombstones["floors"] if i + TOMBSTONES_PER_CHUNK >= len(dead) else [],
+        }
+
+
+def send_board(connection, messages, window=SYNC_WINDOW):
+    """Stream BoardLog.messages() to a joining peer; run on its own thread."""
+    for message in messages:
+        if not connection.queue.wait_below(window):
+            return  # The joiner went away
+        connection.send(message)
+    connection.send({"type": "sync_done"})
+
+
+def load_strokes(board, strokes):
+    """Add sync_strokes records to the board; returns the strokes that changed."""
+    changed = []
+    for key, clock, index, color, width, user_name, points in strokes:
+        stroke = board.add_points(tuple(key), index, points, clock, color, width, user_name)
+        if stroke is not None:
+            changed.append(stroke)
+    return changed
+
+
+class JoinSync:
+    """Joiner side: which connection is streaming us the board."""
+
+    def __init__(self):
+        self.source = None
+        self.waiting = False
+        self.lock = threading.Lock()
+
+    def request(self, connection):
+        """Ask a newly joined peer for its board."""
+        with self.lock:
+            self.source = connection
+            self.waiting = True
+        connection.send({"type": "sync_request"})
+
+    def on_message(self, connection):
+        """Re-request from this connection if the last source went away (e.g. a tree redirect)."""
+        with self.lock:
+            retry = self.waiting and self.source is None and not connection.closed
+        if retry:
+            self.request(connection)
+
+    def on_close(self, connection):
+        with self.lock:
+            if connection is self.source:
+                self.source = None
+
+    def finish(self, connection):
+        """Handle sync_done; False if it came from a source we gave up on."""
+        with self.lock:
+            if connection is not self.source:
+                return False
+            self.source = None
+            self.waiting = False
+            return True
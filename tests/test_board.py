@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from benchmarks.convergence import apply, session_ops, state, tombstone_growth
+from board import Board, valid_color
+
+
+def replay(ops, gc_lag=64):
+    board = Board(gc_lag=gc_lag)
+    for op in ops:
+        apply(board, op)
+    return state(board)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_shuffled_and_duplicated_orders_converge(seed):
+    ops = session_ops(seed)
+    rng = random.Random(seed)
+    expected = replay(ops)
+    for _ in range(4):
+        shuffled = ops[:]
+        rng.shuffle(shuffled)
+        shuffled += shuffled[:len(shuffled) // 3]
+        assert replay(shuffled) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_late_ops_converge_while_tombstones_are_collected(seed):
+    # No op is overtaken by more than about 30 others, well inside gc_lag
+    # strokes of its author: the lateness the floors assume
+    ops = session_ops(seed, steps=300)
+    rng = random.Random(seed)
+    expected = replay(ops, gc_lag=8)
+    for _ in range(3):
+        late = [op for _, op in sorted(((i + rng.uniform(0, 30), op) for i, op in enumerate(ops)), key=lambda t: t[0])]
+        board = Board(gc_lag=8)
+        for op in late:
+            apply(board, op)
+        assert state(board) == expected
+        assert any(floor > 1 for floor in board.floors.values())
+
+
+def test_erase_before_its_stroke_survives_collection():
+    board = Board(gc_lag=64)
+    board.erase([[7, 5, 2]])
+    for number in range(1, 80):
+        if number != 5:
+            board.add_points((7, number), 0, [0, 0, 1, 1], number)
+    board.add_points((7, 5), 0, [0, 0, 1, 1, 2, 2, 3, 3], 5)
+    assert list(board.scene.get((7, 5)).points) == [2, 2, 3, 3]
+
+
+def test_stroke_arriving_after_a_gap_is_kept():
+    board = Board(gc_lag=4)
+    for number in range(2, 20):
+        board.add_points((7, number), 0, [0, 0, 1, 1], number)
+    board.add_points((7, 1), 0, [0, 0, 1, 1], 1)
+    assert board.scene.get((7, 1)) is not None
+
+
+def test_tombstones_stay_bounded():
+    kept = tombstone_growth(4000)
+    assert max(kept) < 100
+    assert kept[-1] <= kept[0]
+
+
+@pytest.mark.parametrize("color", ["black", "#f00", "#ff0000", "#ffff0000ffff", "light blue"])
+def test_valid_colors(color):
+    assert valid_color(color)
+
+
+@pytest.mark.parametrize("color", ["", "#ff00", "red; x", '"><svg>', "#gg0000", None, 3])
+def test_invalid_colors_are_dropped(color):
+    board = Board()
+    assert not valid_color(color)
+    assert board.add_points((7, 1), 0, [0, 0, 1, 1], 1, color) is None
+    assert len(board.scene) == 0
@@ -0,0 +1,76 @@
+import os
+import time
+
+from board import Board
+from journal import Journal
+from protocol import encode_message
+from sync import BoardLog
+
+
+def batch(number):
+    return {"type": "draw_batch", "id": (7, number),
+            "data": {"stroke": number, "index": 0, "points": [number, 0, number, 10], "clock": number,
+                     "width": 2, "color": "black", "user_name": "ann"}}
+
+
+def strokes(journal):
+    return [message["data"]["stroke"] for message in journal.replay() if message["type"] == "draw_batch"]
+
+
+def test_torn_tail_is_dropped_on_reopen(tmp_path):
+    path = str(tmp_path / "board.journal")
+    journal = Journal(path)
+    for number in range(1, 6):
+        journal.append(batch(number))
+    journal.close()
+    size = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(encode_message(batch(6))[:-3])
+
+    journal = Journal(path)
+    assert os.path.getsize(path) == journal.size == size
+    assert strokes(journal) == [1, 2, 3, 4, 5]
+    journal.append(batch(6))
+    journal.close()
+    assert strokes(Journal(path)) == [1, 2, 3, 4, 5, 6]
+
+
+def test_unfinished_checkpoint_is_dropped_on_reopen(tmp_path):
+    path = str(tmp_path / "board.journal")
+    journal = Journal(path)
+    for number in range(1, 4):
+        journal.append(batch(number))
+    journal.close()
+    with open(path, "ab") as file:
+        file.write(encode_message({"type": "checkpoint", "back": 0}))
+        file.write(encode_message({"type": "sync_strokes", "strokes": []}))
+
+    journal = Journal(path)
+    assert strokes(journal) == [1, 2, 3]
+
+
+def test_replay_after_a_checkpoint_rebuilds_the_board(tmp_path):
+    path = str(tmp_path / "board.journal")
+    board = Board()
+    journal = Journal(path)
+    log = BoardLog(journal=journal)
+    for number in range(1, 4):
+        message = batch(number)
+        board.add_points((7, number), 0, message["data"]["points"], number)
+        log.append(message, board)
+    log.compact(board)
+    deadline = time.time() + 5
+    while journal.live_from == 0 and time.time() < deadline:
+        time.sleep(0.01)  # The checkpoint is written on a background thread
+    journal.append(batch(4))
+    journal.close()
+
+    replayed = Board()
+    for message in Journal(path).replay():
+        if message["type"] == "sync_strokes":
+            for key, clock, start, color, width, user_name, points in message["strokes"]:
+                replayed.add_points(key, start, points, clock, color, width, user_name)
+        elif message["type"] == "draw_batch":
+            data = message["data"]
+            replayed.add_points((message["id"][0], data["stroke"]), data["index"], data["points"], data["clock"])
+    assert sorted(replayed.scene.strokes) == [(7, 1), (7, 2), (7, 3), (7, 4)]
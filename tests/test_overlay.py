@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from benchmarks.harness import HeadlessPeer
+from benchmarks.overlay_sim import build, draw, settle
+
+
+@pytest.fixture
+def peers():
+    started = []
+    yield started
+    for peer in started:
+        peer.close()
+
+
+def find(peers, address):
+    return next(peer for peer in peers if (peer.host, peer.port) == address)
+
+
+def leave(peers, peer):
+    peer.close()
+    peers.remove(peer)
+    settle(peers)
+
+
+def test_tree_reaches_everyone_after_the_heir_and_then_the_root_leave(peers):
+    peers += build("tree", 8)
+    root = peers[0]
+    with root.overlay.lock:
+        heir = find(peers, root.overlay.children[0].peer_address)
+    leave(peers, heir)
+    leave(peers, root)
+    _, _, coverage = draw(peers, peers[:3], 5)
+    assert coverage == 1
+
+
+def test_tree_child_rejoins_when_its_parent_leaves(peers):
+    peers += build("tree", 8)
+    parent = next(peer for peer in peers[1:] if peer.overlay.children)
+    orphans = [find(peers, child.peer_address) for child in parent.overlay.children]
+    leave(peers, parent)
+    assert all(orphan.overlay.parent is not None for orphan in orphans)
+    _, _, coverage = draw(peers, peers[:3], 5)
+    assert coverage == 1
+
+
+def test_full_mesh_draws_each_batch_once_with_traffic_linear_in_edges(peers):
+    for _ in range(10):
+        peer = HeadlessPeer()
+        for other in peers:
+            peer.join(other)
+        peers.append(peer)
+    settle(peers)
+    edges = sum(peer.overlay.neighbours() for peer in peers) // 2
+    assert edges == 45
+    before = sum(peer.frames_sent() for peer in peers)
+    sent = {}
+    for number in range(1, 21):
+        origin = peers[number % len(peers)]
+        message = origin.broadcast({"type": "draw_batch", "data": {
+            "stroke": number, "index": 0, "points": [number, 0, number, 10], "clock": number,
+            "width": 2, "color": "black", "user_name": "ann"}})
+        sent[message["id"]] = origin
+    deadline = time.time() + 10
+    while time.time() < deadline and sum(len(peer.drawn) for peer in peers) < len(sent) * (len(peers) - 1):
+        time.sleep(0.05)
+    time.sleep(0.2)
+    for peer in peers:
+        assert peer.drawn == {message_id: 1 for message_id, origin in sent.items() if origin is not peer}
+    assert sum(peer.frames_sent() for peer in peers) - before <= 2 * edges * len(sent)
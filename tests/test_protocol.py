@@ -0,0 +1,65 @@
+from array import array
+
+from protocol import DRAW_DELTA, FLAGS, HEADER, ZLIB, FrameEncoder, MessageDecoder, encode_message
+
+MESSAGES = [
+    {"type": "draw_event", "data": {"prev_x": 1, "prev_y": 2, "x": 3, "y": 4, "user_name": "ann"}},
+    {"type": "draw_batch", "id": (7, 1), "data": {"stroke": 3, "index": 0, "points": [1, 2, 3, 4, 5, 6],
+                                                  "clock": 9, "width": 2, "color": "#ff0000", "user_name": "ann"}},
+    {"type": "clear", "id": (7, 2), "cut": [[7, 3, 2]]},
+    {"type": "color_change", "color": "#00ff00"},
+    {"type": "hello", "origin": 7, "addr": ["127.0.0.1", 5000]},
+    {"type": "sync_strokes", "strokes": [((7, 3), 5, 0, "#ff0000", 3, "ann", [1, 2, 3, 4])]},
+    {"type": "erase", "id": (7, 4), "strokes": [[7, 3, 2]]},
+]
+
+
+def plain(value):
+    """Decoded points are arrays and ids tuples; compare them as lists."""
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, array)):
+        return [plain(item) for item in value]
+    return value
+
+
+def decode(frames):
+    decoder = MessageDecoder()
+    messages = []
+    for frame in frames:
+        # Fed a byte at a time, as a slow socket might deliver it
+        for i in range(len(frame)):
+            messages += decoder.feed(frame[i:i + 1])
+    return messages
+
+
+def code(frame):
+    return HEADER.unpack_from(frame)[1]
+
+
+def test_every_message_type_round_trips():
+    assert [plain(m) for m in decode([encode_message(m) for m in MESSAGES])] == [plain(m) for m in MESSAGES]
+
+
+def test_sync_flag_round_trips():
+    message = dict(MESSAGES[1], sync=True)
+    assert decode([encode_message(message)])[0]["sync"] is True
+
+
+def test_large_payloads_are_compressed():
+    message = {"type": "peer_list", "peers": [["10.0.%d.%d" % (i // 250, i % 250), 5000] for i in range(200)]}
+    frame = encode_message(message)
+    assert code(frame) & ZLIB
+    assert decode([frame]) == [message]
+
+
+def test_batches_after_the_first_are_delta_encoded():
+    encoder = FrameEncoder()
+    points = [[10 * n, 5, 10 * n + 4, 6, 10 * n + 7, 8, 10 * n + 10, 9] for n in range(3)]
+    messages = [{"type": "draw_batch", "id": (7, n + 1),
+                 "data": {"stroke": 3, "index": 3 * n, "points": points[n],
+                          "clock": 9, "width": 2, "color": "#ff0000", "user_name": "ann"}} for n in range(3)]
+    frames = [encoder.encode(message) for message in messages]
+    assert [code(frame) & ~FLAGS for frame in frames[1:]] == [DRAW_DELTA, DRAW_DELTA]
+    assert sum(map(len, frames[1:])) < 2 * len(encode_message(messages[0]))
+    assert [plain(m) for m in decode(frames)] == [plain(m) for m in messages]
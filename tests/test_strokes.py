@@ -0,0 +1,33 @@
+from strokes import StrokeBatcher
+
+
+def test_batches_repeat_the_last_point_and_count_the_index():
+    sent = []
+    now = [0.0]
+    batcher = StrokeBatcher(lambda *batch: sent.append(batch), window=1, max_points=3, clock=lambda: now[0])
+    batcher.begin(0, 0)
+    for x in range(1, 5):
+        batcher.add(x, x)
+    batcher.end()
+    assert sent == [(1, 0, [0, 0, 1, 1, 2, 2]), (1, 2, [2, 2, 3, 3, 4, 4])]
+
+
+def test_flushes_once_the_window_has_passed():
+    sent = []
+    now = [0.0]
+    batcher = StrokeBatcher(lambda *batch: sent.append(batch), window=0.01, clock=lambda: now[0])
+    batcher.begin(0, 0)
+    batcher.add(1, 1)
+    now[0] = 0.02
+    batcher.add(2, 2)
+    assert sent == [(1, 0, [0, 0, 1, 1, 2, 2])]
+
+
+def test_a_click_is_sent_as_a_one_point_stroke():
+    sent = []
+    batcher = StrokeBatcher(lambda *batch: sent.append(batch))
+    batcher.begin(5, 6)
+    batcher.end()
+    batcher.begin(7, 8)
+    batcher.end()
+    assert sent == [(1, 0, [5, 6]), (2, 0, [7, 8])]
@@ -0,0 +1,69 @@
+import time
+
+from transport import SendQueue
+
+
+def batch(sequence, index, points, origin=7, stroke=3, color="#ff0000", clock=9):
+    return {"type": "draw_batch", "id": (origin, sequence),
+            "data": {"stroke": stroke, "index": index, "points": points, "clock": clock, "color": color}}
+
+
+def test_consecutive_batches_of_a_stroke_coalesce():
+    queue = SendQueue()
+    queue.put(batch(1, 0, [0, 0, 1, 1]))
+    queue.put(batch(2, 1, [1, 1, 2, 2, 3, 3]))
+    queue.put(batch(3, 3, [3, 3, 4, 4]))
+    (merged,) = queue.take()
+    assert list(merged["data"]["points"]) == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+    assert merged["id"] == (7, 1)
+    assert queue.coalesced == 2
+
+
+def test_batches_that_do_not_chain_stay_apart():
+    cases = [
+        batch(2, 1, [1, 1, 2, 2], origin=8),
+        batch(3, 1, [1, 1, 2, 2]),
+        batch(2, 2, [1, 1, 2, 2]),
+        batch(2, 1, [1, 1, 2, 2], stroke=4),
+        batch(2, 1, [1, 1, 2, 2], color="#00ff00"),
+        batch(2, 1, [1, 1, 2, 2], clock=10),
+        {"type": "draw_batch", "data": batch(2, 1, [1, 1, 2, 2])["data"]},
+    ]
+    for message in cases:
+        queue = SendQueue()
+        queue.put(batch(1, 0, [0, 0, 1, 1]))
+        queue.put(message)
+        assert len(queue.take()) == 2
+
+
+def test_a_batch_behind_another_message_is_not_merged_into_an_older_one():
+    queue = SendQueue()
+    queue.put(batch(1, 0, [0, 0, 1, 1]))
+    queue.put({"type": "color_change", "color": "#00ff00"})
+    queue.put(batch(2, 1, [1, 1, 2, 2]))
+    assert len(queue.take()) == 3
+
+
+def test_full_queue_refuses_without_blocking():
+    queue = SendQueue(maxsize=2)
+    assert queue.put({"type": "hello"}) and queue.put({"type": "hello"})
+    start = time.perf_counter()
+    assert not queue.put({"type": "hello"}, block=False)
+    assert time.perf_counter() - start < 0.05
+    assert queue.dropped == 1 and len(queue) == 2
+
+
+def test_full_queue_gives_up_after_block_timeout():
+    queue = SendQueue(maxsize=1, block_timeout=0.05)
+    queue.put({"type": "hello"})
+    start = time.perf_counter()
+    assert not queue.put(batch(1, 0, [0, 0, 1, 1]))
+    assert 0.04 < time.perf_counter() - start < 1
+    assert queue.dropped == 1
+
+
+def test_closed_queue_refuses():
+    queue = SendQueue()
+    queue.close()
+    assert not queue.put({"type": "hello"})
+    assert queue.get_all() == []
@@ -0,0 +1,487 @@
+"""Peer connections with a bounded outbound queue and a writer thread each.
+
+relay_message only ever enqueues, so a slow or stalled peer backs up its
+own queue instead of the Tk main thread or the other peers' deliveries.
+ThreadTransport runs one reader and one writer thread per peer; the
+asyncio alternative with the same interface is in aio_transport.py.
+Both keep their open connections in a ConnectionRegistry.
+
+Peers on the same host skip TCP: with local on, a transport listening on
+an address also listens on a Unix domain socket named after it
+(local_path), and connect() to that address goes through the socket when
+it exists.  The sockets live in a directory only this user can open
+(local_dir), so nobody else on the machine can stand in for a peer.  The
+frames are the same; only the kernel's work is less.
+"""
+import collections
+import contextlib
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+from array import array
+
+from protocol import FrameEncoder, MessageDecoder, ProtocolError
+
+# What a full queue does with a new message of a given type.  Where the
+# caller must not wait (the Tk thread, the asyncio loop) a full queue
+# refuses the message instead and the peer is let go.
+BLOCK = "block"  # wait for room, give up on the peer after block_timeout
+COALESCE = "coalesce"  # merge into the queued batch of the same stroke, else block
+
+POLICIES = {
+    "draw_batch": COALESCE,
+    "draw_event": COALESCE,
+}
+
+MAX_COALESCED_POINTS = 2048
+ACCEPT_RETRY_DELAY = 0.1  # Seconds to wait after accept() fails, e.g. out of descriptors
+LOCAL_SOCKETS = hasattr(socket, "AF_UNIX") and os.name == "posix"
+LOCAL_ADDRESS = ("localhost", 0)  # What a peer that came in over a Unix socket is known as
+
+
+WILDCARD_HOSTS = ("", "0.0.0.0")
+
+
+def local_dir():
+    """This user's private directory for Unix sockets, or None if there is no safe one."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        path = os.path.join(runtime, "p2p-whiteboard")
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"p2p-whiteboard-{os.getuid()}")
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        return None  # Made by someone else first, or open to others
+    return path
+
+
+def local_path(host, port):
+    """The Unix socket of the peer listening on (host, port) of this host, or None."""
+    directory = local_dir()
+    if directory is None:
+        return None
+    return os.path.join(directory, f"{_socket_host(host)}-{port}.sock")
+
+
+def _socket_host(host):
+    return "0.0.0.0" if host in WILDCARD_HOSTS else "127.0.0.1" if host == "localhost" else host
+
+
+def local_paths(host, port):
+    """The Unix sockets that connecting to (host, port) could reach, most specific first."""
+    yield local_path(host, port)
+    if host not in WILDCARD_HOSTS and is_local(host):
+        yield local_path("0.0.0.0", port)  # A peer listening on every address
+
+
+def same_listener(dialed, announced):
+    """True if a peer announcing it listens on `announced` is the one `dialed` reaches."""
+    if dialed[1] != announced[1]:
+        return False
+    return announced[0] in WILDCARD_HOSTS or _socket_host(dialed[0]) == _socket_host(announced[0])
+
+
+def is_local(host):
+    """True if host is this machine: a loopback address or one of our own."""
+    if host in ("localhost", "0.0.0.0", "") or host.startswith("127."):
+        return True
+    try:
+        return host in socket.gethostbyname_ex(socket.gethostname())[2]
+    except OSError:
+        return False
+
+
+def report_error(connection, error):
+    """A message could not be handled or encoded; the connection is closed over it."""
+    print(f"Closing the connection with {connection.address}: {error!r}", flush=True)
+
+
+def claim_local_path(path):
+    """Remove a stale socket left at path by a peer that died; False if a live one owns it."""
+    if not os.path.exists(path):
+        return True
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            pass
+        else:
+            return False  # Another of our peers is still listening there
+    try:
+        os.unlink(path)
+    except OSError:
+        return False
+    return True
+
+
+def _merge_batches(queued, message, sequence):
+    """Return queued and message as one draw_batch, or None if they don't chain.
+
+    `sequence` is the id sequence number of the last batch merged into
+    queued.  Stroke numbers are only unique per origin, so only batches
+    from the same origin, sent one right after the other, are merged.
+    """
+    if queued["type"] != "draw_batch" or message["type"] != "draw_batch":
+        return None
+    if "id" not in queued or "id" not in message or sequence is None:
+        return None
+    if queued["id"][0] != message["id"][0] or message["id"][1] != sequence + 1:
+        return None
+    head, tail = queued["data"], message["data"]
+    if head["stroke"] != tail["stroke"] or head.get("user_name") != tail.get("user_name"):
+        return None
+    if head.get("clock") != tail.get("clock") or head.get("color") != tail.get("color"):
+        return None
+    if head["index"] + len(head["points"]) // 2 - 1 != tail["index"]:
+        return None
+    if len(head["points"]) + len(tail["points"]) > 2 * MAX_COALESCED_POINTS:
+        return None
+    points = array("h", head["points"])
+    points.extend(array("h", tail["points"][2:]))
+    return dict(queued, data=dict(head, points=points))
+
+
+class SendQueue:
+    """Bounded FIFO of outbound messages applying the per-type POLICIES."""
+
+    def __init__(self, maxsize=1024, block_timeout=1.0):
+        self.items = collections.deque()
+        self.maxsize = maxsize
+        self.block_timeout = block_timeout
+        self.condition = threading.Condition()
+        self.closed = False
+        self.max_depth = 0
+        self.dropped = 0  # Messages refused by a full queue
+        self.coalesced = 0
+        self.last = (None, None)  # (items[-1] as queued, sequence of the last batch merged into it)
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, message, block=True):
+        """Queue a message; returns False if the queue stayed full or is closed."""
+        policy = POLICIES.get(message["type"], BLOCK)
+        with self.condition:
+            if self.closed:
+                return False
+            if policy == COALESCE and self.items:
+                # Anything still queued has not reached the writer yet, so
+                # extending it costs nothing and saves a frame.
+                queued, sequence = self.last
+                merged = None
+                if queued is self.items[-1]:
+                    merged = _merge_batches(queued, message, sequence)
+                if merged is not None:
+                    self.items[-1] = merged
+                    self.last = (merged, message["id"][1])
+                    self.coalesced += 1
+                    return True
+            if len(self.items) >= self.maxsize:
+                if not block or not self.condition.wait_for(
+                        lambda: self.closed or len(self.items) < self.maxsize, self.block_timeout):
+                    self.dropped += 1
+                    return False
+                if self.closed:
+                    return False
+            self.items.append(message)
+            self.last = (message, message["id"][1] if "id" in message else None)
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+            return True
+
+    def take(self):
+        """Take every queued message without waiting."""
+        with self.condition:
+            items = list(self.items)
+            self.items.clear()
+            self.condition.notify_all()
+            return items
+
+    def wait_below(self, depth):
+        """Wait until fewer than `depth` messages are queued; False once closed."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or len(self.items) < depth)
+            return not self.closed
+
+    def get_all(self):
+        """Wait for messages and take all of them; returns [] once closed."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.items)
+            if self.closed:
+                return []
+            return self.take()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.condition.notify_all()
+
+
+class ConnectionRegistry:
+    """The open connections of a transport; safe to change and read from any thread.
+
+    add() and discard() are O(1) under a lock.  Iterating goes over an
+    immutable snapshot, rebuilt at most once per change when it is next
+    read, so fanning a message out neither copies the list nor takes the
+    lock, and a connection closing meanwhile cannot upset it.
+    """
+
+    def __init__(self):
+        self.connections = {}  # Used as an insertion-ordered set
+        self.frozen = ()
+        self.lock = threading.Lock()
+
+    def add(self, connection):
+        with self.lock:
+            self.connections[connection] = None
+            self.frozen = None
+
+    def discard(self, connection):
+        """Forget a connection; returns False if it was not registered."""
+        with self.lock:
+            if connection not in self.connections:
+                return False
+            del self.connections[connection]
+            self.frozen = None
+            return True
+
+    def snapshot(self):
+        frozen = self.frozen
+        if frozen is None:
+            with self.lock:
+                if self.frozen is None:
+                    self.frozen = tuple(self.connections)
+                frozen = self.frozen
+        return frozen
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __contains__(self, connection):
+        return connection in self.connections
+
+
+class BaseConnection:
+    """A connection to one peer, whichever transport runs it.
+
+    Holds its send queue, what we know of the peer and its traffic
+    counters; the transports add the socket and the reading and writing.
+    """
+
+    def __init__(self, address, maxsize=1024):
+        self.address = address
+        self.peer_address = None  # Listening address the peer announced, if any
+        self.dialed = False  # True if we opened it, False if the peer did
+        self.local = False  # True if it runs over a Unix socket
+        self.queue = SendQueue(maxsize)
+        self.encoder = FrameEncoder()  # Only ever used by the writer
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.messages_received = 0
+        self.bytes_received = 0
+        self.decode_time = 0.0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def closing(self, expected=(OSError,)):
+        """Close the connection however the block ends, reporting errors but the `expected` ones.
+
+        Wraps a reader or writer loop: a peer that hangs up or sends garbage
+        ends it quietly, a message we fail to handle or encode is reported.
+        """
+        try:
+            yield
+        except expected:
+            pass
+        except Exception as error:
+            report_error(self, error)
+        finally:
+            self.close()
+
+    def stats(self):
+        """Queue depth and traffic counters for this peer."""
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.queue.max_depth,
+            "dropped": self.queue.dropped,
+            "coalesced": self.queue.coalesced,
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+            "messages_received": self.messages_received,
+            "bytes_received": self.bytes_received,
+            "decode_ms": round(1000 * self.decode_time, 3),
+        }
+
+
+class PeerConnection(BaseConnection):
+    """A socket to one peer, written to by its own thread."""
+
+    def __init__(self, sock, address, on_close=None, maxsize=1024):
+        super().__init__(address, maxsize)
+        self.socket = sock
+        self.on_close = on_close
+        threading.Thread(target=self._writer, daemon=True).start()
+
+    def send(self, message, block=True):
+        """Queue a message for this peer without waiting for the network.
+
+        With block false, a full queue gives up on the peer at once rather
+        than waiting for room.
+        """
+        if not self.queue.put(message, block):
+            self.close()
+
+    def _writer(self):
+        with self.closing():
+            while True:
+                messages = self.queue.get_all()
+                if not messages:
+                    break
+                data = b"".join(map(self.encoder.encode, messages))
+                self.socket.sendall(data)
+                self.messages_sent += len(messages)
+                self.bytes_sent += len(data)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.close()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        if self.on_close:
+            self.on_close(self)
+
+
+class ThreadTransport:
+    """Accepts and opens peer connections, reading each on its own thread.
+
+    on_message(message, connection) is called on the reader threads.
+    """
+
+    def __init__(self, on_message, on_accept=None, on_close=None, maxsize=1024, local=True):
+        self.on_message = on_message
+        self.on_accept = on_accept
+        self.on_close = on_close
+        self.maxsize = maxsize
+        self.local = local and LOCAL_SOCKETS
+        self.connections = ConnectionRegistry()
+        self.server = None
+        self.local_server = None
+        self.is_running = True
+
+    def listen(self, host, port):
+        """Bind and start accepting peers in the background."""
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(128)
+        threading.Thread(target=self._accept, args=(self.server,), daemon=True).start()
+        path = local_path(host, self.server.getsockname()[1]) if self.local else None
+        if path is not None and claim_local_path(path):
+            self.local_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.local_server.bind(path)
+            self.local_server.listen(128)
+            threading.Thread(target=self._accept, args=(self.local_server,), daemon=True).start()
+
+    def _accept(self, server):
+        while self.is_running:
+            try:
+                sock, address = server.accept()
+            except OSError as error:
+                if not self.is_running:
+                    break  # close() shut the server socket
+                # e.g. EMFILE or ECONNABORTED under churn; keep serving, as asyncio does
+                print(f"Accepting a peer failed: {error!r}", flush=True)
+                time.sleep(ACCEPT_RETRY_DELAY)
+                continue
+            connection = self._add(sock, address if server is self.server else LOCAL_ADDRESS)
+            if self.on_accept:
+                self.on_accept(connection)
+
+    def connect(self, host, port):
+        """Open a connection to a peer; raises OSError if it is unreachable."""
+        for path in local_paths(host, port) if self.local else ():
+            if path is None or not os.path.exists(path):
+                continue
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                return self._add(sock, (host, port), dialed=True)
+            except OSError:
+                sock.close()  # Stale; try the next, then TCP
+        sock = socket.create_connection((host, port))
+        return self._add(sock, (host, port), dialed=True)
+
+    def _add(self, sock, address, dialed=False):
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = PeerConnection(sock, address, on_close=self._remove, maxsize=self.maxsize)
+        connection.dialed = dialed
+        connection.local = sock.family == socket.AF_UNIX
+        self.connections.add(connection)
+        threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+        return connection
+
+    def _read(self, connection):
+        decoder = MessageDecoder()
+        with connection.closing((OSError, ProtocolError)):
+            while self.is_running:
+                count = decoder.recv_from(connection.socket)
+                if not count:
+                    break
+                connection.bytes_received += count
+                messages = decoder.messages()
+                while True:
+                    start = time.perf_counter()
+                    message = next(messages, None)
+                    connection.decode_time += time.perf_counter() - start
+                    if message is None:
+                        break
+                    connection.messages_received += 1
+                    self.on_message(message, connection)
+
+    def _remove(self, connection):
+        self.connections.discard(connection)
+        if self.on_close:
+            self.on_close(connection)
+
+    def close(self):
+        self.is_running = False
+        if self.server is not None:
+            self.server.close()
+        if self.local_server is not None:
+            path = self.local_server.getsockname()
+            self.local_server.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        for connection in self.connections:
+            connection.close()
+
+
+def create_transport(kind, on_message, **kwargs):
+    """Build the "threads" or "asyncio" transport."""
+    if kind == "asyncio":
+        from aio_transport import AsyncTransport
+        return AsyncTransport(on_message, **kwargs)
+    if kind != "threads":
+        raise ValueError(f"unknown transport {kind!r}")
+    return ThreadTransport(on_message, **kwargs)
@@ -0,0 +1,436 @@
+"""Zoom, pan, culling and level of detail for drawing a large board.
+
+The board is as big as its int16 coordinates allow, 65536 pixels across;
+the canvas is a window onto it.  A ViewportView draws a Scene the way
+CanvasView does, but only the strokes that meet the window, scaled to its
+zoom.  Zoomed out, a finished stroke is drawn from a Ramer-Douglas-Peucker
+simplification of its points that stays within half a pixel of it; a
+frame simplifies for SIMPLIFY_BUDGET, and strokes still waiting keep their
+old item or are drawn with all their points until a later frame.  With
+Pillow installed, strokes left unchanged for a few seconds are flattened
+into cached bitmap tiles under the live ones, so the canvas holds a dozen
+image items plus the strokes being drawn, and a redraw costs what is on
+screen rather than the board's history.
+
+The mouse wheel zooms about the pointer and the middle button drags the
+board around.
+"""
+import collections
+import math
+import time
+import tkinter as tk
+import traceback
+
+try:
+    from PIL import Image, ImageColor, ImageDraw, ImageTk
+except ImportError:  # Without Pillow every visible stroke stays a canvas item
+    Image = None
+
+from scene import CanvasView
+
+BOARD_MIN, BOARD_MAX = -32768, 32767  # Points are int16
+ZOOM_STEPS = 4  # Wheel steps per doubling
+MIN_ZOOM, MAX_ZOOM = -6 * ZOOM_STEPS, 3 * ZOOM_STEPS  # 1/64x to 8x
+TILE_SIZE = 256  # Screen pixels
+MAX_TILES = 64  # Tile images kept, about 16 MB
+SETTLE_SECONDS = 2.0  # A stroke unchanged this long is finished
+MARGIN = 8  # Board units around a stroke's points its width may cover
+TILE_BUDGET = 0.008  # Seconds of tile drawing per frame; the rest waits for the next
+SIMPLIFY_BUDGET = 0.008  # Seconds of simplifying line items per frame, likewise
+TILE_TAG = "tile"
+
+
+def simplify(points, tolerance):
+    """Ramer-Douglas-Peucker: the flat points of a polyline that keep it within `tolerance`."""
+    xs, ys = points[0::2], points[1::2]
+    count = len(xs)
+    if count < 3:
+        return list(points)
+    keep = bytearray(count)
+    keep[0] = keep[-1] = 1
+    limit = tolerance * tolerance
+    spans = [(0, count - 1)]
+    while spans:
+        first, last = spans.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length = dx * dx + dy * dy
+        farthest, index = limit, None
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            t = px * dx + py * dy
+            if t <= 0:
+                distance = px * px + py * py
+            elif t >= length:
+                qx, qy = px - dx, py - dy
+                distance = qx * qx + qy * qy
+            else:
+                cross = px * dy - py * dx
+                distance = cross * cross / length
+            if distance > farthest:
+                farthest, index = distance, i
+        if index is not None:
+            keep[index] = 1
+            spans += ((first, index), (index, last))
+    return [value for i in range(count) if keep[i] for value in (xs[i], ys[i])]
+
+
+class Viewport:
+    """The part of the board on the canvas: the board point at its top left and a zoom step."""
+
+    def __init__(self, x=0.0, y=0.0, zoom=0):
+        self.x = x
+        self.y = y
+        self.zoom = zoom
+
+    @property
+    def scale(self):
+        """Screen pixels per board unit."""
+        return 2 ** (self.zoom / ZOOM_STEPS)
+
+    @property
+    def level(self):
+        """Level of detail: finished strokes are simplified to within 2 ** level / 2 board units."""
+        return max(0, -self.zoom // ZOOM_STEPS)
+
+    def to_world(self, sx, sy):
+        """The board point at a canvas position, rounded and kept on the board."""
+        scale = self.scale
+        return (min(BOARD_MAX, max(BOARD_MIN, round(self.x + sx / scale))),
+                min(BOARD_MAX, max(BOARD_MIN, round(self.y + sy / scale))))
+
+    def to_screen(self, x, y):
+        scale = self.scale
+        return (x - self.x) * scale, (y - self.y) * scale
+
+    def rect(self, width, height):
+        """The board rectangle a canvas of this size shows."""
+        scale = self.scale
+        return self.x, self.y, self.x + width / scale, self.y + height / scale
+
+    def pan(self, dx, dy):
+        """Move the board by (dx, dy) screen pixels."""
+        scale = self.scale
+        self.x -= dx / scale
+        self.y -= dy / scale
+
+    def zoom_at(self, steps, sx, sy):
+        """Zoom in by `steps` (out if negative) about a canvas position; returns the scale factor."""
+        before = self.scale
+        x, y = self.x + sx / before, self.y + sy / before
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, self.zoom + steps))
+        after = self.scale
+        self.x, self.y = x - sx / after, y - sy / after
+        return after / before
+
+
+class ViewportView(CanvasView):
+    """Draws the part of a Scene a Viewport shows on a Tk canvas.
+
+    A stroke changed in the last `settle` seconds is a line item with all
+    its points.  After that it is simplified for the zoom and, with
+    `tiles`, drawn into the tile images instead, which sit under every
+    line item.  A FrameScheduler calls flush() once per frame to do this.
+    """
+
+    def __init__(self, canvas, scene, viewport=None, tag="stroke", tiles=Image is not None,
+                 settle=SETTLE_SECONDS, clock=time.monotonic):
+        super().__init__(canvas, scene, tag)
+        self.viewport = viewport or Viewport()
+        self.tiles = tiles
+        self.settle = settle
+        self.clock = clock
+        self.live = {}  # Stroke key -> when it last changed, until it settles
+        self.flat = {}  # Stroke key -> bbox, for the settled strokes drawn in tiles
+        self.simplified = {}  # Stroke key -> (level, start, end, points)
+        self.pending = set()  # Keys of line items waiting for their simplification
+        self.deadline = 0.0  # When this frame's SIMPLIFY_BUDGET runs out
+        self.tile_images = collections.OrderedDict()  # (zoom, tx, ty) -> image or None, least recently used first
+        self.tile_items = {}  # (zoom, tx, ty) -> canvas item of a tile on screen
+        self.stale = False  # A tile on screen may need drawing again
+        self.next_settle = 0.0
+        self.colors = {}
+        self.grab = None
+
+    def size(self):
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width <= 1:  # Not on screen yet
+            width, height = int(self.canvas.cget("width")), int(self.canvas.cget("height"))
+        return width, height
+
+    def to_world(self, sx, sy):
+        return self.viewport.to_world(sx, sy)
+
+    def to_screen(self, x, y):
+        return self.viewport.to_screen(x, y)
+
+    def render(self, stroke):
+        self.live[stroke.key] = self.clock()
+        bbox = self.flat.pop(stroke.key, None)
+        if bbox is not None:
+            self._invalidate(bbox)  # Changed after it settled, e.g. trimmed by an erase
+        if len(stroke) < 2 or not self._meets(stroke, self.viewport.rect(*self.size())):
+            super().remove(stroke)
+            return
+        self._draw(stroke)
+
+    def _draw(self, stroke, rescale=False):
+        width = max(1, stroke.width * self.viewport.scale)
+        points = self._points(stroke, deadline=self.deadline)
+        if points is None:  # Out of time: keep the item as canvas.scale left it, else draw every point
+            self.pending.add(stroke.key)
+            item = self.items.get(stroke.key)
+            if item is not None:
+                if rescale:
+                    self.canvas.itemconfigure(item, width=width)
+                return
+            points = stroke.points
+        item = super()._draw(stroke, self._screen(points), width)
+        if rescale:
+            self.canvas.itemconfigure(item, width=width)
+
+    def _points(self, stroke, level=None, deadline=None):
+        """All of a live stroke's points, else those of its simplification for the level.
+
+        None if the simplification is not cached and `deadline` has passed.
+        """
+        level = self.viewport.level if level is None else level
+        if level == 0 or stroke.key in self.live:
+            return stroke.points
+        cached = self.simplified.get(stroke.key)
+        if cached is None or cached[:3] != (level, stroke.start, stroke.end):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            cached = self.simplified[stroke.key] = (level, stroke.start, stroke.end,
+                                                    simplify(stroke.points, 2 ** level / 2))
+        return cached[3]
+
+    def _screen(self, points):
+        viewport = self.viewport
+        scale = viewport.scale
+        if scale == 1 and viewport.x == viewport.y == 0:
+            return points
+        left, top = viewport.x * scale, viewport.y * scale
+        coords = [0.0] * len(points)
+        coords[0::2] = [x * scale - left for x in points[0::2]]
+        coords[1::2] = [y * scale - top for y in points[1::2]]
+        return coords
+
+    @staticmethod
+    def _meets(stroke, rect):
+        x0, y0, x1, y1 = stroke.bbox
+        return (x0 <= rect[2] + MARGIN and x1 >= rect[0] - MARGIN
+                and y0 <= rect[3] + MARGIN and y1 >= rect[1] - MARGIN)
+
+    def remove(self, stroke):
+        super().remove(stroke)
+        self.live.pop(stroke.key, None)
+        self.simplified.pop(stroke.key, None)
+        self.pending.discard(stroke.key)
+        bbox = self.flat.pop(stroke.key, None)
+        if bbox is not None:
+            self._invalidate(bbox)
+
+    def clear(self):
+        super().clear()
+        self.canvas.delete(TILE_TAG)
+        self.live.clear()
+        self.flat.clear()
+        self.simplified.clear()
+        self.pending.clear()
+        self.tile_images.clear()
+        self.tile_items.clear()
+
+    def redraw(self, viewport=None):
+        """Draw what self.viewport shows from scratch; strokes new to the view count as settled."""
+        super().clear()
+        self.canvas.delete(TILE_TAG)
+        self.tile_items.clear()
+        self.tile_images.clear()
+        if self.tiles:
+            for stroke in self.scene:
+                if stroke.key not in self.live and len(stroke) >= 2:
+                    self.flat[stroke.key] = stroke.bbox
+        self._update()
+
+    def pan(self, dx, dy):
+        """Drag the board by (dx, dy) screen pixels."""
+        self.viewport.pan(dx, dy)
+        self.canvas.move("all", dx, dy)  # Name tags and whatever else is on the board go along
+        self._update()
+
+    def zoom(self, steps, sx, sy):
+        """Zoom in by `steps` (out if negative) about a canvas position."""
+        factor = self.viewport.zoom_at(steps, sx, sy)
+        if factor != 1:
+            self.canvas.scale("all", sx, sy, factor, factor)
+            self._update(rescale=True)
+
+    def bind_navigation(self):
+        """Zoom with the mouse wheel and pan by dragging with the middle button."""
+        canvas = self.canvas
+        canvas.bind("<MouseWheel>", lambda event: self.zoom(1 if event.delta > 0 else -1, event.x, event.y))
+        canvas.bind("<Button-4>", lambda event: self.zoom(1, event.x, event.y))  # The wheel on X11
+        canvas.bind("<Button-5>", lambda event: self.zoom(-1, event.x, event.y))
+        canvas.bind("<Button-2>", self._grab)
+        canvas.bind("<B2-Motion>", self._drag)
+
+    def _grab(self, event):
+        self.grab = (event.x, event.y)
+
+    def _drag(self, event):
+        x, y = self.grab or (event.x, event.y)
+        self.grab = (event.x, event.y)
+        self.pan(event.x - x, event.y - y)
+
+    def _update(self, rescale=False):
+        """Bring the line items and tiles in line with the viewport after it moved."""
+        self.deadline = time.perf_counter() + SIMPLIFY_BUDGET
+        rect = self.viewport.rect(*self.size())
+        if self.tiles:
+            # Every other stroke is in a tile
+            strokes = sorted((s for s in map(self.scene.get, self.live) if s is not None and self._meets(s, rect)),
+                             key=lambda s: s.order)
+        else:
+            x0, y0, x1, y1 = rect
+            strokes = self.scene.visible(x0 - MARGIN, y0 - MARGIN, x1 + MARGIN, y1 + MARGIN)
+        shown = {stroke.key for stroke in strokes if len(stroke) >= 2}
+        for key in [key for key in self.items if key not in shown]:
+            self.canvas.delete(self.items.pop(key))
+        for stroke in strokes:
+            if stroke.key in shown and (rescale or stroke.key not in self.items):
+                try:
+                    self._draw(stroke, rescale)
+                except tk.TclError:  # e.g. a color name Tk does not know; draw the others
+                    traceback.print_exc()
+        self._show_tiles()
+
+    def flush(self):
+        """Flatten the strokes that have settled, simplify those waiting, then draw the tiles that changed."""
+        self.deadline = time.perf_counter() + SIMPLIFY_BUDGET
+        now = self.clock()
+        if now >= self.next_settle:
+            self.next_settle = now + self.settle / 4
+            self._settle(now)
+        if self.pending:
+            self._simplify_pending()
+        if self.stale:
+            self._show_tiles()
+
+    def _settle(self, now):
+        for key in [key for key, at in self.live.items() if now - at >= self.settle]:
+            del self.live[key]
+            stroke = self.scene.get(key)
+            if stroke is None or len(stroke) < 2:
+                continue
+            if self.tiles:
+                self.flat[key] = stroke.bbox
+                self._invalidate(stroke.bbox)
+                super().remove(stroke)  # Its tile draws it from now on
+            elif key in self.items and self.viewport.level > 0:
+                self._draw(stroke)  # Simplified now that it is finished
+
+    def _simplify_pending(self):
+        for key in list(self.pending):
+            if time.perf_counter() > self.deadline:
+                return
+            self.pending.discard(key)
+            stroke = self.scene.get(key)
+            if stroke is not None and key in self.items:
+                self._draw(stroke)
+
+    def _tile_span(self, zoom):
+        return TILE_SIZE / 2 ** (zoom / ZOOM_STEPS)
+
+    def _invalidate(self, bbox):
+        """Forget the tile images a stroke inside `bbox` was or will be drawn in."""
+        x0, y0, x1, y1 = bbox
+        for key in list(self.tile_images):
+            zoom, tx, ty = key
+            span = self._tile_span(zoom)
+            if (tx * span - MARGIN <= x1 and (tx + 1) * span + MARGIN >= x0
+                    and ty * span - MARGIN <= y1 and (ty + 1) * span + MARGIN >= y0):
+                del self.tile_images[key]
+        self.stale = True
+
+    def _show_tiles(self):
+        """Put the tiles meeting the viewport on the canvas, drawing those not cached.
+
+        Drawing stops for the frame once TILE_BUDGET is spent, nearest the
+        middle first; flush() goes on with the rest.
+        """
+        self.stale = False
+        if not self.tiles:
+            return
+        deadline = time.perf_counter() + TILE_BUDGET
+        zoom = self.viewport.zoom
+        span = self._tile_span(zoom)
+        x0, y0, x1, y1 = self.viewport.rect(*self.size())
+        middle_x, middle_y = (x0 + x1) / 2 / span - 0.5, (y0 + y1) / 2 / span - 0.5
+        wanted = sorted(((zoom, tx, ty)
+                         for tx in range(math.floor(x0 / span), math.floor(x1 / span) + 1)
+                         for ty in range(math.floor(y0 / span), math.floor(y1 / span) + 1)),
+                        key=lambda key: abs(key[1] - middle_x) + abs(key[2] - middle_y))
+        for key in set(self.tile_items).difference(wanted):
+            self.canvas.delete(self.tile_items.pop(key))
+        for key in wanted:
+            item = self.tile_items.get(key)
+            if key in self.tile_images:
+                self.tile_images.move_to_end(key)
+                if item is not None or self.tile_images[key] is None:
+                    continue
+            elif time.perf_counter() > deadline:
+                self.stale = True
+                continue
+            else:
+                self.tile_images[key] = self._draw_tile(*key)
+            image = self.tile_images[key]
+            if image is None:
+                if item is not None:
+                    self.canvas.delete(self.tile_items.pop(key))
+            elif item is None:
+                x, y = self.viewport.to_screen(key[1] * span, key[2] * span)
+                self.tile_items[key] = self.canvas.create_image(x, y, image=image, anchor="nw", tags=TILE_TAG)
+                self.canvas.tag_lower(self.tile_items[key])
+            else:
+                self.canvas.itemconfigure(item, image=image)
+        while len(self.tile_images) > max(MAX_TILES, len(wanted)):
+            self.tile_images.popitem(last=False)
+
+    def _draw_tile(self, zoom, tx, ty):
+        """A tile's image of the settled strokes crossing it, or None if there are none."""
+        scale = 2 ** (zoom / ZOOM_STEPS)
+        span = TILE_SIZE / scale
+        left, top = tx * span, ty * span
+        strokes = [s for s in self.scene.visible(left - MARGIN, top - MARGIN, left + span + MARGIN, top + span + MARGIN)
+                   if s.key in self.flat]
+        if not strokes:
+            return None
+        image = Image.new("RGBA", (TILE_SIZE, TILE_SIZE))
+        draw = ImageDraw.Draw(image)
+        level = max(0, -zoom // ZOOM_STEPS)
+        for stroke in strokes:
+            points = self._points(stroke, level)
+            coords = [0.0] * len(points)
+            coords[0::2] = [(x - left) * scale for x in points[0::2]]
+            coords[1::2] = [(y - top) * scale for y in points[1::2]]
+            try:
+                fill = self._rgb(stroke.color)
+            except tk.TclError:
+                traceback.print_exc()
+                continue
+            draw.line(coords, fill=fill, width=max(1, round(stroke.width * scale)), joint="curve")
+        return self._photo(image)
+
+    def _photo(self, image):
+        return ImageTk.PhotoImage(image)
+
+    def _rgb(self, color):
+        rgb = self.colors.get(color)
+        if rgb is None:
+            try:
+                rgb = ImageColor.getrgb(color)
+            except ValueError:  # A Tk-only name such as brown4
+                rgb = tuple(value >> 8 for value in self.canvas.winfo_rgb(color))
+            self.colors[color] = rgb
+        return rgb